@@ -0,0 +1 @@
+"""OnePlus Updates Tracker benchmarks"""
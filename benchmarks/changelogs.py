@@ -0,0 +1,168 @@
+"""
+Changelogs storage benchmark
+
+Builds a synthetic updates history where, like the real one, each changelog is shared by all
+regions and by the Full and Incremental packages of a build. Then it reports the database size
+and the tracker queries timings with changelogs stored in each row (schema version 5),
+and after the migration that moves them to the changelogs table keyed by content hash.
+Usage: python -m benchmarks.changelogs [--rows 200000] [--repeat 5]
+"""
+import random
+from argparse import ArgumentParser
+from hashlib import md5
+from pathlib import Path
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from benchmarks.db_queries import REGIONS
+from op_tracker.common.database.migrations import migrate
+
+LATEST = "FROM updates JOIN latest_updates ON latest_updates.update_id = updates.id"
+CHANGELOGS = "JOIN changelogs ON changelogs.hash = updates.changelog_hash"
+ORDER = "ORDER BY latest_updates.date DESC, latest_updates.product"
+# each query, and its version after the migration if it's different
+QUERIES = {
+    "get_latest (with changelogs)": (
+        f"SELECT updates.* {LATEST} {ORDER}",
+        f"SELECT updates.*, changelogs.text {LATEST} {CHANGELOGS} {ORDER}",
+    ),
+    "get_devices (no changelogs)": (
+        f"SELECT device, region, version, branch, type, updates.product {LATEST} {ORDER}",
+    ),
+    "get_incremental": (
+        "SELECT * FROM updates WHERE version = 'OnePlus42Oxygen_11.J.07_0070_2106111111' "
+        "AND type = 'Incremental'",
+    ),
+    "full table scan": ("SELECT count(*) FROM updates WHERE size LIKE '%MB'",),
+}
+
+LINES = [
+    "• Updated Android security patch to {month}",
+    "• Improved system stability and fixed known issues",
+    "• Optimized the camera image quality in low light scenes",
+    "• Fixed the issue that the status bar may display abnormally in some scenarios",
+    "• Improved the power consumption performance in standby",
+    "• Optimized the network connection stability of {network}",
+]
+
+
+def changelog(rng: random.Random) -> str:
+    """Generate a changelog of about 2 KB"""
+    lines = ["System"]
+    for _ in range(rng.randrange(20, 40)):
+        lines.append(
+            rng.choice(LINES).format(
+                month=f"2022.{rng.randrange(1, 13):02d}", network="5G"
+            )
+        )
+    return "\n".join(lines)
+
+
+def populate(engine: Engine, rows: int, devices: int = 400):
+    """
+    Insert a synthetic updates history,
+    a build has a Full and an Incremental package per region
+    """
+    rng = random.Random(0)
+    regions = list(REGIONS.items())
+
+    def generate():
+        count = 0
+        while count < rows:
+            device = rng.randrange(devices)
+            build = f"{rng.randrange(100):02d}"
+            timestamp = f"{rng.randrange(16, 26)}{rng.randrange(1, 13):02d}111111"
+            version = f"OnePlus{device}Oxygen_11.J.{build}_0{build}0_{timestamp}"
+            changelog_text = changelog(rng)
+            for region, suffix in regions:
+                for update_type in ("Full", "Incremental"):
+                    extension = "zip" if update_type == "Full" else "patch.zip"
+                    filename = (
+                        f"OnePlus{device}Oxygen_11.J.{build}_OTA_0{build}0_all_"
+                        f"{timestamp}_{count:016x}.{extension}"
+                    )
+                    yield {
+                        "device": f"OnePlus {device}",
+                        "region": region,
+                        "version": version,
+                        "branch": "Stable",
+                        "type": update_type,
+                        "size": "2.5 GB",
+                        "md5": md5(str(count).encode()).hexdigest(),
+                        "filename": filename,
+                        "link": f"https://oxygenos.oneplus.net/{filename}",
+                        "date": f"20{timestamp[:2]}-{timestamp[2:4]}-{rng.randrange(1, 29):02d}",
+                        "changelog": changelog_text,
+                        "product": f"OnePlus{device}{suffix}",
+                        "insert_date": "2022-08-12 00:00:00",
+                    }
+                    count += 1
+
+    statement = text(
+        "INSERT INTO updates (device, region, version, branch, type, size, md5, filename, "
+        "link, date, changelog, product, insert_date) VALUES (:device, :region, :version, "
+        ":branch, :type, :size, :md5, :filename, :link, :date, :changelog, :product, "
+        ":insert_date)"
+    )
+    with engine.begin() as connection:
+        connection.execute(statement, list(generate())[:rows])
+
+
+def size(engine: Engine, file: Path) -> float:
+    """Get the database file size after a VACUUM, in MB"""
+    with engine.connect() as connection:
+        connection.execute(text("VACUUM"))
+    return file.stat().st_size / 1024 / 1024
+
+
+def run_queries(engine: Engine, repeat: int, variant: int) -> dict:
+    """Get the median run time of each query"""
+    results = {}
+    with engine.connect() as connection:
+        for name, queries in QUERIES.items():
+            query = queries[min(variant, len(queries) - 1)]
+            timings = []
+            for _ in range(repeat):
+                start = perf_counter()
+                connection.execute(text(query)).fetchall()
+                timings.append(perf_counter() - start)
+            results[name] = median(timings)
+    return results
+
+
+def main():
+    """Benchmark entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    with TemporaryDirectory() as tmp:
+        file = Path(tmp) / "bench.db"
+        engine = create_engine(f"sqlite:///{file}")
+        migrate(engine, target=5)
+        print(f"Populating {args.rows} rows...")
+        populate(engine, args.rows)
+        size_before = size(engine, file)
+        before = run_queries(engine, args.repeat, 0)
+        start = perf_counter()
+        migrate(engine)
+        migration_time = perf_counter() - start
+        size_after = size(engine, file)
+        after = run_queries(engine, args.repeat, 1)
+        with engine.connect() as connection:
+            changelogs = connection.execute(
+                text("SELECT count(*) FROM changelogs")
+            ).scalar()
+        print(f"Migration: {migration_time:.2f} s, {changelogs} distinct changelogs\n")
+        print(f"database size: {size_before:.1f} MB -> {size_after:.1f} MB")
+        for name, timing in before.items():
+            print(f"{name}: {timing * 1000:.2f} ms -> {after[name] * 1000:.2f} ms")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
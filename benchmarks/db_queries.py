@@ -0,0 +1,118 @@
+"""
+Database queries benchmark
+
+Builds a synthetic updates history, then shows the query plans and timings
+of the tracker queries before and after applying the schema migrations.
+Usage: python -m benchmarks.db_queries [--rows 500000] [--repeat 5]
+"""
+import random
+from argparse import ArgumentParser
+from hashlib import md5
+from pathlib import Path
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from op_tracker.common.database.migrations import MIGRATIONS, migrate
+
+QUERIES = {
+    "get_latest": "SELECT * FROM updates WHERE type = 'Full' ORDER BY date DESC",
+    "get_incremental": "SELECT * FROM updates "
+    "WHERE version = 'OnePlus42Oxygen_11.J.07_0070_2106111111' AND type = 'Incremental'",
+}
+
+REGIONS = {"China": "_CH", "India": "_IND", "Global": "", "EEA": "_EEA"}
+
+
+def populate(engine: Engine, rows: int, devices: int = 400):
+    """Insert a synthetic updates history"""
+    rng = random.Random(0)
+    regions = list(REGIONS.items())
+
+    def generate():
+        for i in range(rows):
+            device = rng.randrange(devices)
+            region, suffix = regions[i % len(regions)]
+            update_type = "Full" if rng.random() < 0.7 else "Incremental"
+            build = f"{rng.randrange(100):02d}"
+            timestamp = f"{rng.randrange(16, 26)}{rng.randrange(1, 13):02d}111111"
+            version = f"OnePlus{device}Oxygen_11.J.{build}_0{build}0_{timestamp}"
+            extension = "zip" if update_type == "Full" else "patch.zip"
+            filename = (
+                f"OnePlus{device}Oxygen_11.J.{build}_OTA_0{build}0_all_{timestamp}"
+                f"_{i:016x}.{extension}"
+            )
+            yield {
+                "device": f"OnePlus {device}",
+                "region": region,
+                "version": version,
+                "branch": "Stable" if rng.random() < 0.8 else "Beta",
+                "type": update_type,
+                "size": "2.5 GB",
+                "md5": md5(str(i).encode()).hexdigest(),
+                "filename": filename,
+                "link": f"https://oxygenos.oneplus.net/{filename}",
+                "date": f"20{timestamp[:2]}-{timestamp[2:4]}-{rng.randrange(1, 29):02d}",
+                "changelog": "System\n• Updated Android security patch"
+                "\n• Improved system stability",
+                "changelog_link": None,
+                "product": f"OnePlus{device}{suffix}",
+                "insert_date": "2022-08-12 00:00:00",
+            }
+
+    statement = text(
+        "INSERT INTO updates (device, region, version, branch, type, size, md5, filename, "
+        "link, date, changelog, changelog_link, product, insert_date) VALUES (:device, "
+        ":region, :version, :branch, :type, :size, :md5, :filename, :link, :date, "
+        ":changelog, :changelog_link, :product, :insert_date)"
+    )
+    with engine.begin() as connection:
+        connection.execute(statement, list(generate()))
+
+
+def run_queries(engine: Engine, repeat: int) -> dict:
+    """Get the plan and median run time of each query"""
+    results = {}
+    with engine.connect() as connection:
+        for name, query in QUERIES.items():
+            plan = [
+                row[-1]
+                for row in connection.execute(text(f"EXPLAIN QUERY PLAN {query}"))
+            ]
+            timings = []
+            for _ in range(repeat):
+                start = perf_counter()
+                connection.execute(text(query)).fetchall()
+                timings.append(perf_counter() - start)
+            results[name] = (plan, median(timings))
+    return results
+
+
+def main():
+    """Benchmark entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    with TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        migrate(engine, target=1)
+        print(f"Populating {args.rows} rows...")
+        populate(engine, args.rows)
+        before = run_queries(engine, args.repeat)
+        migrate(engine)
+        after = run_queries(engine, args.repeat)
+        print(f"Schema version 1 -> {MIGRATIONS[-1].version}\n")
+        for name, (plan, timing) in before.items():
+            new_plan, new_timing = after[name]
+            print(f"{name}: {timing * 1000:.2f} ms -> {new_timing * 1000:.2f} ms")
+            print(f"  before: {'; '.join(plan)}")
+            print(f"  after:  {'; '.join(new_plan)}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
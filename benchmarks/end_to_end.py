@@ -0,0 +1,297 @@
+"""
+End-to-end tracker benchmark
+
+Runs the fake store API (benchmarks.fake_store) in another process and the tracker against it
+in a temporary data directory, then reports the throughput, request latencies, database time,
+data files time and git time of each run. The first run starts with an empty database,
+the next ones only find the new updates the fake store publishes (see --churn).
+Results can be saved as JSON and compared with the results of another commit.
+Usage: python -m benchmarks.end_to_end [--regions 5] [--devices 40] [--runs 3]
+    [--output results.json] [--compare baseline.json]
+"""
+# the tracker is imported after its data directory and configuration are set up
+# pylint: disable=import-outside-toplevel
+import asyncio
+import json
+import os
+import socket
+import subprocess
+from argparse import ArgumentParser
+from dataclasses import asdict
+from functools import wraps
+from multiprocessing import Process
+from pathlib import Path
+from statistics import quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+from typing import Dict, List
+
+import yaml
+
+from benchmarks.fake_store import FakeStoreOptions, serve
+
+REGIONS = [
+    ("cn", "China"),
+    ("in", "India"),
+    ("global", "Global"),
+    ("uk", "EEA"),
+    ("us", "Global"),
+]
+METRICS = {
+    "wall_s": "wall time (s)",
+    "requests": "requests",
+    "throughput": "requests/s",
+    "p50_ms": "request p50 (ms)",
+    "p99_ms": "request p99 (ms)",
+    "db_ms": "database (ms)",
+    "files_ms": "data files (ms)",
+    "git_ms": "git (ms)",
+    "new_updates": "new updates",
+}
+
+
+class Timings:
+    """
+    Durations of instrumented functions, grouped by name
+
+    :meth: `wrap` Instrument a function.
+    :meth: `add` Add a duration.
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float):
+        """Add a duration"""
+        self.samples.setdefault(name, []).append(seconds)
+
+    def total(self, name: str) -> float:
+        """Sum of the durations of a name"""
+        return sum(self.samples.get(name, []))
+
+    def wrap(self, name: str, function):
+        """Get an instrumented version of a function or coroutine function"""
+        if asyncio.iscoroutinefunction(function):
+
+            @wraps(function)
+            async def timed_coroutine(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    self.add(name, perf_counter() - start)
+
+            return timed_coroutine
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, perf_counter() - start)
+
+        return timed
+
+
+def prepare(root: Path, regions: int, port: int) -> Path:
+    """
+    Create the tracker data directory, configuration file and git repositories
+    :return: the data directory
+    """
+    work_dir = root / "work"
+    extra = [(f"r{i}", "Global") for i in range(len(REGIONS), regions)]
+    regions_list = (REGIONS + extra)[:regions]
+    for code, _ in regions_list:
+        (work_dir / "data" / "official" / code).mkdir(parents=True)
+    (work_dir / "data" / "official" / "regions.yml").write_text(
+        yaml.safe_dump(
+            [
+                {"code": code, "name": name, "real_name": name}
+                for code, name in regions_list
+            ]
+        )
+    )
+    remote = root / "remote.git"
+    for command in (
+        ["git", "init", "-q", "--bare", str(remote)],
+        ["git", "init", "-q", str(work_dir)],
+        [
+            "git",
+            "-C",
+            str(work_dir),
+            "-c",
+            "user.name=CI",
+            "-c",
+            "user.email=CI@example.com",
+            "commit",
+            "-q",
+            "--allow-empty",
+            "-m",
+            "init",
+        ],
+    ):
+        subprocess.run(command, check=True)
+    (root / "config.yml").write_text(
+        yaml.safe_dump(
+            {
+                "db": "bench",
+                "source": "official",
+                "store_api_url": f"http://127.0.0.1:{port}",
+                "git_remote": str(remote),
+                "polling": {"enabled": False},
+            }
+        )
+    )
+    os.environ["OP_TRACKER_WORK_DIR"] = str(work_dir)
+    os.environ["OP_TRACKER_CONFIG"] = str(root / "config.yml")
+    return work_dir
+
+
+def instrument(timings: Timings):
+    """Time the tracker API requests, database statements, data files and git operations"""
+    from sqlalchemy import event
+
+    from op_tracker.common.database import get_engine
+    from op_tracker.official.api_client.api_client import APIClient
+    from op_tracker.utils.data_manager import DataManager
+    from op_tracker.utils.git import GitPublisher
+
+    APIClient._post = timings.wrap("request", APIClient._post)
+    DataManager.write_file = staticmethod(timings.wrap("files", DataManager.write_file))
+    DataManager.read_file = staticmethod(timings.wrap("files", DataManager.read_file))
+    GitPublisher.publish = timings.wrap("git", GitPublisher.publish)
+
+    @event.listens_for(get_engine(), "before_cursor_execute")
+    def before_execute(conn, *_):
+        conn.info.setdefault("start", []).append(perf_counter())
+
+    @event.listens_for(get_engine(), "after_cursor_execute")
+    def after_execute(conn, *_):
+        timings.add("db", perf_counter() - conn.info["start"].pop())
+
+
+def count_updates() -> int:
+    """Number of updates in the database"""
+    from sqlalchemy import func
+
+    from op_tracker.common.database import get_session
+    from op_tracker.common.database.models.update import Update
+
+    return get_session().query(func.count(Update.id)).scalar()
+
+
+async def run_tracker():
+    """Run the tracker once"""
+    from op_tracker.common.api_client.transport import close_transport
+    from op_tracker.tracker_official import main
+
+    try:
+        await main()
+    finally:
+        await close_transport()
+
+
+def measure_run(timings: Timings) -> dict:
+    """Run the tracker once and get its metrics"""
+    timings.samples.clear()
+    updates = count_updates()
+    start = perf_counter()
+    asyncio.run(run_tracker())
+    wall = perf_counter() - start
+    requests = timings.samples.get("request", [])
+    percentiles = quantiles(requests, n=100) if len(requests) > 1 else [0.0] * 99
+    return {
+        "wall_s": wall,
+        "requests": len(requests),
+        "throughput": len(requests) / wall,
+        "p50_ms": percentiles[49] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "db_ms": timings.total("db") * 1000,
+        "files_ms": timings.total("files") * 1000,
+        "git_ms": timings.total("git") * 1000,
+        "new_updates": count_updates() - updates,
+    }
+
+
+def wait_for_port(port: int, timeout: float = 10):
+    """Wait until a local port accepts connections"""
+    start = perf_counter()
+    while perf_counter() - start < timeout:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        sleep(0.05)
+    raise TimeoutError(f"Fake store didn't start on port {port}")
+
+
+def free_port() -> int:
+    """Get an unused local port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def compare(results: dict, baseline: dict):
+    """Print the change of each metric from a baseline"""
+    print("\nCompared to the baseline:")
+    for index, (run, base) in enumerate(
+        zip(results["runs"], baseline["runs"]), start=1
+    ):
+        print(f"run {index}:")
+        for key, label in METRICS.items():
+            before, after = base.get(key), run.get(key)
+            if before is None:
+                continue
+            change = f"{(after - before) / before:+.1%}" if before else "n/a"
+            print(f"  {label:<18} {before:>10.2f} -> {after:>10.2f} ({change})")
+
+
+def main():
+    """Benchmark entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--regions", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="save the results to a JSON file")
+    parser.add_argument("--compare", help="compare with results saved by --output")
+    FakeStoreOptions.add_arguments(parser)
+    args = parser.parse_args()
+    options = FakeStoreOptions.from_args(args)
+    port = free_port()
+    server = Process(target=serve, args=(options, "127.0.0.1", port), daemon=True)
+    server.start()
+    timings = Timings()
+    results = {"regions": args.regions, "options": asdict(options), "runs": []}
+    try:
+        with TemporaryDirectory() as tmp:
+            prepare(Path(tmp), args.regions, port)
+            wait_for_port(port)
+            instrument(timings)
+            from op_tracker.utils.changelog import close_changelog_parser
+
+            for index in range(args.runs):
+                run = measure_run(timings)
+                results["runs"].append(run)
+                print(
+                    f"run {index + 1}: "
+                    + ", ".join(
+                        f"{label} {run[key]:.2f}"
+                        if isinstance(run[key], float)
+                        else f"{label} {run[key]}"
+                        for key, label in METRICS.items()
+                    )
+                )
+            close_changelog_parser()
+            from op_tracker.common.database import get_engine
+
+            get_engine().dispose()
+    finally:
+        server.terminate()
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
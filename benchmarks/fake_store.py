@@ -0,0 +1,199 @@
+"""
+Local OnePlus store API stand-in
+
+Serves `find-phone-models` and `find-phone-systems` with the real API response shapes
+and configurable device counts, latency distribution, error rate and payload sizes,
+so the tracker can be measured without hitting the OnePlus servers.
+Point the tracker to it with the `store_api_url` config key.
+Usage: python -m benchmarks.fake_store [--port 8080] [--devices 40] [--latency 0.05] ...
+"""
+import asyncio
+import json
+import random
+from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass, fields
+from hashlib import md5
+
+from aiohttp import web
+
+CHANGELOG_LINE = "<p> • Improved system stability and fixed known issues</p>"
+
+
+@dataclass
+class FakeStoreOptions:
+    """
+    Fake store API behaviour
+    :param devices: int - number of devices of each region
+    :param updates: int - number of updates returned for each device
+    :param changelog_size: int - approximate size of each update changelog HTML, in bytes
+    :param latency: float - median response latency in seconds
+    :param latency_sigma: float - spread of the log-normal latency distribution,
+     0 for a fixed latency
+    :param error_rate: float - ratio of updates requests answered with 503 errors
+    :param churn: float - ratio of updates requests that get a new update
+    :param seed: int - random seed, runs with the same options get the same responses
+    """
+
+    devices: int = 40
+    updates: int = 3
+    changelog_size: int = 2048
+    latency: float = 0.05
+    latency_sigma: float = 0.5
+    error_rate: float = 0.0
+    churn: float = 0.02
+    seed: int = 0
+
+    @classmethod
+    def from_args(cls, args: Namespace):
+        """
+        Factory method to create an instance of :class:`FakeStoreOptions` from parsed arguments
+        :param args: command line arguments
+        :return: :class:`FakeStoreOptions` instance
+        """
+        return cls(**{field.name: getattr(args, field.name) for field in fields(cls)})
+
+    @classmethod
+    def add_arguments(cls, parser: ArgumentParser):
+        """
+        Add the options to a command line parser
+        :param parser: the command line parser
+        """
+        for field in fields(cls):
+            parser.add_argument(
+                f"--{field.name.replace('_', '-')}",
+                type=field.type,
+                default=field.default,
+            )
+
+
+class FakeStore:
+    """
+    Fake store API server application
+
+    :attr: `options`: FakeStoreOptions - server behaviour
+    :meth: `app` Get the aiohttp application.
+    """
+
+    def __init__(self, options: FakeStoreOptions):
+        """
+        FakeStore class constructor
+        :param options: server behaviour
+        """
+        self.options: FakeStoreOptions = options
+        self._requests: dict = {}
+        self._new_updates: dict = {}
+        self._changelog = "<p>System</p>" + CHANGELOG_LINE * max(
+            options.changelog_size // len(CHANGELOG_LINE), 1
+        )
+
+    def app(self) -> web.Application:
+        """Get the aiohttp application"""
+        app = web.Application()
+        app.router.add_post(
+            "/xman/send-in-repair/find-phone-models", self.find_phone_models
+        )
+        app.router.add_post(
+            "/xman/send-in-repair/find-phone-systems", self.find_phone_systems
+        )
+        return app
+
+    def _random(self, key: str) -> random.Random:
+        """
+        Get a random generator for a request, seeded by the request key and its number,
+        so responses don't depend on the order requests arrive in
+        :param key: request key, e.g. the device code
+        :return: random generator
+        """
+        self._requests[key] = self._requests.get(key, 0) + 1
+        return random.Random(f"{self.options.seed}-{key}-{self._requests[key]}")
+
+    async def _delay(self, rng: random.Random):
+        """Wait for a random response latency"""
+        if self.options.latency_sigma:
+            await asyncio.sleep(
+                rng.lognormvariate(0, self.options.latency_sigma) * self.options.latency
+            )
+        else:
+            await asyncio.sleep(self.options.latency)
+
+    @staticmethod
+    def _response(data: list) -> web.Response:
+        return web.json_response({"ret": 1, "errCode": 0, "errMsg": "", "data": data})
+
+    async def find_phone_models(self, request: web.Request) -> web.Response:
+        """Devices list of a region"""
+        store = json.loads(await request.text())["storeCode"]
+        await self._delay(self._random(store))
+        return self._response(
+            [
+                {
+                    "phoneName": f"OnePlus {device}",
+                    "phoneCode": f"PM{store}{device:04d}",
+                    "phoneImage": f"https://oasis.opstatics.com/phones/{device}.png",
+                }
+                for device in range(self.options.devices)
+            ]
+        )
+
+    async def find_phone_systems(self, request: web.Request) -> web.Response:
+        """Updates list of a device"""
+        body = json.loads(await request.text())
+        store, code = body["storeCode"], body["phoneCode"]
+        rng = self._random(code)
+        await self._delay(rng)
+        if rng.random() < self.options.error_rate:
+            return web.Response(status=503, reason="Service Unavailable")
+        if rng.random() < self.options.churn:
+            self._new_updates[code] = self._new_updates.get(code, 0) + 1
+        builds = range(
+            self._new_updates.get(code, 0),
+            self._new_updates.get(code, 0) + self.options.updates,
+        )
+        device = int(code[-4:])
+        return self._response([self._update(store, device, build) for build in builds])
+
+    def _update(self, store: str, device: int, build: int) -> dict:
+        """An update item of find-phone-systems"""
+        timestamp = 2201010000 + build * 10000
+        sign = md5(f"{store}-{device}-{build}".encode()).hexdigest()
+        incremental = build % 3 == 2
+        filename = (
+            f"OnePlus{device}{store.upper()}Oxygen_11.J.{build % 100:02d}_OTA_0{build % 100:02d}0"
+            f"_all_{timestamp}{'_patch' if incremental else ''}_{sign[:16]}.zip"
+        )
+        return {
+            "phoneCode": f"PM{store}{device:04d}",
+            "phoneName": f"OnePlus {device}",
+            "versionNo": f"OnePlus{device}Oxygen_11.J.{build % 100:02d}",
+            "versionType": 1 if build % 5 else 2,
+            "versionLink": f"https://oxygenos.oneplus.net/{filename}",
+            "versionSign": sign.upper(),
+            "versionSize": "4.2 GB" if not incremental else "600 MB",
+            "versionLog": self._changelog,
+            "versionReleaseTime": 1640995200000 + build * 86400000,
+        }
+
+
+def serve(options: FakeStoreOptions, host: str = "127.0.0.1", port: int = 8080):
+    """
+    Run the fake store API server
+    :param options: server behaviour
+    :param host: address to listen on
+    :param port: port to listen on
+    """
+    web.run_app(FakeStore(options).app(), host=host, port=port, print=None)
+
+
+def main():
+    """Fake store entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    FakeStoreOptions.add_arguments(parser)
+    args = parser.parse_args()
+    print(f"Fake store API at http://{args.host}:{args.port}")
+    serve(FakeStoreOptions.from_args(args), args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+JSON codec benchmark
+
+Compares decoding API responses the previous way (decoding the body to str, then json.loads)
+with the JSON codecs reading straight from the bytes, for successful and error responses.
+Recorded response bodies can be given as files, by default responses are generated
+with the fake store API (benchmarks.fake_store) using real-sized changelogs.
+Usage: python -m benchmarks.json_codec [--repeat 20] [responses...]
+"""
+import gc
+import json
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, List
+
+from benchmarks.fake_store import FakeStore, FakeStoreOptions
+from op_tracker.utils.json_codec import CODECS, decode_envelope
+
+
+def generate_responses(devices: int = 200) -> List[bytes]:
+    """Generate device list and device updates responses with the fake store"""
+    store = FakeStore(
+        FakeStoreOptions(devices=devices, updates=5, changelog_size=16384)
+    )
+    models = [
+        {
+            "phoneName": f"OnePlus {device}",
+            "phoneCode": f"PMin{device:04d}",
+            "phoneImage": "",
+        }
+        for device in range(devices)
+    ]
+    responses = [{"ret": 1, "errCode": 0, "errMsg": "", "data": models}]
+    responses += [
+        {
+            "ret": 1,
+            "errCode": 0,
+            "errMsg": "",
+            "data": [store._update("India", device, build) for build in range(5)],
+        }
+        for device in range(devices)
+    ]
+    return [json.dumps(response).encode("utf-8") for response in responses]
+
+
+def decode_text(content: bytes):
+    """The previous decoding: body decoded to str, parsed, then the envelope checked"""
+    response = json.loads(content.decode("utf-8"))
+    if response["ret"] != 1 or response["errCode"] != 0:
+        raise ValueError("API error response")
+    return response["data"]
+
+
+def measure(decode: Callable, responses: List[bytes], repeat: int) -> float:
+    """Get the best time to decode all responses"""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = perf_counter()
+        for content in responses:
+            try:
+                decode(content)
+            except ValueError:
+                pass
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    """Benchmark entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("responses", nargs="*", type=Path)
+    args = parser.parse_args()
+    responses = (
+        [file.read_bytes() for file in args.responses]
+        if args.responses
+        else generate_responses()
+    )
+    errors = [
+        content.replace(b'"errCode": 0', b'"errCode": 500', 1) for content in responses
+    ]
+    size = sum(len(content) for content in responses) / 1024 / 1024
+    decoders = {"text + json.loads": decode_text}
+    decoders.update(
+        {
+            f"{name} codec": (
+                lambda content, codec=codec: decode_envelope(content, codec)
+            )
+            for name, codec in CODECS.items()
+        }
+    )
+    print(f"{len(responses)} responses, {size:.2f} MB\n")
+    print(f"{'decoder':<20}{'ok MB/s':>12}{'errors MB/s':>14}")
+    for name, decode in decoders.items():
+        ok = measure(decode, responses, args.repeat)
+        failed = measure(decode, errors, args.repeat)
+        print(f"{name:<20}{size / ok:>12.1f}{size / failed:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
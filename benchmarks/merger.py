@@ -0,0 +1,109 @@
+"""
+Updates merger benchmark
+
+Builds a synthetic data tree (`{region}/{branch}/{device}.yml`) and compares the previous
+merge (a glob per device and serial pure-Python YAML parsing) with the single-pass merger:
+a cold merge, a merge without changes, and a merge after a few files changed.
+Usage: python -m benchmarks.merger [--devices 3000] [--regions 5] [--changed 0.01] [--skip-old]
+"""
+import random
+from argparse import ArgumentParser
+from glob import glob
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import yaml
+
+from op_tracker.utils.merger import Merger
+
+BRANCHES = ("stable", "beta")
+
+
+def build_tree(root: Path, devices: int, regions: int):
+    """Write a synthetic updates file for each device, region and branch"""
+    for region in range(regions):
+        for branch in BRANCHES:
+            folder = root / f"r{region}" / branch
+            folder.mkdir(parents=True)
+            for device in range(devices):
+                update = {
+                    "device": f"OnePlus {device}",
+                    "region": f"r{region}",
+                    "branch": branch,
+                    "version": f"OnePlus{device}Oxygen_11.J.{device % 100:02d}",
+                    "size": "4.2 GB",
+                    "md5": f"{region:04x}{device:028x}",
+                    "changelog": "System\n• Improved system stability\n" * 10,
+                    "link": f"https://oxygenos.oneplus.net/OnePlus{device}_r{region}.zip",
+                }
+                (folder / f"OnePlus{device}.yml").write_text(
+                    yaml.dump(update, Dumper=getattr(yaml, "CDumper", yaml.Dumper))
+                )
+
+
+def old_merge(root: Path):
+    """The previous merge: a glob of the whole tree per device and serial pure-Python parsing"""
+    devices = sorted({Path(file).stem for file in glob(f"{root}/*/*/*.yml")})
+    output = root / "latest"
+    output.mkdir(exist_ok=True)
+    for device in devices:
+        all_updates = [
+            yaml.load(Path(file).read_text(), Loader=yaml.FullLoader)
+            for file in glob(f"{root}/*/*/{device}.yml")
+        ]
+        (output / f"{device}.yml").write_text(
+            yaml.dump(all_updates, allow_unicode=True)
+        )
+
+
+def timed(function, *args) -> tuple:
+    """Run a function and get its result and duration"""
+    start = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start
+
+
+def main():
+    """Benchmark entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=3000)
+    parser.add_argument("--regions", type=int, default=5)
+    parser.add_argument(
+        "--changed", type=float, default=0.01, help="ratio of changed files"
+    )
+    parser.add_argument(
+        "--skip-old", action="store_true", help="skip the previous merge"
+    )
+    args = parser.parse_args()
+    with TemporaryDirectory() as tmp:
+        root = Path(tmp) / "official"
+        build_tree(root, args.devices, args.regions)
+        files = sorted(root.glob("*/*/*.yml"))
+        print(f"{args.devices} devices, {len(files)} files\n")
+        if not args.skip_old:
+            _, seconds = timed(old_merge, root)
+            print(f"previous merge:          {seconds:8.2f} s")
+            for file in (root / "latest").iterdir():
+                file.unlink()
+        merger = Merger(root)
+        changed, seconds = timed(merger.merge_updates)
+        print(
+            f"cold merge:              {seconds:8.2f} s ({len(changed)} outputs written)"
+        )
+        changed, seconds = timed(merger.merge_updates)
+        print(
+            f"merge without changes:   {seconds:8.2f} s ({len(changed)} outputs written)"
+        )
+        for file in random.Random(0).sample(
+            files, max(int(len(files) * args.changed), 1)
+        ):
+            file.write_text(file.read_text().replace("4.2 GB", "4.3 GB"))
+        changed, seconds = timed(merger.merge_updates)
+        print(
+            f"merge after changes:     {seconds:8.2f} s ({len(changed)} outputs written)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Serializers benchmark
+
+Compares load and dump throughput of the available serializers on the tracker data files.
+Usage: python -m benchmarks.serializers [--repeat 5] [files...]
+"""
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+import yaml
+
+from op_tracker.utils.serializers import SERIALIZERS, Serializer, YAMLSerializer
+
+DATA_DIR = Path(__file__).parent.parent / "op_tracker" / "data"
+
+
+def get_backends() -> dict:
+    """Available serializers, including the pure-Python YAML one for reference"""
+    backends = {"yaml (python)": YAMLSerializer(yaml.FullLoader, yaml.Dumper)}
+    if yaml.__with_libyaml__:
+        backends["yaml (libyaml)"] = YAMLSerializer(yaml.CFullLoader, yaml.CDumper)
+    for name in ("json", "msgpack"):
+        if name in SERIALIZERS:
+            backends[name] = SERIALIZERS[name]
+    return backends
+
+
+def measure(serializer: Serializer, data, repeat: int) -> tuple:
+    """Get the best load and dump time of data with a serializer"""
+    content = serializer.dumps(data)
+    dump, load = float("inf"), float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        serializer.dumps(data)
+        dump = min(dump, perf_counter() - start)
+        start = perf_counter()
+        serializer.loads(content)
+        load = min(load, perf_counter() - start)
+    return len(content), load, dump
+
+
+def main():
+    """Benchmark entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("files", nargs="*", type=Path)
+    args = parser.parse_args()
+    files = args.files or sorted(DATA_DIR.glob("**/*.yml"))
+    reference = YAMLSerializer()
+    data = [reference.loads(file.read_bytes()) for file in files]
+    print(f"{len(files)} files\n")
+    print(f"{'backend':<16}{'size':>12}{'load MB/s':>12}{'dump MB/s':>12}")
+    for name, serializer in get_backends().items():
+        size = load = dump = 0
+        for item in data:
+            item_size, item_load, item_dump = measure(serializer, item, args.repeat)
+            size += item_size
+            load += item_load
+            dump += item_dump
+        megabytes = size / 1024 / 1024
+        print(f"{name:<16}{size:>12}{megabytes / load:>12.2f}{megabytes / dump:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
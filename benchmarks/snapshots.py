@@ -0,0 +1,87 @@
+"""
+Snapshot store benchmark
+
+Builds a synthetic data tree and compares the previous backups (a `.bak` copy of every file,
+then re-parsing the copies to diff them) with the snapshot store: the first snapshot, a
+snapshot without changes, and diffing every file against its last snapshot.
+Usage: python -m benchmarks.snapshots [--devices 3000] [--regions 5]
+"""
+from argparse import ArgumentParser
+from pathlib import Path
+from shutil import copyfile
+from tempfile import TemporaryDirectory
+
+from benchmarks.merger import build_tree, timed
+from op_tracker.utils.data_manager import DataManager
+from op_tracker.utils.snapshots import SnapshotStore
+
+
+def disk_usage(root: Path) -> float:
+    """Get the size of files in a directory that aren't hard links of other files, in MB"""
+    seen = set()
+    size = 0
+    for file in root.rglob("*"):
+        stat = file.stat()
+        if file.is_file() and (stat.st_dev, stat.st_ino) not in seen:
+            seen.add((stat.st_dev, stat.st_ino))
+            size += stat.st_size
+    return size / 1024 / 1024
+
+
+def old_backup(files: list):
+    """The previous backup: a copy of every file"""
+    for file in files:
+        copyfile(file, f"{file}.bak")
+
+
+def old_diff(files: list) -> int:
+    """The previous diff: re-read and re-parse both the file and its copy"""
+    changed = 0
+    for file in files:
+        current = DataManager.read_file(file)
+        old = DataManager.read_file(f"{file}.bak")
+        changed += current != old
+    return changed
+
+
+def new_diff(store: SnapshotStore, files: list) -> int:
+    """Diff every file with its last snapshot by content hash"""
+    return sum(store.changed(file) for file in files)
+
+
+def main():
+    """Benchmark entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=3000)
+    parser.add_argument("--regions", type=int, default=5)
+    args = parser.parse_args()
+    with TemporaryDirectory() as tmp:
+        root = Path(tmp) / "official"
+        build_tree(root, args.devices, args.regions)
+        files = sorted(str(file) for file in root.glob("*/*/*.yml"))
+        print(f"{len(files)} files, {disk_usage(root):.1f} MB\n")
+        _, seconds = timed(old_backup, files)
+        print(
+            f"copy backups:             {seconds:8.2f} s (+{disk_usage(root) / 2:.1f} MB)"
+        )
+        _, seconds = timed(old_diff, files)
+        print(f"diff with copies:         {seconds:8.2f} s")
+        for file in files:
+            Path(f"{file}.bak").unlink()
+        store = SnapshotStore(Path(tmp) / "snapshots", base=tmp)
+        _, seconds = timed(store.snapshot_all, files)
+        index = (store.root / store.INDEX).stat().st_size / 1024 / 1024
+        # objects hard-linked to the data files don't take more space
+        objects = disk_usage(Path(tmp)) - disk_usage(root) - index
+        print(
+            f"first snapshot:           {seconds:8.2f} s "
+            f"(+{objects:.1f} MB objects, {index:.1f} MB index)"
+        )
+        _, seconds = timed(store.snapshot_all, files)
+        print(f"snapshot without changes: {seconds:8.2f} s")
+        _, seconds = timed(new_diff, store, files)
+        print(f"diff with snapshots:      {seconds:8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
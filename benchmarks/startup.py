@@ -0,0 +1,61 @@
+"""
+Startup time benchmark
+
+Imports the tracker in fresh interpreters with `python -X importtime`
+and reports the cold-start time and the slowest imported modules.
+Usage: python -m benchmarks.startup [--module op_tracker.tracker_official] [--repeat 5] [--top 15]
+"""
+import subprocess
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+ROOT = Path(__file__).parent.parent
+
+
+def import_times(module: str) -> dict:
+    """Get the cumulative import time in microseconds of each module imported by a module"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def wall_time(module: str) -> float:
+    """Get the time to start an interpreter and import a module"""
+    start = perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, check=True)
+    return perf_counter() - start
+
+
+def main():
+    """Benchmark entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="op_tracker.tracker_official")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    wall_times = [wall_time(args.module) for _ in range(args.repeat)]
+    times = import_times(args.module)
+    print(f"{args.module}: {median(wall_times) * 1000:.1f} ms cold start (median)")
+    print(f"import time: {times.get(args.module, 0) / 1000:.1f} ms\n")
+    print(f"{'cumulative ms':>14}  module")
+    top = sorted(times.items(), key=lambda item: item[1], reverse=True)[: args.top]
+    for name, cumulative in top:
+        print(f"{cumulative / 1000:>14.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
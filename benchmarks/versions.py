@@ -0,0 +1,111 @@
+"""
+Version resolution benchmark
+
+Resolves the version of every stored update file name with the previous implementation
+(patterns compiled per call and a `LIKE` query per irregular file name)
+and with the cached VersionResolver, and checks that both give the same versions.
+The corpus is read from a tracker database, or from data/latest.yml if none is given.
+Usage: python -m benchmarks.versions [--db op_tracker/tracker.db] [--repeat 3]
+"""
+import re
+import sqlite3
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+from op_tracker.utils.serializers import get_serializer
+from op_tracker.utils.versions import VersionResolver, parse_version
+
+LATEST_FILE = Path(__file__).parent.parent / "op_tracker" / "data" / "latest.yml"
+
+REFERENCES_QUERY = """SELECT u.filename, u.branch, u.version FROM updates u JOIN (
+    SELECT MIN(id) AS id FROM updates
+    GROUP BY lower(substr(filename, 1, instr(filename, '_') - 1)), branch
+) first ON first.id = u.id ORDER BY u.id"""
+
+
+def load_corpus(db_file) -> sqlite3.Connection:
+    """Open the database, or build an in-memory one from latest.yml"""
+    if db_file:
+        return sqlite3.connect(db_file)
+    connection = sqlite3.connect(":memory:")
+    connection.execute(
+        "CREATE TABLE updates (id INTEGER PRIMARY KEY, filename, branch, version)"
+    )
+    latest = get_serializer(LATEST_FILE).loads(LATEST_FILE.read_bytes())
+    connection.executemany(
+        "INSERT INTO updates (filename, branch, version) VALUES (?, ?, ?)",
+        [
+            (item["link"].split("/")[-1], item["branch"], item["version"])
+            for item in latest
+        ],
+    )
+    return connection
+
+
+def previous_version_from_file(
+    connection: sqlite3.Connection, filename: str, branch: str
+):
+    """The previous get_version_from_file implementation"""
+    version: str = ""
+    pattern = re.search(r"_\d{2}\.\w\.\d{2}", filename)
+    pattern2 = re.search(r"_\d{2}_OTA_\d{3}_all", filename)
+    if pattern:
+        version = re.sub("_OTA", "", filename)
+        version = re.sub("_all", "", version)
+        version = re.sub(r"_[a-z0-9]{16}\.zip", "", version)
+    elif pattern2:
+        another_version = connection.execute(
+            "SELECT version FROM updates WHERE filename LIKE ? || '%' AND branch = ? LIMIT 1",
+            (filename.split("_")[0], branch),
+        ).fetchone()
+        if another_version:
+            split_version = re.search(r"_OTA_(\d{3})_all", filename).group(1)
+            version = re.sub(r"\.\d{2}", f".{split_version[1:]}", another_version[0])
+            version = re.sub(r"_\d{3}_", f"_{split_version}_", version)
+            version = re.sub(r"_\d{10}_", filename.split("_")[-2], version)
+    return version
+
+
+def main():
+    """Benchmark entry point"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--db", type=Path)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    connection = load_corpus(args.db)
+    corpus = connection.execute("SELECT filename, branch FROM updates").fetchall()
+    print(f"{len(corpus)} file names\n")
+
+    previous_time = float("inf")
+    for _ in range(args.repeat):
+        start = perf_counter()
+        previous = [previous_version_from_file(connection, *row) for row in corpus]
+        previous_time = min(previous_time, perf_counter() - start)
+
+    resolver_time = float("inf")
+    for _ in range(args.repeat):
+        start = perf_counter()
+        resolver = VersionResolver(
+            lambda: connection.execute(REFERENCES_QUERY).fetchall()
+        )
+        resolved = [resolver.resolve(*row) for row in corpus]
+        resolver_time = min(resolver_time, perf_counter() - start)
+
+    mismatches = sum(1 for old, new in zip(previous, resolved) if old != new)
+    print(f"previous: {previous_time * 1000:.2f} ms")
+    print(f"resolver: {resolver_time * 1000:.2f} ms (including references preload)")
+    print(f"speedup: {previous_time / resolver_time:.1f}x, mismatches: {mismatches}")
+
+    versions = [row[0] for row in connection.execute("SELECT version FROM updates")]
+    start = perf_counter()
+    keys = [parse_version(version) for version in versions]
+    parsed = sum(1 for key in keys if key)
+    print(
+        f"parsed {parsed}/{len(versions)} stored versions into keys "
+        f"in {(perf_counter() - start) * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,80 @@
 """OnePlus Updates Tracker initialization"""
 import logging
+import os
+from collections.abc import Mapping
 from logging import Formatter
 from logging.handlers import TimedRotatingFileHandler
 from pathlib import Path
 from sys import stderr
+from typing import Optional
+
+from op_tracker.utils.serializers import get_serializer
 
 # from sys import stdout
-import yaml
 
-WORK_DIR = Path(__file__).parent
+# the data directory and the configuration file can be moved with environment variables
+WORK_DIR = Path(os.environ.get("OP_TRACKER_WORK_DIR") or Path(__file__).parent)
 CONF_DIR = Path(__file__).parent.parent
 
-# read script configuration file
-with open(CONF_DIR / "config.yml", "r") as f:
-    CONFIG = yaml.load(f, Loader=yaml.FullLoader)
 
-# set logging configuration
+class Config(Mapping):
+    """
+    Script configuration, the configuration file is read on first access
+    :attr: `file`: Path - configuration file path
+    """
+
+    def __init__(self, file: Path):
+        """
+        Config class constructor
+        :param file: configuration file path
+        """
+        self.file: Path = file
+        self._data: Optional[dict] = None
+
+    @property
+    def data(self) -> dict:
+        """The configuration dictionary"""
+        if self._data is None:
+            self._data = get_serializer(self.file).loads(self.file.read_bytes()) or {}
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+# script configuration file
+CONFIG = Config(Path(os.environ.get("OP_TRACKER_CONFIG") or CONF_DIR / "config.yml"))
+
+# logging configuration
 LOG_FILE = CONF_DIR / "last_run.log"
 LOG_FORMAT: str = (
     "%(asctime)s [%(levelname)s] %(name)s [%(module)s.%(funcName)s:%(lineno)d]: "
     "%(message)s"
 )
 FORMATTER: Formatter = logging.Formatter(LOG_FORMAT)
-handler = TimedRotatingFileHandler(LOG_FILE, when="d", interval=1, backupCount=2)
-logging.basicConfig(filename=LOG_FILE, filemode="a", format=LOG_FORMAT)
-# OUT = logging.StreamHandler(stdout)
-ERR = logging.StreamHandler(stderr)
-# OUT.setFormatter(FORMATTER)
-ERR.setFormatter(FORMATTER)
-# OUT.setLevel(logging.DEBUG)
-ERR.setLevel(logging.WARNING)
 LOGGER = logging.getLogger()
-# LOGGER.addHandler(OUT)
-LOGGER.addHandler(ERR)
-LOGGER.addHandler(handler)
-LOGGER.setLevel(logging.INFO)
+
+
+def setup_logging():
+    """Set logging handlers up, it's called once by the entry point"""
+    if getattr(setup_logging, "done", False):
+        return
+    handler = TimedRotatingFileHandler(LOG_FILE, when="d", interval=1, backupCount=2)
+    logging.basicConfig(filename=LOG_FILE, filemode="a", format=LOG_FORMAT)
+    # OUT = logging.StreamHandler(stdout)
+    err = logging.StreamHandler(stderr)
+    # OUT.setFormatter(FORMATTER)
+    err.setFormatter(FORMATTER)
+    # OUT.setLevel(logging.DEBUG)
+    err.setLevel(logging.WARNING)
+    # LOGGER.addHandler(OUT)
+    LOGGER.addHandler(err)
+    LOGGER.addHandler(handler)
+    LOGGER.setLevel(logging.INFO)
+    setup_logging.done = True
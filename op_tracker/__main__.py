@@ -1,21 +1,37 @@
 """OnePlus Updates Tracker entry point"""
+import sys
 from importlib import import_module
 
-from op_tracker import CONFIG
+from op_tracker import CONFIG, setup_logging
 from op_tracker.tracker_official import run as official
 
+setup_logging()
 source = CONFIG.get("source")
 
-if source == "tracker_updater":
-    from op_tracker.tracker_updater import run as extra_run
-else:
-    try:
-        script = import_module(f"{__package__}.{source}")
-        extra_run = script.run()
-    except ImportError:
-        raise Exception("Incorrect Scraper has been specified! exiting...")
 
-if __name__ == "__main__":
+def one_shot():
+    """Run the extra source, if any, and the official tracker once"""
+    if source == "tracker_updater":
+        from op_tracker.tracker_updater import run as extra_run
+    else:
+        try:
+            script = import_module(f"{__package__}.{source}")
+            extra_run = script.run()
+        except ImportError:
+            raise Exception("Incorrect Scraper has been specified! exiting...")
     if extra_run:
         extra_run()
     official()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["daemon"]:
+        from op_tracker.daemon import run as daemon
+
+        daemon()
+    elif sys.argv[1:2] == ["reprocess"]:
+        from op_tracker.reprocess import run as reprocess
+
+        reprocess(sys.argv[2:])
+    else:
+        one_shot()
@@ -4,6 +4,8 @@ OnePlus Websites common API Client class implementation
 
 from aiohttp import ClientSession
 
+from op_tracker.common.api_client.transport import get_transport
+
 
 class CommonClient:
     """
@@ -13,7 +15,7 @@ class CommonClient:
     It's responsible for interacting with OnePlus websites API in order to:
     - Get devices list.
     - Get device's updates information
-    :attr: `session`: ClientSession - aiohttp client session object
+    :attr: `session`: ClientSession - aiohttp client session object (shared by all clients)
     :attr: `base_url`: str - Website base URL
     :attr: `devices`: list - list of devices available on the website
     """
@@ -23,13 +25,13 @@ class CommonClient:
         Website Class constructor
         :param region: OnePlus website region
         """
-        self.session: ClientSession = ClientSession()
+        self.session: ClientSession = get_transport().session
         self.base_url: str = ""
         self.devices: list = []
 
     async def close(self):
         """
-        Closes the connection of aiohttp client
+        Releases the client. The shared connection pool stays open for other clients,
+        it's closed once at shutdown by :func:`close_transport`.
         :return:
         """
-        await self.session.close()
@@ -0,0 +1,262 @@
+"""
+Tail-latency controls for API requests: deadlines, retries with jitter and hedging
+"""
+import asyncio
+import random
+from bisect import insort
+from collections import deque
+from dataclasses import dataclass, fields
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from aiohttp import ClientError
+
+T = TypeVar("T")
+
+
+class RequestError(Exception):
+    """An API request has failed and shouldn't be retried"""
+
+
+class TransientError(RequestError):
+    """An API request has failed but may succeed if retried (e.g. 5xx responses)"""
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The run deadline has passed before the request could complete"""
+
+
+# errors a failed request may raise, the caller should handle them
+REQUEST_ERRORS = (RequestError, ClientError, asyncio.TimeoutError)
+# errors that are worth retrying
+RETRYABLE_ERRORS = (TransientError, ClientError, asyncio.TimeoutError)
+
+
+@dataclass
+class RetryPolicy:
+    """
+    API requests resilience policy
+    :param timeout: float - seconds each request attempt may take
+    :param attempts: int - maximum number of attempts of a request
+    :param backoff: float - base delay of the exponential backoff between attempts, in seconds
+    :param max_backoff: float - maximum delay between attempts, in seconds
+    :param hedge: bool - send a second request if the first is slower than usual
+    :param hedge_percentile: float - latency percentile after which a request is hedged
+    :param hedge_min_samples: int - number of latency samples needed before hedging
+    """
+
+    timeout: float = 15
+    attempts: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 8
+    hedge: bool = False
+    hedge_percentile: float = 0.95
+    hedge_min_samples: int = 20
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """
+        Factory method to create an instance of :class:`RetryPolicy`
+        from the `api_requests` config section
+        :param config: dict - requests configuration
+        :return: :class:`RetryPolicy` instance
+        """
+        names = {field.name for field in fields(cls)}
+        return cls(
+            **{
+                key: value
+                for key, value in config.items()
+                if key in names and value is not None
+            }
+        )
+
+    def delay(self, attempt: int) -> float:
+        """
+        Backoff delay before retrying, randomized over the whole range (full jitter)
+        so failed requests of many devices don't retry at the same moment
+        :param attempt: number of the failed attempt, starting at 0
+        :return: delay in seconds
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent successful request latencies
+
+    :meth: `record` Add a latency sample.
+    :meth: `percentile` Get a latency percentile of the window.
+    """
+
+    def __init__(self, size: int = 200):
+        """
+        LatencyTracker class constructor
+        :param size: number of recent samples to keep
+        """
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._sorted: List[float] = []
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        """
+        Add a latency sample
+        :param seconds: request latency
+        """
+        if len(self._samples) == self._samples.maxlen:
+            self._sorted.remove(self._samples[0])
+        self._samples.append(seconds)
+        insort(self._sorted, seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Get a latency percentile
+        :param percentile: percentile between 0 and 1
+        :return: latency in seconds, None if there are no samples
+        """
+        if not self._sorted:
+            return None
+        return self._sorted[
+            min(int(len(self._sorted) * percentile), len(self._sorted) - 1)
+        ]
+
+
+@dataclass
+class CallStats:
+    """
+    Requests resilience counters
+    :param calls: int - number of requests made
+    :param retries: int - number of retried attempts
+    :param hedges: int - number of hedged (duplicate) requests sent
+    :param failures: int - number of requests that failed after all attempts
+    """
+
+    calls: int = 0
+    retries: int = 0
+    hedges: int = 0
+    failures: int = 0
+
+
+@dataclass
+class DeviceOutcome:
+    """
+    Result of a device updates request
+    :param status: str - ok, failed or timeout (the run deadline has passed)
+    :param elapsed: float - seconds spent on the request, including retries
+    :param error: str - the last error of a failed request
+    """
+
+    status: str
+    elapsed: float
+    error: Optional[str] = None
+
+
+class ResilientCaller:
+    """
+    Runs requests with a per-attempt timeout, an overall deadline,
+    bounded retries with exponential backoff and jitter, and optional hedging:
+    when an attempt is slower than the recent latency percentile,
+    a second identical request is sent and the first response wins.
+
+    :attr: `policy`: RetryPolicy - the resilience policy
+    :attr: `stats`: CallStats - requests counters
+    :meth: `call` Run a request.
+    """
+
+    def __init__(self, policy: RetryPolicy):
+        """
+        ResilientCaller class constructor
+        :param policy: the resilience policy
+        """
+        self.policy: RetryPolicy = policy
+        self.stats: CallStats = CallStats()
+        self._latency: Dict[str, LatencyTracker] = {}
+
+    async def call(
+        self,
+        request: Callable[[], Awaitable[T]],
+        key: str = "",
+        deadline: Optional[float] = None,
+    ) -> T:
+        """
+        Run a request until it succeeds, attempts are exhausted, or the deadline passes
+        :param request: a function that starts a new request attempt
+        :param key: requests of the same kind, whose latencies are tracked together
+        :param deadline: event loop time by which the request must be done, None for no deadline
+        :return: the request result
+        :raises DeadlineExceeded: if the deadline passes
+        :raises: the last error if all attempts fail
+        """
+        loop = asyncio.get_running_loop()
+        tracker = self._latency.setdefault(key, LatencyTracker())
+        self.stats.calls += 1
+        for attempt in range(self.policy.attempts):
+            timeout = self.policy.timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline - loop.time())
+                if timeout <= 0:
+                    self.stats.failures += 1
+                    raise DeadlineExceeded()
+            try:
+                return await self._attempt(request, timeout, tracker)
+            except RETRYABLE_ERRORS:
+                if attempt + 1 == self.policy.attempts:
+                    self.stats.failures += 1
+                    raise
+            except Exception:
+                self.stats.failures += 1
+                raise
+            delay = self.policy.delay(attempt)
+            if deadline is not None and loop.time() + delay >= deadline:
+                self.stats.failures += 1
+                raise DeadlineExceeded()
+            self.stats.retries += 1
+            await asyncio.sleep(delay)
+        raise DeadlineExceeded()  # only reached with no attempts allowed
+
+    async def _attempt(
+        self,
+        request: Callable[[], Awaitable[T]],
+        timeout: float,
+        tracker: LatencyTracker,
+    ) -> T:
+        """
+        Run one request attempt, hedged if it takes longer than usual
+        :param request: a function that starts a new request
+        :param timeout: seconds the attempt may take
+        :param tracker: latencies of this kind of requests
+        :return: the first successful response
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        hedge_delay = None
+        if self.policy.hedge and len(tracker) >= self.policy.hedge_min_samples:
+            hedge_delay = tracker.percentile(self.policy.hedge_percentile)
+        tasks = [asyncio.ensure_future(request())]
+        try:
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    self.stats.hedges += 1
+                    tasks.append(asyncio.ensure_future(request()))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, _ = await asyncio.wait(
+                    tasks,
+                    timeout=timeout - (loop.time() - start),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        tracker.record(loop.time() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            # the losing attempts are awaited, so their connections are released before returning
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,155 @@
+"""
+Process-wide HTTP transport shared by all API clients
+"""
+import logging
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, TraceConfig
+
+from op_tracker import CONFIG
+from op_tracker.utils.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TransportStats:
+    """
+    Connection usage counters of the shared transport
+    :param requests: int - number of requests started
+    :param connections_created: int - number of new connections (TCP + TLS handshakes)
+    :param connections_reused: int - number of requests served by a kept-alive connection
+    :param dns_cache_hits: int - number of host resolutions answered from the DNS cache
+    :param dns_cache_misses: int - number of host resolutions that needed a DNS lookup
+    """
+
+    requests: int = 0
+    connections_created: int = 0
+    connections_reused: int = 0
+    dns_cache_hits: int = 0
+    dns_cache_misses: int = 0
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Ratio of requests that didn't need a new connection"""
+        total = self.connections_created + self.connections_reused
+        return self.connections_reused / total if total else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.requests} requests, {self.connections_created} new connections, "
+            f"{self.connections_reused} reused ({self.reuse_ratio:.0%}), "
+            f"DNS cache {self.dns_cache_hits} hits / {self.dns_cache_misses} misses"
+        )
+
+
+class Transport:
+    """
+    Shared aiohttp session with a pooled, keep-alive connector
+
+    :attr: `stats`: TransportStats - connection reuse statistics
+    :meth: `session` - the shared aiohttp client session, created on first use.
+    :meth: `close` - closes the session and its connection pool.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        keepalive_timeout: float = 30,
+        dns_cache_ttl: int = 300,
+        timeout: float = 60,
+        connect_timeout: float = 10,
+    ):
+        """
+        Transport class constructor
+        :param limit: maximum number of open connections
+        :param limit_per_host: maximum number of open connections to the same host
+        :param keepalive_timeout: seconds to keep idle connections open
+        :param dns_cache_ttl: seconds to cache resolved host addresses
+        :param timeout: total timeout of a request in seconds
+        :param connect_timeout: timeout for acquiring a connection in seconds
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = ClientTimeout(total=timeout, connect=connect_timeout)
+        self.stats: TransportStats = TransportStats()
+        self._session: Optional[ClientSession] = None
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """
+        Factory method to create an instance of :class:`Transport` from the `http` config section
+        :param config: dict - http configuration
+        :return: :class:`Transport` instance
+        """
+        return cls(**{key: value for key, value in config.items() if value is not None})
+
+    @property
+    def session(self) -> ClientSession:
+        """The shared client session, created on first use"""
+        if self._session is None or self._session.closed:
+            connector = TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True,
+            )
+            self._session = ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                trace_configs=[self._trace_config()],
+            )
+        return self._session
+
+    def _trace_config(self) -> TraceConfig:
+        """Build a trace config that records connection statistics"""
+        trace_config = TraceConfig()
+
+        def count(field: str):
+            async def handler(_session, _context, _params):
+                setattr(self.stats, field, getattr(self.stats, field) + 1)
+
+            return handler
+
+        trace_config.on_request_start.append(count("requests"))
+        trace_config.on_connection_create_end.append(count("connections_created"))
+        trace_config.on_connection_reuseconn.append(count("connections_reused"))
+        trace_config.on_dns_cache_hit.append(count("dns_cache_hits"))
+        trace_config.on_dns_cache_miss.append(count("dns_cache_misses"))
+        return trace_config
+
+    async def close(self):
+        """
+        Closes the shared session and its connection pool
+        :return:
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        logger.info(f"HTTP transport: {self.stats}")
+        for name, value in asdict(self.stats).items():
+            METRICS.count(f"http_{name}", value)
+        logger.debug(asdict(self.stats))
+
+
+_transport: Optional[Transport] = None
+
+
+def get_transport() -> Transport:
+    """Get the process-wide transport, creating it from the config on first use"""
+    global _transport  # pylint: disable=global-statement
+    if _transport is None:
+        _transport = Transport.from_config(CONFIG.get("http") or {})
+    return _transport
+
+
+async def close_transport():
+    """Close the process-wide transport, should be called once at shutdown"""
+    global _transport  # pylint: disable=global-statement
+    if _transport is not None:
+        await _transport.close()
+        _transport = None
@@ -1,51 +1,86 @@
-"""OnePlus Updates Tracker Database initialization"""
+"""
+OnePlus Updates Tracker Database initialization
+
+The engine and sessions are created, and the schema is migrated, on first use.
+Each thread gets its own session, so the async database layer can read from worker threads.
+"""
 import logging
+from typing import Optional
 
-from sqlalchemy import (Column, Integer, MetaData, String, Table,
-                        create_engine, inspect)
-from sqlalchemy.engine import Connection, Engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from op_tracker import CONFIG, WORK_DIR
+from op_tracker.common.database.migrations import migrate
 
 logger = logging.getLogger(__name__)
-engine: Engine = create_engine(
-    f"sqlite:///{WORK_DIR}/{CONFIG.get('db')}.db",
-    connect_args={"check_same_thread": False},
-)
-logger.info(f"Connected to {engine.name} database at {engine.url}")
-connection: Connection = engine.connect()
-
-# Create a MetaData instance
-metadata: MetaData = MetaData()
-# reflect db schema to MetaData
-metadata.reflect(bind=engine)
-# check if the table exists
-ins = inspect(engine)
-if "updates" not in ins.get_table_names():
-    logger.info("Updates table not found, creating one")
-    posts = Table(
-        "updates",
-        metadata,
-        Column("id", Integer(), primary_key=True, autoincrement=True),
-        Column("device", String(), nullable=False),
-        Column("region", String(), nullable=False),
-        Column("version", String(), nullable=False),
-        Column("branch", String(), nullable=False),
-        Column("type", String(), nullable=False),
-        Column("size", String(), nullable=False),
-        Column("md5", String(32), nullable=False, unique=True),
-        Column("filename", String(), nullable=False, unique=True),
-        Column("link", String(), nullable=False, unique=True),
-        Column("date", String(), nullable=False),
-        Column("changelog", String(), nullable=False),
-        Column("changelog_link", String()),
-        Column("product", String()),
-        Column("insert_date", String()),
-    )
-    metadata.create_all(engine)
-    Session: sessionmaker = sessionmaker(bind=engine)
-    session: Session = Session()
-else:
-    Session: sessionmaker = sessionmaker(bind=engine)
-    session = Session()
+
+# SQLite connection settings, can be overridden with `db_pragmas` in the config
+PRAGMAS: dict = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,
+}
+
+_engine: Optional[Engine] = None
+_sessions: Optional[scoped_session] = None
+
+
+def set_pragmas(dbapi_connection, _connection_record):
+    """Apply SQLite pragmas on every new connection"""
+    cursor = dbapi_connection.cursor()
+    for pragma, value in {**PRAGMAS, **(CONFIG.get("db_pragmas") or {})}.items():
+        cursor.execute(f"PRAGMA {pragma} = {value}")
+    cursor.close()
+
+
+def get_engine() -> Engine:
+    """
+    Get the database engine, connecting and migrating the database on first use
+    :return: Engine object
+    """
+    global _engine  # pylint: disable=global-statement
+    if _engine is None:
+        engine = create_engine(
+            f"sqlite:///{WORK_DIR}/{CONFIG.get('db')}.db",
+            connect_args={"check_same_thread": False},
+            # connections are kept open for the reader threads, the writer thread and the main one
+            poolclass=QueuePool,
+            pool_size=CONFIG.get("db_readers", 4) + 2,
+        )
+        event.listen(engine, "connect", set_pragmas)
+        logger.info(f"Connected to {engine.name} database at {engine.url}")
+        schema_version: int = migrate(engine)
+        logger.info(f"Database schema version: {schema_version}")
+        _engine = engine
+    return _engine
+
+
+def get_session_registry() -> scoped_session:
+    """
+    Get the registry of thread-local database sessions, created on first use
+    :return: scoped_session object
+    """
+    global _sessions  # pylint: disable=global-statement
+    if _sessions is None:
+        _sessions = scoped_session(sessionmaker(bind=get_engine()))
+    return _sessions
+
+
+def get_session() -> Session:
+    """
+    Get the database session of the current thread, created on first use
+    :return: Session object
+    """
+    return get_session_registry()()
+
+
+def __getattr__(name: str):
+    """Lazily provide `engine` and `session` module attributes"""
+    if name == "engine":
+        return get_engine()
+    if name == "session":
+        return get_session()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,182 @@
+"""
+Async database access layer
+
+SQLAlchemy calls block, so they're run off the event loop: writes go to a single writer
+thread in the order they're submitted, and reads run in a pool of reader threads,
+each one with its own session (SQLite WAL lets readers run while the writer commits).
+The md5 index and version references are loaded once in the readers, after that checking
+a batch of updates is done in memory and only new updates reach the writer thread.
+Queued updates are kept in the md5 index, so they aren't queued twice, the version references
+and the new updates count only get them once they've been written.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Iterable, List, Optional, Tuple, TypeVar
+
+from op_tracker import CONFIG
+from op_tracker.common.database import get_engine, get_session_registry
+from op_tracker.common.database.database import (
+    filter_new_md5s,
+    get_md5_index,
+    get_writer,
+    index_update,
+)
+from op_tracker.common.database.models.update import Update
+from op_tracker.utils.metrics import METRICS
+from op_tracker.utils.versions import get_version_resolver
+
+logger = logging.getLogger(__name__)
+
+Result = TypeVar("Result")
+
+
+def _call(function: Callable[..., Result], *args) -> Result:
+    """Run a database function in a worker thread, then release the thread session"""
+    try:
+        return function(*args)
+    finally:
+        get_session_registry().remove()
+
+
+def _flush() -> Tuple[List[Update], List[Update]]:
+    """Write the queued updates, and get the ones that have been written and skipped"""
+    writer = get_writer()
+    writer.flush()
+    return writer.pop_written(), writer.pop_skipped()
+
+
+def _load_references():
+    """Load the version resolver references"""
+    return get_version_resolver().references
+
+
+class AsyncDatabase:
+    """
+    Awaitable database access that keeps the event loop unblocked
+
+    :attr: `readers`: int - number of reader threads
+    :meth: `prepare` Connect the database and load the in-memory indexes.
+    :meth: `read` Run a read function in a reader thread.
+    :meth: `write` Run a write function in the writer thread.
+    :meth: `filter_new_md5s` Get the checksums of a batch of updates that aren't stored.
+    :meth: `add_updates` Queue a batch of new updates to be written.
+    :meth: `flush` Write all queued updates.
+    :meth: `close` Stop the worker threads.
+    """
+
+    def __init__(self, readers: int = 4):
+        """
+        AsyncDatabase class constructor
+        :param readers: number of reader threads
+        """
+        self.readers: int = readers
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix="db-reader")
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="db-writer")
+        self._prepared: bool = False
+        self._preparing = asyncio.Lock()
+
+    async def read(self, function: Callable[..., Result], *args) -> Result:
+        """
+        Run a read function in a reader thread, it gets its thread session with `get_session()`
+        :param function: database function
+        :param args: function arguments
+        :return: the function result
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._readers, partial(_call, function, *args)
+        )
+
+    async def write(self, function: Callable[..., Result], *args) -> Result:
+        """
+        Run a write function in the writer thread, writes run one at a time in submission order
+        :param function: database function
+        :param args: function arguments
+        :return: the function result
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(_call, function, *args))
+
+    async def prepare(self):
+        """Connect and migrate the database, then load the md5 index and version references"""
+        async with self._preparing:
+            if self._prepared:
+                return
+            with METRICS.span("db_prepare"):
+                await self.read(get_engine)
+                await asyncio.gather(
+                    self.read(get_md5_index), self.read(_load_references)
+                )
+            self._prepared = True
+
+    async def filter_new_md5s(self, md5s: Iterable[str]) -> List[str]:
+        """
+        Get the checksums of a batch of updates that aren't in the database
+        :param md5s: Update files md5
+        :return: a list of the new md5s
+        """
+        if not self._prepared:
+            await self.prepare()
+        return filter_new_md5s(md5s)
+
+    @METRICS.timed("add_to_db")
+    async def add_updates(self, updates: Iterable[Update]) -> List[Update]:
+        """
+        Queue a batch of new updates to be written. Updates that have been added meanwhile
+        (by another device of the same run) are skipped.
+        :param updates: Update objects
+        :return: a list of the added updates
+        """
+        if not self._prepared:
+            await self.prepare()
+        added: List[Update] = []
+        for update in updates:
+            # the index is only changed on the event loop, so checking and adding can't race
+            if update.md5 in get_md5_index():
+                continue
+            get_md5_index().add(update.md5)
+            added.append(update)
+        if added:
+            await self.write(get_writer().add_all, added)
+        return added
+
+    @METRICS.timed("flush_updates")
+    async def flush(self) -> List[Update]:
+        """
+        Write all queued updates to the database. Written updates are added to the version
+        references, updates that clash with a stored update file name or link aren't written,
+        they're removed from the md5 index.
+        :return: the updates that have been skipped since the last flush
+        """
+        written, skipped = await self.write(_flush)
+        for update in written:
+            index_update(update)
+        for update in skipped:
+            get_md5_index().discard(update.md5)
+        return skipped
+
+    def close(self):
+        """Stop the worker threads once their pending calls are done"""
+        self._readers.shutdown()
+        self._writer.shutdown()
+
+
+_db: Optional[AsyncDatabase] = None
+
+
+def get_async_db() -> AsyncDatabase:
+    """Get the shared async database layer, it's created on first use"""
+    global _db  # pylint: disable=global-statement
+    if _db is None:
+        _db = AsyncDatabase(CONFIG.get("db_readers", 4))
+    return _db
+
+
+def close_async_db():
+    """Stop the shared async database layer worker threads"""
+    global _db  # pylint: disable=global-statement
+    if _db is not None:
+        _db.close()
+        _db = None
@@ -1,14 +1,45 @@
 """
 Database related functions
 """
+from time import time
+from typing import Dict, Iterable, List, Optional
 
-from op_tracker.common.database import session
+from sqlalchemy import func, text
+from sqlalchemy.orm import joinedload, sessionmaker
+
+from op_tracker import CONFIG
+from op_tracker.common.database import get_engine, get_session
+from op_tracker.common.database.md5_index import Md5Index
+from op_tracker.common.database.migrations import LATEST_UPDATES_QUERY
+from op_tracker.common.database.models.latest_update import LatestUpdate
+from op_tracker.common.database.models.outbox_message import OutboxMessage
 from op_tracker.common.database.models.update import Update
+from op_tracker.common.database.writer import UpdatesWriter
+from op_tracker.utils.metrics import METRICS
+from op_tracker.utils.versions import get_version_resolver
+
+DISCONTINUED_DEVICES = [
+    "OnePlus 1",
+    "OnePlus 2",
+    "OnePlus 3",
+    "OnePlus 3T",
+    "OnePlus 5",
+    "OnePlus 5T",
+    "OnePlus X",
+]
+
+_md5_index: Optional[Md5Index] = None
+_writer: Optional[UpdatesWriter] = None
 
 
 def get_devices():
+    """
+    Get the latest Full update information of each product, excluding discontinued devices
+    :return: a list of rows
+    """
     all_devices = (
-        session.query(
+        get_session()
+        .query(
             Update.device,
             Update.region,
             Update.version,
@@ -16,35 +47,24 @@ def get_devices():
             Update.type,
             Update.product,
         )
-        .filter(Update.type == "Full")
-        .order_by(Update.date.desc())
-        .distinct(Update.product)
+        .join(LatestUpdate, LatestUpdate.update_id == Update.id)
+        .filter(Update.device.notin_(DISCONTINUED_DEVICES))
+        .order_by(LatestUpdate.date.desc(), LatestUpdate.product)
     )
-    return [
-        i
-        for i in all_devices
-        if i.device
-           not in [
-               "OnePlus 1",
-               "OnePlus 2",
-               "OnePlus 3",
-               "OnePlus 3T",
-               "OnePlus 5",
-               "OnePlus 5T",
-               "OnePlus X",
-           ]
-    ]
-
-
-devices = get_devices()
+    return all_devices.all()
 
 
 def get_latest() -> list:
+    """
+    Get the latest Full update of each product
+    :return: a list of updates dictionaries
+    """
     latest_updates = (
-        session.query(Update)
-        .filter(Update.type == "Full")
-        .order_by(Update.date.desc())
-        .distinct(Update.product)
+        get_session()
+        .query(Update)
+        .join(LatestUpdate, LatestUpdate.update_id == Update.id)
+        .options(joinedload(Update.changelog_entry))
+        .order_by(LatestUpdate.date.desc(), LatestUpdate.product)
         .all()
     )
     latest = [
@@ -64,6 +84,21 @@ def get_latest() -> list:
     return latest
 
 
+def rebuild_latest():
+    """
+    Rebuild latest updates table from the whole updates history
+    :return:
+    """
+    session = get_session()
+    session.execute(text("DELETE FROM latest_updates"))
+    session.execute(
+        text(
+            f"INSERT INTO latest_updates (product, update_id, date) {LATEST_UPDATES_QUERY}"
+        )
+    )
+    session.commit()
+
+
 def get_incremental(version: str) -> Update:
     """
     Get incremental update information of a version
@@ -71,38 +106,144 @@ def get_incremental(version: str) -> Update:
     :param version: OnePlus software version
     """
     return (
-        session.query(Update)
+        get_session()
+        .query(Update)
         .filter(Update.version == version)
         .filter(Update.type == "Incremental")
         .one_or_none()
     )
 
 
-def get_version(device: str, branch: str) -> str:
+def get_incrementals(versions: Iterable[str]) -> Dict[str, Update]:
+    """
+    Get incremental updates information of several versions in one query
+    :param versions: OnePlus software versions
+    :return: a dictionary of incremental updates by version
+    """
+    versions = list(set(versions))
+    if not versions:
+        return {}
+    return {
+        update.version: update
+        for update in get_session()
+        .query(Update)
+        .filter(Update.version.in_(versions))
+        .filter(Update.type == "Incremental")
+    }
+
+
+def get_md5_index() -> Md5Index:
+    """
+    Get the in-memory index of stored updates checksums, it's loaded once on first use
+    :return: Md5Index object
+    """
+    global _md5_index  # pylint: disable=global-statement
+    if _md5_index is None:
+        _md5_index = Md5Index(md5 for (md5,) in get_session().query(Update.md5))
+    return _md5_index
+
+
+def get_writer() -> UpdatesWriter:
     """
-    Get device version example
-    :param device: device name
-    :type device: str
-    :param branch: Update branch
+    Get the batched updates writer, it's created on first use.
+    It has its own session, so it must only be used by one thread at a time
+    (the async database writer thread while the event loop is running).
+    :return: UpdatesWriter object
     """
+    global _writer  # pylint: disable=global-statement
+    if _writer is None:
+        _writer = UpdatesWriter(
+            sessionmaker(bind=get_engine())(),
+            batch_size=CONFIG.get("db_batch_size", 500),
+            flush_interval=CONFIG.get("db_flush_interval", 10),
+        )
+    return _writer
+
+
+def get_reference_versions() -> list:
+    """
+    Get the first stored update of each file name prefix (device) and branch,
+    used as reference for versions of irregular file names
+    :return: a list of (filename, branch, version) rows
+    """
+    session = get_session()
+    prefix = func.lower(
+        func.substr(Update.filename, 1, func.instr(Update.filename, "_") - 1)
+    )
+    first = (
+        session.query(func.min(Update.id).label("id"))
+        .group_by(prefix, Update.branch)
+        .subquery()
+    )
     return (
-        session.query(Update.version)
-        .filter(Update.filename.startswith(device))
-        .filter(Update.branch == branch)
-        .first()
+        session.query(Update.filename, Update.branch, Update.version)
+        .join(first, first.c.id == Update.id)
+        .order_by(Update.id)
+        .all()
     )
 
 
-def add_to_db(update: Update):
-    """Adds an update to the database"""
-    session.add(update)
+def index_update(update: Update):
+    """Index a written update: count it, and add it to the md5 index and version references"""
+    METRICS.count("new_updates")
+    get_md5_index().add(update.md5)
+    get_version_resolver().remember(update.filename, update.branch, update.version)
+
+
+@METRICS.timed("filter_new_md5s")
+def filter_new_md5s(md5s: Iterable[str]) -> List[str]:
+    """
+    Get the checksums of a batch of updates that aren't in the database
+    :param md5s: Update files md5
+    :return: a list of the new md5s
+    """
+    md5s = list(md5s)
+    new_md5s = get_md5_index().filter_new(md5s)
+    METRICS.count("md5_index_hits", len(md5s) - len(new_md5s))
+    METRICS.count("md5_index_misses", len(new_md5s))
+    return new_md5s
+
+
+def add_to_outbox(chat: str, text: str, reply_markup: Optional[str]) -> OutboxMessage:
+    """
+    Queue a Telegram message to be sent
+    :param chat: Telegram chat username or id
+    :param text: message text
+    :param reply_markup: JSON serialized reply markup
+    :return: OutboxMessage object
+    """
+    session = get_session()
+    message = OutboxMessage(
+        chat=chat, text=text, reply_markup=reply_markup, created=time(), attempts=0
+    )
+    session.add(message)
     session.commit()
+    return message
+
+
+def get_outbox(chat: str) -> List[OutboxMessage]:
+    """
+    Get the messages of a chat that haven't been sent yet, oldest first.
+    Messages that Telegram has rejected for good are skipped.
+    :param chat: Telegram chat username or id
+    :return: a list of OutboxMessage objects
+    """
+    return (
+        get_session()
+        .query(OutboxMessage)
+        .filter(OutboxMessage.chat == chat)
+        .filter(OutboxMessage.sent.is_(None))
+        .filter(OutboxMessage.failed.is_(None))
+        .order_by(OutboxMessage.id)
+        .all()
+    )
 
 
-def already_in_db(md5):
+def save_outbox(message: OutboxMessage):
     """
-    Check if an update is already in the database
-    :param md5: Update file md5
-    :return: True if the update is already in the database
+    Save the sending state of an outbox message
+    :param message: OutboxMessage object, it may have been loaded by another thread session
     """
-    return bool(session.query(Update).filter_by(md5=md5).count() >= 1)
+    session = get_session()
+    session.merge(message)
+    session.commit()
@@ -1,15 +1,27 @@
 """
 Database helper functions
 """
-from op_tracker import WORK_DIR
+from typing import List
+
+from op_tracker import CONFIG, WORK_DIR
 from op_tracker.common.database.database import get_latest
 from op_tracker.utils.data_manager import DataManager
+from op_tracker.utils.metrics import METRICS
 
 
-def export_latest():
+@METRICS.timed("export_latest")
+def export_latest() -> List[str]:
     """
-    Export latest updates from the database to YAML file
-    :return:
+    Export latest updates from the database to YAML file,
+    and to any other format listed in `export_formats` config
+    :return: a list of the files whose content has changed
     """
     latest = get_latest()
-    DataManager.write_file(f"{WORK_DIR}/data/latest.yml", latest)
+    files = {"yaml": f"{WORK_DIR}/data/latest.yml"}
+    for export_format in CONFIG.get("export_formats") or []:
+        files[export_format] = f"{WORK_DIR}/data/latest.{export_format}"
+    return [
+        file
+        for export_format, file in files.items()
+        if DataManager.write_file(file, latest, export_format)
+    ]
@@ -0,0 +1,66 @@
+"""
+In-memory index of the updates md5 checksums that are already stored in the database
+"""
+from typing import Iterable, List, Set, Union
+
+
+class Md5Index:
+    """
+    A set of known update checksums, used to check for new updates without querying the database
+
+    Checksums are stored as 16 bytes digests instead of 32 characters hex strings
+    to keep the index compact as the updates history grows.
+    :meth: `add` Add a checksum to the index.
+    :meth: `discard` Remove a checksum from the index.
+    :meth: `filter_new` Get the checksums of a batch that are not in the index.
+    """
+
+    def __init__(self, md5s: Iterable[str] = ()):
+        """
+        Md5Index class constructor
+        :param md5s: checksums that are already known
+        """
+        self._digests: Set[Union[bytes, str]] = {self._key(md5) for md5 in md5s}
+
+    @staticmethod
+    def _key(md5: str) -> Union[bytes, str]:
+        """Convert a hex checksum into its compact form"""
+        try:
+            return bytes.fromhex(md5)
+        except ValueError:
+            return md5.lower()
+
+    def __contains__(self, md5: str) -> bool:
+        return self._key(md5) in self._digests
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def add(self, md5: str):
+        """
+        Add a checksum to the index
+        :param md5: update file md5
+        """
+        self._digests.add(self._key(md5))
+
+    def discard(self, md5: str):
+        """
+        Remove a checksum from the index, if it's there
+        :param md5: update file md5
+        """
+        self._digests.discard(self._key(md5))
+
+    def filter_new(self, md5s: Iterable[str]) -> List[str]:
+        """
+        Get the checksums that are not in the index yet, in the same order, without duplicates
+        :param md5s: a batch of update files md5
+        :return: a list of the new checksums
+        """
+        new: List[str] = []
+        seen: Set[Union[bytes, str]] = set()
+        for md5 in md5s:
+            key = self._key(md5)
+            if key not in self._digests and key not in seen:
+                seen.add(key)
+                new.append(md5)
+        return new
@@ -0,0 +1,276 @@
+"""
+Versioned database schema migrations
+
+The schema version is stored in SQLite `user_version` pragma, every migration
+with a higher version than the database one is applied in order, each one in its own transaction.
+pysqlite commits DDL statements that come before the first DML one on its own,
+so migrations transactions are started and committed explicitly.
+"""
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from op_tracker.common.database.models.changelog import changelog_hash
+
+logger = logging.getLogger(__name__)
+
+# Python functions that migrations statements can call
+SQL_FUNCTIONS = {"changelog_hash": changelog_hash}
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    A class representing a schema migration
+    :param version: int - the schema version after applying the migration
+    :param description: str - what the migration does
+    :param statements: tuple - SQL statements of the migration
+    """
+
+    version: int
+    description: str
+    statements: Tuple[str, ...]
+
+    def apply(self, connection: Connection):
+        """
+        Run the migration statements and bump the schema version
+        :param connection: database connection (inside a transaction)
+        """
+        for name, function in SQL_FUNCTIONS.items():
+            connection.connection.create_function(name, 1, function, deterministic=True)
+        for statement in self.statements:
+            connection.execute(text(statement))
+        connection.execute(text(f"PRAGMA user_version = {self.version}"))
+
+
+# The latest Full update of each product
+LATEST_UPDATES_QUERY = """SELECT product, id, date FROM (
+    SELECT product, id, date, ROW_NUMBER() OVER (
+        PARTITION BY product ORDER BY date DESC, id DESC
+    ) AS position
+    FROM updates WHERE type = 'Full' AND product IS NOT NULL
+) WHERE position = 1"""
+
+# Recompute the latest update of a single product after a change
+_REFRESH_LATEST = """DELETE FROM latest_updates WHERE product = {product};
+                INSERT INTO latest_updates (product, update_id, date)
+                SELECT product, id, date FROM updates
+                WHERE type = 'Full' AND product = {product}
+                ORDER BY date DESC, id DESC LIMIT 1;"""
+
+# Indexes of the updates table
+UPDATES_INDEXES: Tuple[str, ...] = (
+    # get_latest / get_devices: WHERE type = ? ORDER BY date DESC
+    "CREATE INDEX IF NOT EXISTS ix_updates_type_date ON updates (type, date)",
+    # get_incremental: WHERE version = ? AND type = ?
+    "CREATE INDEX IF NOT EXISTS ix_updates_version_type ON updates (version, type)",
+    # latest update of a product: WHERE type = 'Full' AND product = ? ORDER BY date DESC
+    "CREATE INDEX IF NOT EXISTS ix_updates_type_product_date "
+    "ON updates (type, product, date)",
+)
+
+# Triggers that keep latest_updates current
+LATEST_TRIGGERS: Tuple[str, ...] = (
+    """CREATE TRIGGER IF NOT EXISTS tr_updates_latest_insert
+    AFTER INSERT ON updates
+    WHEN NEW.type = 'Full' AND NEW.product IS NOT NULL
+    BEGIN
+        INSERT INTO latest_updates (product, update_id, date)
+        VALUES (NEW.product, NEW.id, NEW.date)
+        ON CONFLICT (product) DO UPDATE
+        SET update_id = excluded.update_id, date = excluded.date
+        WHERE excluded.date >= latest_updates.date;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tr_updates_latest_update
+    AFTER UPDATE OF type, product, date ON updates
+    BEGIN
+        {_REFRESH_LATEST.format(product="OLD.product")}
+        {_REFRESH_LATEST.format(product="NEW.product")}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tr_updates_latest_delete
+    AFTER DELETE ON updates
+    BEGIN
+        {_REFRESH_LATEST.format(product="OLD.product")}
+    END""",
+)
+
+# updates columns that are copied as they are when the table is rebuilt
+_UPDATES_COLUMNS = (
+    "id, device, region, version, branch, type, size, md5, filename, link, date, "
+    "changelog_link, product, insert_date"
+)
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "Create updates table",
+        (
+            """CREATE TABLE IF NOT EXISTS updates (
+                id INTEGER NOT NULL,
+                device VARCHAR NOT NULL,
+                region VARCHAR NOT NULL,
+                version VARCHAR NOT NULL,
+                branch VARCHAR NOT NULL,
+                type VARCHAR NOT NULL,
+                size VARCHAR NOT NULL,
+                md5 VARCHAR(32) NOT NULL,
+                filename VARCHAR NOT NULL,
+                link VARCHAR NOT NULL,
+                date VARCHAR NOT NULL,
+                changelog VARCHAR NOT NULL,
+                changelog_link VARCHAR,
+                product VARCHAR,
+                insert_date VARCHAR,
+                PRIMARY KEY (id),
+                UNIQUE (md5),
+                UNIQUE (filename),
+                UNIQUE (link)
+            )""",
+        ),
+    ),
+    Migration(
+        2,
+        "Add indexes for latest and incremental lookups",
+        (
+            *UPDATES_INDEXES[:2],
+            "ANALYZE",
+        ),
+    ),
+    Migration(
+        3,
+        "Add latest_updates table maintained by triggers",
+        (
+            UPDATES_INDEXES[2],
+            """CREATE TABLE IF NOT EXISTS latest_updates (
+                product VARCHAR NOT NULL,
+                update_id INTEGER NOT NULL,
+                date VARCHAR NOT NULL,
+                PRIMARY KEY (product),
+                FOREIGN KEY (update_id) REFERENCES updates (id)
+            )""",
+            f"INSERT OR REPLACE INTO latest_updates (product, update_id, date) "
+            f"{LATEST_UPDATES_QUERY}",
+            *LATEST_TRIGGERS,
+        ),
+    ),
+    Migration(
+        4,
+        "Add device_polls table for the adaptive polling scheduler",
+        (
+            """CREATE TABLE IF NOT EXISTS device_polls (
+                region VARCHAR NOT NULL,
+                phone_code VARCHAR NOT NULL,
+                fingerprint VARCHAR,
+                last_polled FLOAT,
+                last_changed FLOAT,
+                error_streak INTEGER NOT NULL DEFAULT 0,
+                interval FLOAT NOT NULL DEFAULT 0,
+                next_poll FLOAT NOT NULL DEFAULT 0,
+                PRIMARY KEY (region, phone_code)
+            )""",
+        ),
+    ),
+    Migration(
+        5,
+        "Add telegram_outbox table for queued notifications",
+        (
+            """CREATE TABLE IF NOT EXISTS telegram_outbox (
+                id INTEGER NOT NULL,
+                chat VARCHAR NOT NULL,
+                text VARCHAR NOT NULL,
+                reply_markup VARCHAR,
+                created FLOAT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                sent FLOAT,
+                failed FLOAT,
+                error VARCHAR,
+                PRIMARY KEY (id)
+            )""",
+            "CREATE INDEX IF NOT EXISTS ix_telegram_outbox_pending "
+            "ON telegram_outbox (chat, id) WHERE sent IS NULL AND failed IS NULL",
+        ),
+    ),
+    Migration(
+        6,
+        "Move changelogs to a table keyed by content hash",
+        (
+            """CREATE TABLE IF NOT EXISTS changelogs (
+                hash VARCHAR(32) NOT NULL,
+                text VARCHAR NOT NULL,
+                PRIMARY KEY (hash)
+            )""",
+            "INSERT OR IGNORE INTO changelogs (hash, text) "
+            "SELECT changelog_hash(changelog), COALESCE(changelog, '') "
+            "FROM (SELECT DISTINCT changelog FROM updates)",
+            # SQLite can't drop a column, the table is rebuilt without the changelog text
+            """CREATE TABLE updates_new (
+                id INTEGER NOT NULL,
+                device VARCHAR NOT NULL,
+                region VARCHAR NOT NULL,
+                version VARCHAR NOT NULL,
+                branch VARCHAR NOT NULL,
+                type VARCHAR NOT NULL,
+                size VARCHAR NOT NULL,
+                md5 VARCHAR(32) NOT NULL,
+                filename VARCHAR NOT NULL,
+                link VARCHAR NOT NULL,
+                date VARCHAR NOT NULL,
+                changelog_hash VARCHAR(32) NOT NULL,
+                changelog_link VARCHAR,
+                product VARCHAR,
+                insert_date VARCHAR,
+                PRIMARY KEY (id),
+                UNIQUE (md5),
+                UNIQUE (filename),
+                UNIQUE (link),
+                FOREIGN KEY (changelog_hash) REFERENCES changelogs (hash)
+            )""",
+            f"INSERT INTO updates_new ({_UPDATES_COLUMNS}, changelog_hash) "
+            f"SELECT {_UPDATES_COLUMNS}, changelog_hash(changelog) FROM updates",
+            # dropping the table drops its indexes and triggers too, they're created again
+            "DROP TABLE updates",
+            "ALTER TABLE updates_new RENAME TO updates",
+            *UPDATES_INDEXES,
+            *LATEST_TRIGGERS,
+            "ANALYZE",
+        ),
+    ),
+]
+
+
+def get_schema_version(connection: Connection) -> int:
+    """
+    Get the current schema version of the database
+    :param connection: database connection
+    :return: schema version, 0 for a new database
+    """
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate(engine: Engine, target: Optional[int] = None) -> int:
+    """
+    Apply all pending migrations up to the target version
+    :param engine: database engine
+    :param target: schema version to migrate to, defaults to the latest one
+    :return: the schema version after migrating
+    """
+    with engine.connect() as connection:
+        version = get_schema_version(connection)
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        if target is not None and migration.version > target:
+            break
+        logger.info(f"Applying migration {migration.version}: {migration.description}")
+        with engine.connect() as connection:
+            # the driver doesn't start transactions on its own in autocommit mode,
+            # the transaction is started explicitly, then committed or rolled back on exit
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            with connection.begin():
+                connection.exec_driver_sql("BEGIN")
+                migration.apply(connection)
+        version = migration.version
+    return version
@@ -0,0 +1,39 @@
+"""OnePlus Updates Tracker Database Changelog model"""
+from hashlib import blake2b
+from typing import Optional
+
+from sqlalchemy import Column, String
+
+from op_tracker.common.database.models import Base
+
+
+def changelog_hash(text: Optional[str]) -> str:
+    """
+    Get the content hash a changelog is stored by
+    :param text: changelog text
+    :return: 32 characters hex digest
+    """
+    return blake2b((text or "").encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Changelog(Base):
+    """
+    Changelog class that represents a changelog text, it's stored once by its content hash
+    and shared by all updates that have the same changelog
+    """
+
+    __tablename__ = "changelogs"
+    hash: str = Column(String, primary_key=True)
+    text: str = Column(String)
+
+    @classmethod
+    def from_text(cls, text: Optional[str]):
+        """
+        Factory method to create an instance of :class:`Changelog` from its text
+        :param text: changelog text
+        :return: :class:`Changelog` instance
+        """
+        return cls(hash=changelog_hash(text), text=text or "")
+
+    def __repr__(self):
+        return f"<Changelog(hash='{self.hash}')>"
@@ -0,0 +1,28 @@
+"""OnePlus Updates Tracker Database DevicePoll model"""
+from typing import Union
+
+from sqlalchemy import Column, Float, Integer, String
+
+from op_tracker.common.database.models import Base
+
+
+class DevicePoll(Base):
+    """
+    DevicePoll class that represents the polling state of a device in a region
+    """
+
+    __tablename__ = "device_polls"
+    region: str = Column(String, primary_key=True)
+    phone_code: str = Column(String, primary_key=True)
+    fingerprint: Union[str, None] = Column(String)
+    last_polled: Union[float, None] = Column(Float)
+    last_changed: Union[float, None] = Column(Float)
+    error_streak: int = Column(Integer, default=0)
+    interval: float = Column(Float, default=0)
+    next_poll: float = Column(Float, default=0)
+
+    def __repr__(self):
+        return (
+            f"<DevicePoll(region='{self.region}', phone_code='{self.phone_code}', "
+            f"next_poll={self.next_poll})>"
+        )
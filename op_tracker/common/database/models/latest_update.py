@@ -0,0 +1,19 @@
+"""OnePlus Updates Tracker Database LatestUpdate model"""
+from sqlalchemy import Column, ForeignKey, Integer, String
+
+from op_tracker.common.database.models import Base
+
+
+class LatestUpdate(Base):
+    """
+    LatestUpdate class that points to the latest Full update of a product.
+    Rows are maintained by database triggers when updates are inserted, changed or deleted.
+    """
+
+    __tablename__ = "latest_updates"
+    product: str = Column(String, primary_key=True)
+    update_id: int = Column(Integer, ForeignKey("updates.id"))
+    date: str = Column(String)
+
+    def __repr__(self):
+        return f"<LatestUpdate(product='{self.product}', update_id={self.update_id})>"
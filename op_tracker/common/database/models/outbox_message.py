@@ -0,0 +1,29 @@
+"""OnePlus Updates Tracker Database OutboxMessage model"""
+from typing import Union
+
+from sqlalchemy import Column, Float, Integer, String
+
+from op_tracker.common.database.models import Base
+
+
+class OutboxMessage(Base):
+    """
+    OutboxMessage class that represents a Telegram message waiting to be sent
+    """
+
+    __tablename__ = "telegram_outbox"
+    id: int = Column(Integer, primary_key=True)
+    chat: str = Column(String)
+    text: str = Column(String)
+    reply_markup: Union[str, None] = Column(String)
+    created: float = Column(Float)
+    attempts: int = Column(Integer, default=0)
+    sent: Union[float, None] = Column(Float)
+    failed: Union[float, None] = Column(Float)
+    error: Union[str, None] = Column(String)
+
+    def __repr__(self):
+        return (
+            f"<OutboxMessage(id={self.id}, chat='{self.chat}', "
+            f"sent={self.sent}, failed={self.failed})>"
+        )
@@ -1,14 +1,20 @@
 """OnePlus Updates Tracker Database Update model"""
-from typing import Union
+from typing import Optional, Union
 
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy.orm import relationship
 
 from op_tracker.common.database.models import Base
+from op_tracker.common.database.models.changelog import Changelog
 
 
 class Update(Base):
     """
     Update class that represents a device update
+
+    The changelog text is stored in the changelogs table, `changelog` gets and sets it
+    through `changelog_entry`. Setting it creates a new :class:`Changelog`, which is stored
+    with the update by the updates writer.
     """
 
     __tablename__ = "updates"
@@ -23,11 +29,21 @@ class Update(Base):
     filename: str = Column(String)
     link: str = Column(String)
     date: str = Column(String)
-    changelog: str = Column(String)
+    changelog_hash: str = Column(String, ForeignKey("changelogs.hash"))
+    changelog_entry: Optional[Changelog] = relationship(Changelog, lazy="select")
     changelog_link: Union[str, None] = Column(String)
     insert_date: str = Column(String)
     product: str = Column(String)
 
+    @property
+    def changelog(self) -> Optional[str]:
+        """The update changelog text"""
+        return self.changelog_entry.text if self.changelog_entry is not None else None
+
+    @changelog.setter
+    def changelog(self, text: Optional[str]):
+        self.changelog_entry = Changelog.from_text(text)
+
     def __repr__(self):
         return "<User(device='%s', version='%s', branch='%s')>" % (
             self.device,
@@ -0,0 +1,180 @@
+"""
+Batched database writer for new updates
+"""
+import logging
+from time import monotonic
+from typing import Iterable, List, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from op_tracker.common.database.models.changelog import Changelog
+from op_tracker.common.database.models.update import Update
+
+logger = logging.getLogger(__name__)
+
+
+class UpdatesWriter:
+    """
+    Collects new updates and writes them to the database in one transaction per batch
+
+    Rows are bulk inserted with `INSERT ... ON CONFLICT DO NOTHING`, so updates
+    that clash with the unique md5, filename or link columns are skipped.
+    Written and skipped updates are looked up after the insert and kept in `written`
+    and `skipped`, so only written ones are reported as new.
+    A failed write is rolled back and its updates stay pending, they're written by the next flush.
+    Changelogs are written in the same transaction, once for each content hash,
+    and only for the updates that have been written.
+    :attr: `batch_size`: int - number of pending updates that triggers a flush
+    :attr: `flush_interval`: float - seconds since the last flush that trigger a flush
+    :attr: `written`: list - updates that have been written since the last `pop_written` call
+    :attr: `skipped`: list - updates that weren't written since the last `pop_skipped` call
+    :meth: `add` Queue an update to be written.
+    :meth: `add_all` Queue a batch of updates to be written.
+    :meth: `flush` Write all pending updates.
+    :meth: `pop_written` Get and clear the written updates.
+    :meth: `pop_skipped` Get and clear the skipped updates.
+    """
+
+    def __init__(
+        self, session: Session, batch_size: int = 500, flush_interval: float = 10
+    ):
+        """
+        UpdatesWriter class constructor
+        :param session: database session
+        :param batch_size: number of pending updates that triggers a flush
+        :param flush_interval: seconds since the last flush that trigger a flush
+        """
+        self.session: Session = session
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.written: List[Update] = []
+        self.skipped: List[Update] = []
+        self._pending: List[Update] = []
+        self._last_flush: float = monotonic()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, update: Update):
+        """
+        Queue an update to be written, flushing if a threshold is reached
+        :param update: Update object
+        """
+        self.add_all([update])
+
+    def add_all(self, updates: Iterable[Update]):
+        """
+        Queue a batch of updates to be written, flushing if a threshold is reached
+        :param updates: Update objects
+        """
+        self._pending.extend(updates)
+        if (
+            len(self._pending) >= self.batch_size
+            or monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write all pending updates in a single transaction
+        :return: number of written updates
+        """
+        self._last_flush = monotonic()
+        if not self._pending:
+            return 0
+        try:
+            written, skipped = self._write()
+        except SQLAlchemyError:
+            self.session.rollback()
+            raise
+        for update in skipped:
+            logger.warning(
+                f"Skipped {update.filename}, it clashes with a stored update"
+            )
+        self.written.extend(written)
+        self.skipped.extend(skipped)
+        self._pending = []
+        logger.info(f"Wrote {len(written)} updates to the database")
+        return len(written)
+
+    def _write(self) -> Tuple[List[Update], List[Update]]:
+        """
+        Insert the pending updates and their changelogs, and commit
+        :return: a tuple of the written and the skipped updates
+        """
+        rows = [self._to_row(update) for update in self._pending]
+        self.session.execute(insert(Update.__table__).on_conflict_do_nothing(), rows)
+        stored = self._stored([update.md5 for update in self._pending])
+        written: List[Update] = []
+        skipped: List[Update] = []
+        for update in self._pending:
+            if (update.md5, update.filename) in stored:
+                written.append(update)
+            else:
+                skipped.append(update)
+        # the changelogs of skipped updates aren't written, nothing would point to them
+        # (SQLite doesn't enforce the foreign key, so they can come after the updates)
+        changelogs = {
+            update.changelog_entry.hash: update.changelog_entry.text
+            for update in written
+            if update.changelog_entry is not None
+        }
+        if changelogs:
+            self.session.execute(
+                insert(Changelog.__table__).on_conflict_do_nothing(),
+                [{"hash": key, "text": text} for key, text in changelogs.items()],
+            )
+        self.session.commit()
+        return written, skipped
+
+    def _stored(self, md5s: List[str]) -> Set[Tuple[str, str]]:
+        """
+        Get the (md5, filename) pairs of stored updates, in chunks below SQLite variables limit
+        :param md5s: update files md5
+        :return: a set of (md5, filename) tuples
+        """
+        table = Update.__table__
+        stored: Set[Tuple[str, str]] = set()
+        for start in range(0, len(md5s), 500):
+            stored.update(
+                tuple(row)
+                for row in self.session.execute(
+                    select(table.c.md5, table.c.filename).where(
+                        table.c.md5.in_(md5s[start : start + 500])
+                    )
+                )
+            )
+        return stored
+
+    def pop_written(self) -> List[Update]:
+        """
+        Get the updates that have been written, and clear them
+        :return: a list of Update objects
+        """
+        written, self.written = self.written, []
+        return written
+
+    def pop_skipped(self) -> List[Update]:
+        """
+        Get the updates that weren't written because they clash with a stored update
+        file name or link, and clear them
+        :return: a list of Update objects
+        """
+        skipped, self.skipped = self.skipped, []
+        return skipped
+
+    @staticmethod
+    def _to_row(update: Update) -> dict:
+        """Convert an Update object into a table row dictionary"""
+        row = {
+            column.name: getattr(update, column.key)
+            for column in Update.__table__.columns
+            if not column.primary_key
+        }
+        # the foreign key is only set by the ORM on flush, updates are inserted without it
+        if update.changelog_entry is not None:
+            row["changelog_hash"] = update.changelog_entry.hash
+        return row
@@ -0,0 +1,182 @@
+"""
+OnePlus Updates Tracker daemon mode
+
+Keeps the event loop, the HTTP connections pool, the database connection and the in-memory
+indexes warm between runs, and runs each region on its own interval instead of being
+started by cron. Usage: python -m op_tracker daemon
+"""
+import asyncio
+import logging
+import signal
+from importlib import import_module
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from op_tracker import CONFIG, WORK_DIR
+from op_tracker.common.api_client.transport import close_transport
+from op_tracker.common.database.async_db import close_async_db
+from op_tracker.tracker_official import main as official
+from op_tracker.utils.changelog import close_changelog_parser
+from op_tracker.utils.data_manager import DataManager
+from op_tracker.utils.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def get_extra_source(source: Optional[str]) -> Optional[Callable[[], Awaitable]]:
+    """
+    Get the coroutine function that runs the configured extra source
+    :param source: the `source` config value
+    :return: the source `main` coroutine function, None if there's no extra source
+    """
+    if not source or source in ("official", "tracker_official"):
+        return None
+    try:
+        module = import_module(f"op_tracker.{source}")
+    except ImportError:
+        logger.warning(f"Unknown source {source}, it won't be run")
+        return None
+    if not asyncio.iscoroutinefunction(getattr(module, "main", None)):
+        logger.warning(f"Source {source} has no async main function, it won't be run")
+        return None
+    return module.main
+
+
+class Daemon:
+    """
+    Interval scheduler of the tracker runs
+
+    Each job (a region, or the extra source) is due `interval` seconds after its last run started.
+    Due jobs run together in one tracker run, and runs never overlap.
+    :attr: `intervals`: dict - seconds between runs of each job
+    :attr: `extra`: coroutine function - extra source to run, if any
+    :meth: `run_forever` Run due jobs until stopped.
+    :meth: `stop` Stop after the current run.
+    """
+
+    EXTRA_JOB: str = "extra"
+
+    def __init__(
+        self,
+        intervals: Dict[str, float],
+        extra: Optional[Callable[[], Awaitable]] = None,
+    ):
+        """
+        Daemon class constructor
+        :param intervals: seconds between runs of each region code (and the extra source)
+        :param extra: extra source coroutine function
+        """
+        self.intervals: Dict[str, float] = dict(intervals)
+        self.extra: Optional[Callable[[], Awaitable]] = extra
+        if extra is None:
+            self.intervals.pop(self.EXTRA_JOB, None)
+        self._next_run: Dict[str, float] = {job: 0.0 for job in self.intervals}
+        self._stopping: Optional[asyncio.Event] = None
+        self._current: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, config: dict, regions: List[dict], extra=None):
+        """
+        Factory method to create an instance of :class:`Daemon` from the `daemon` config section
+        :param config: dict - daemon configuration
+        :param regions: list - regions from regions.yml
+        :param extra: extra source coroutine function
+        :return: :class:`Daemon` instance
+        """
+        interval = config.get("interval") or 3600
+        overrides = config.get("intervals") or {}
+        intervals = {
+            region.get("code"): overrides.get(region.get("code")) or interval
+            for region in regions
+        }
+        intervals[cls.EXTRA_JOB] = overrides.get(cls.EXTRA_JOB) or interval
+        return cls(intervals, extra)
+
+    def due(self, now: float) -> List[str]:
+        """
+        Get the jobs that are due
+        :param now: event loop time
+        :return: a list of job names
+        """
+        return [job for job, next_run in self._next_run.items() if next_run <= now]
+
+    async def run_forever(self):
+        """Run due jobs until the daemon is stopped"""
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+        logger.info(f"Daemon started, intervals: {self.intervals}")
+        try:
+            while not self._stopping.is_set():
+                now = loop.time()
+                jobs = self.due(now)
+                if jobs:
+                    for job in jobs:
+                        self._next_run[job] = now + self.intervals[job]
+                    self._current = asyncio.ensure_future(self._run(jobs))
+                    try:
+                        await self._current
+                    except asyncio.CancelledError:
+                        if not self._stopping.is_set():
+                            raise
+                        logger.warning("Run cancelled")
+                    self._current = None
+                    continue
+                delay = min(self._next_run.values()) - now
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(sig)
+        logger.info("Daemon stopped")
+
+    async def _run(self, jobs: List[str]):
+        """
+        Run the tracker for due jobs
+        :param jobs: due regions codes and the extra source
+        """
+        regions = [job for job in jobs if job != self.EXTRA_JOB]
+        logger.info(f"Running {', '.join(jobs)}")
+        METRICS.reset()
+        try:
+            with METRICS.span("run"):
+                if regions:
+                    await official(regions)
+                if self.EXTRA_JOB in jobs:
+                    await self.extra()
+        except Exception as error:  # pylint: disable=broad-except
+            # a failed run shouldn't stop the daemon, the jobs are retried on their next interval
+            logger.exception(f"Run of {jobs} has failed: {error}")
+        finally:
+            METRICS.write()
+
+    def stop(self):
+        """Stop the daemon once the current run is done, a second call cancels the current run"""
+        if self._stopping.is_set():
+            if self._current is not None:
+                self._current.cancel()
+            return
+        logger.info("Stopping the daemon after the current run")
+        self._stopping.set()
+
+
+async def main():
+    """Daemon main function"""
+    regions = DataManager.read_file(f"{WORK_DIR}/data/official/regions.yml")
+    daemon = Daemon.from_config(
+        CONFIG.get("daemon") or {}, regions, get_extra_source(CONFIG.get("source"))
+    )
+    try:
+        await daemon.run_forever()
+    finally:
+        await close_transport()
+        close_changelog_parser()
+        close_async_db()
+
+
+def run():
+    """Daemon asyncio trigger function"""
+    METRICS.configure(CONFIG.get("metrics") or {})
+    asyncio.run(main())
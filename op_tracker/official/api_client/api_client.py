@@ -1,19 +1,31 @@
 """
 OnePlus Websites Scraper class implementation
 """
+import asyncio
 import json
 import logging
 from datetime import datetime
-from typing import Dict, List
-
-from aiohttp import ClientResponse
+from hashlib import sha1
+from typing import Dict, List, Optional
 
+from op_tracker import CONFIG
 from op_tracker.common.api_client.common_scraper import CommonClient
-from op_tracker.common.database.database import add_to_db, already_in_db
+from op_tracker.common.api_client.resilience import (
+    REQUEST_ERRORS,
+    DeadlineExceeded,
+    DeviceOutcome,
+    RequestError,
+    ResilientCaller,
+    RetryPolicy,
+    TransientError,
+)
+from op_tracker.common.database.async_db import AsyncDatabase, get_async_db
 from op_tracker.common.database.models.update import Update
 from op_tracker.official.models.device import Device
-from op_tracker.utils.helpers import (get_version_from_file,
-                                      parse_changelog_from_website)
+from op_tracker.utils.changelog import get_changelog_parser
+from op_tracker.utils.helpers import get_version_from_file
+from op_tracker.utils.json_codec import EnvelopeError, decode_envelope
+from op_tracker.utils.metrics import METRICS
 
 
 class APIClient(CommonClient):
@@ -26,6 +38,13 @@ class APIClient(CommonClient):
     - Get device's updates information
     :attr: `region`: str - Website region
     :attr: `headers`: dict - HTTP request headers
+    :attr: `fingerprints`: dict - response fingerprint of each fetched device code,
+     None if the request has failed
+    :attr: `outcomes`: dict - request outcome of each fetched device code
+    :attr: `deadline`: float - event loop time by which the run requests must be done,
+     None for no limit
+    :attr: `caller`: ResilientCaller - runs requests with timeouts, retries and hedging
+    :attr: `db`: AsyncDatabase - database access off the event loop
     :meth: `get_devices` - Get all available devices on the website.
     :meth: `get_updates` - Get all updates available for a device.
     """
@@ -37,7 +56,7 @@ class APIClient(CommonClient):
         """
         super().__init__()
         self.region: str = region
-        self.base_url: str = (
+        self.base_url: str = CONFIG.get("store_api_url") or (
             "https://storeapi-na.oneplus.com"
             if self.region != "cn"
             else "https://store.oneplus.com"
@@ -49,6 +68,13 @@ class APIClient(CommonClient):
             "origin": "https://www.oneplus.com",
             "referer": "https://www.oneplus.com/",
         }
+        self.fingerprints: Dict[str, Optional[str]] = {}
+        self.outcomes: Dict[str, DeviceOutcome] = {}
+        self.deadline: Optional[float] = None
+        self.caller: ResilientCaller = ResilientCaller(
+            RetryPolicy.from_config(CONFIG.get("api_requests") or {})
+        )
+        self.db: AsyncDatabase = get_async_db()
         self._logger = logging.getLogger(__name__)
 
     async def get_devices(self):
@@ -56,17 +82,13 @@ class APIClient(CommonClient):
         Get all available devices list from the website API.
         """
         json_data = json.dumps({"storeCode": self.region})
-        async with self.session.post(
-                f"{self.base_url}/xman/send-in-repair/find-phone-models",
-                headers=self.headers,
-                data=json_data,
-        ) as response:
-            if response.status == 200:
-                self.devices = [
-                    Device.from_response(item)
-                    for item in await self._get_json_response(response)
-                ]
-                return self.devices
+        try:
+            response: list = await self._post("find-phone-models", json_data)
+        except REQUEST_ERRORS as error:
+            self._logger.warning(f"Cannot get {self.region} devices: {error!r}")
+            return None
+        self.devices = [Device.from_response(item) for item in response]
+        return self.devices
 
     async def get_updates(self, device: Device, region: dict) -> list:
         """
@@ -84,31 +106,45 @@ class APIClient(CommonClient):
                 updates.append(item)
         return updates
 
-    async def _request(self, json_data: str) -> list:
+    async def _post(self, endpoint: str, json_data: str) -> list:
         """
-        Perform an OTA request
+        Perform an API request, retried and hedged according to the requests policy
+        :param endpoint: API endpoint name
         :param json_data: OnePlus API request data
-        :return: OTA response dictionary
+        :return: API response data
+        :raises: one of :data:`REQUEST_ERRORS` if the request has failed
         """
-        async with self.session.post(
-                f"{self.base_url}/xman/send-in-repair/find-phone-systems",
+
+        async def request() -> list:
+            async with self.session.post(
+                f"{self.base_url}/xman/send-in-repair/{endpoint}",
                 headers=self.headers,
                 data=json_data,
-        ) as response:
-            if response.status == 200:
-                try:
-                    data: dict = json.loads(await response.text())
-                    if data["ret"] == 1 and data["errCode"] == 0:
-                        return data["data"]
-                except json.JSONDecodeError:
-                    self._logger.warning(f"Cannot decode JSON response of {data}")
-                    return []
-            else:
-                self._logger.warning(
-                    f"Not ok response ({response.reason}): "
-                    f"{data}\n{response.content}"
-                )
+            ) as response:
+                METRICS.count("api_requests", endpoint=endpoint)
+                if response.status >= 500:
+                    raise TransientError(
+                        f"Not ok response ({response.status} {response.reason})"
+                    )
+                if response.status != 200:
+                    raise RequestError(
+                        f"Not ok response ({response.status} {response.reason})"
+                    )
+                content = await response.read()
+                METRICS.count("api_response_bytes", len(content), endpoint=endpoint)
+                return self._get_data(content)
+
+        return await self.caller.call(request, key=endpoint, deadline=self.deadline)
+
+    async def _request(self, json_data: str) -> list:
+        """
+        Perform an OTA request
+        :param json_data: OnePlus API request data
+        :return: OTA response list
+        """
+        return await self._post("find-phone-systems", json_data)
 
+    @METRICS.timed("fetch_updates")
     async def _fetch(self, device: Device) -> List[Update]:
         """
         Fetch an update and add it to the database if new
@@ -116,19 +152,57 @@ class APIClient(CommonClient):
         :return: Update object
         """
         json_data = json.dumps({"storeCode": device.region, "phoneCode": device.code})
-        response: list = await self._request(json_data)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            response: list = await self._request(json_data)
+        except REQUEST_ERRORS as error:
+            timeout = isinstance(error, DeadlineExceeded)
+            self.outcomes[device.code] = DeviceOutcome(
+                "timeout" if timeout else "failed", loop.time() - start, repr(error)
+            )
+            self.fingerprints[device.code] = None
+            METRICS.count(
+                "device_polls",
+                region=self.region,
+                status=self.outcomes[device.code].status,
+            )
+            if not timeout:
+                self._logger.warning(
+                    f"Cannot get {device.name} ({device.region}) updates: {error!r}"
+                )
+            return []
+        self.outcomes[device.code] = DeviceOutcome("ok", loop.time() - start)
+        METRICS.count("device_polls", region=self.region, status="ok")
+        self.fingerprints[device.code] = self._fingerprint(response)
         if response:
-            updates = []
-            for item in response:
-                filename = item.get("versionLink").split("/")[-1]
-                if not already_in_db(item.get("versionSign").lower()):
-                    update = self._parse_response(item, device)
-                    add_to_db(update)
-                    self._logger.info(f"Added {filename} to db")
-                    updates.append(update)
+            md5s = [item.get("versionSign").lower() for item in response]
+            new_md5s = set(await self.db.filter_new_md5s(md5s))
+            parsed = [
+                await self._parse_response(item, device)
+                for item, md5 in zip(response, md5s)
+                if md5 in new_md5s
+            ]
+            # another device may have added the same updates while parsing, they're skipped
+            updates = await self.db.add_updates(parsed)
+            for update in updates:
+                self._logger.info(f"Added {update.filename} to db")
             return updates
 
-    def _parse_response(self, response: dict, device: Device) -> Update:
+    @staticmethod
+    def _fingerprint(response: Optional[list]) -> Optional[str]:
+        """
+        Get a fingerprint of a device updates response, it changes when the updates change
+        :param response: OTA response list
+        :return: fingerprint string, or None if there is no response
+        """
+        if response is None:
+            return None
+        md5s = sorted(str(item.get("versionSign", "")).lower() for item in response)
+        return sha1("\n".join(md5s).encode()).hexdigest()
+
+    @METRICS.timed("parse_response")
+    async def _parse_response(self, response: dict, device: Device) -> Update:
         """
         Parse the response from th API into an Update object
         :param response: API response dictionary
@@ -144,7 +218,7 @@ class APIClient(CommonClient):
             self._logger.warning(f"{name} ({version}) empty changelog!")
         return Update(
             device=device.name,
-            changelog=parse_changelog_from_website(_changelog),
+            changelog=await get_changelog_parser().parse_async(_changelog or ""),
             changelog_link=None,
             link=response.get("versionLink"),
             region=device.region,
@@ -161,16 +235,20 @@ class APIClient(CommonClient):
             product=device.get_product(),
         )
 
-    @staticmethod
-    async def _get_json_response(_response: ClientResponse):
+    def _get_data(self, content: bytes) -> list:
         """
-        Get a JSON response from the HTTP response
-        :param _response: ClientResponse: The API response client object
-        :return:
+        Get the data of an API JSON response, parsed straight from the response bytes
+        :param content: the response body
+        :return: response data, empty if the response reports an error
+        :raises RequestError: if the response isn't valid JSON
         """
-        response: dict = json.loads(await _response.text())
-        return (
-            response["data"]
-            if response["ret"] == 1 and response["errCode"] == 0
-            else []
-        )
+        try:
+            data = decode_envelope(content)
+        except EnvelopeError as error:
+            self._logger.warning(f"{self.region}: {error}")
+            return []
+        except ValueError as error:
+            raise RequestError(
+                f"Cannot decode JSON response of {content[:200]!r}"
+            ) from error
+        return data if data is not None else []
@@ -3,6 +3,7 @@ OnePlus Device representation class (Official Website API)
 """
 import re
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -36,32 +37,46 @@ class Device:
         return cls(name, response.get("phoneCode"), response.get("phoneImage"), "", "")
 
     def get_product(self):
+        """
+        Get the product name of the device in its region, and keep it in `product`
+        :return: product name, None if it's unknown
+        """
+        self.product = self.product_of(self.name, self.region)
+        return self.product
+
+    @staticmethod
+    def product_of(name: str, region: str) -> Optional[str]:
+        """
+        Get the product name of a device in a region
+        :param name: device name
+        :param region: region name
+        :return: product name, None if it's unknown
+        """
         product = None
-        device = re.sub(r"OnePlus\s", "", self.name)
+        device = re.sub(r"OnePlus\s", "", name)
         if device in ["1", "2", "3", "3T", "5", "6", "6T", "X"]:
-            product = self.name.replace(" ", "")
+            product = name.replace(" ", "")
         elif device == "7" or device == "7 Pro":
-            if self.region == "China":
-                product = f"{self.name.replace(' ', '')}_CH"
-            elif self.region == "EEA":
-                product = f"{self.name.replace(' ', '')}_EEA"
+            if region == "China":
+                product = f"{name.replace(' ', '')}_CH"
+            elif region == "EEA":
+                product = f"{name.replace(' ', '')}_EEA"
             else:
-                product = self.name.replace(" ", "")
+                product = name.replace(" ", "")
         elif device == "7T" or device == "7T Pro":
-            if self.region == "China":
-                product = f"{self.name.replace(' ', '')}_CH"
+            if region == "China":
+                product = f"{name.replace(' ', '')}_CH"
             else:
-                product = self.name.replace(" ", "")
+                product = name.replace(" ", "")
         else:
-            if self.region == "Global":
-                product = self.name.replace(" ", "")
-            elif self.region == "China":
-                product = f"{self.name.replace(' ', '')}_CH"
-            elif self.region == "EEA" or self.region == "Europe":
-                product = f"{self.name.replace(' ', '')}_EEA"
-            elif self.region == "India":
-                product = f"{self.name.replace(' ', '')}_IND"
-        self.product = product
+            if region == "Global":
+                product = name.replace(" ", "")
+            elif region == "China":
+                product = f"{name.replace(' ', '')}_CH"
+            elif region == "EEA" or region == "Europe":
+                product = f"{name.replace(' ', '')}_EEA"
+            elif region == "India":
+                product = f"{name.replace(' ', '')}_IND"
         return product
 
 
@@ -0,0 +1,143 @@
+"""
+Adaptive polling scheduler for the official website devices
+
+Each (region, device) is polled again after an interval that depends on its history:
+devices whose updates list has just changed are polled every `min_interval`,
+unchanged and failing devices back off exponentially up to `max_interval`.
+"""
+import logging
+from dataclasses import dataclass, fields
+from time import time
+from typing import Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy.orm import Session
+
+from op_tracker.common.database.models.device_poll import DevicePoll
+
+logger = logging.getLogger(__name__)
+
+Candidate = TypeVar("Candidate")
+
+
+@dataclass
+class PollPolicy:
+    """
+    Polling scheduler settings
+    :param min_interval: float - seconds between polls of a recently changed device
+    :param max_interval: float - maximum seconds between polls of a dormant device
+    :param backoff: float - interval multiplier for each unchanged or failed poll
+    :param budget: int - maximum number of device polls per run, 0 for unlimited
+    """
+
+    min_interval: float = 3600
+    max_interval: float = 7 * 24 * 3600
+    backoff: float = 2
+    budget: int = 0
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """
+        Factory method to create an instance of :class:`PollPolicy` from the `polling` config
+        :param config: dict - polling configuration
+        :return: :class:`PollPolicy` instance
+        """
+        names = {item.name for item in fields(cls)}
+        return cls(
+            **{
+                key: value
+                for key, value in config.items()
+                if key in names and value is not None
+            }
+        )
+
+
+class PollScheduler:
+    """
+    Polling scheduler that decides which devices are polled in a run
+
+    :attr: `policy`: PollPolicy - scheduler settings
+    :meth: `select` Get the devices that are due for polling.
+    :meth: `record` Record the outcome of a device poll.
+    :meth: `save` Save the devices polling state.
+    """
+
+    def __init__(self, session: Session, policy: PollPolicy):
+        """
+        PollScheduler class constructor
+        :param session: database session
+        :param policy: scheduler settings
+        """
+        self.session: Session = session
+        self.policy: PollPolicy = policy
+        self.states: Dict[Tuple[str, str], DevicePoll] = {
+            (state.region, state.phone_code): state
+            for state in session.query(DevicePoll)
+        }
+
+    def select(
+        self,
+        candidates: Sequence[Tuple[str, str, Candidate]],
+        now: Optional[float] = None,
+    ) -> List[Candidate]:
+        """
+        Get the devices that are due for polling, new devices first then the most overdue ones,
+        up to the per run budget. The selected devices keep their original order.
+        :param candidates: (region code, phone code, item) tuples of all devices
+        :param now: current time, in seconds since the epoch
+        :return: the selected items
+        """
+        now = time() if now is None else now
+        due = []
+        for position, (region, code, _) in enumerate(candidates):
+            state = self.states.get((region, code))
+            if state is None:
+                due.append((float("-inf"), position))
+            elif state.next_poll <= now:
+                due.append((state.next_poll, position))
+        if self.policy.budget:
+            due = sorted(due)[: self.policy.budget]
+        selected = sorted(position for _, position in due)
+        logger.info(f"Polling {len(selected)} of {len(candidates)} devices")
+        return [candidates[position][2] for position in selected]
+
+    def record(
+        self,
+        region: str,
+        code: str,
+        fingerprint: Optional[str],
+        now: Optional[float] = None,
+    ):
+        """
+        Record the outcome of a device poll and schedule its next poll
+        :param region: region code
+        :param code: device phone code
+        :param fingerprint: the device response fingerprint, None if the request failed
+        :param now: current time, in seconds since the epoch
+        """
+        now = time() if now is None else now
+        policy = self.policy
+        state = self.states.get((region, code))
+        if state is None:
+            state = DevicePoll(
+                region=region, phone_code=code, error_streak=0, interval=0
+            )
+            self.session.add(state)
+            self.states[(region, code)] = state
+        if fingerprint is None:
+            state.error_streak += 1
+            interval = policy.min_interval * policy.backoff**state.error_streak
+        elif fingerprint != state.fingerprint:
+            state.fingerprint = fingerprint
+            state.last_changed = now
+            state.error_streak = 0
+            interval = policy.min_interval
+        else:
+            state.error_streak = 0
+            interval = max(state.interval, policy.min_interval) * policy.backoff
+        state.interval = min(interval, policy.max_interval)
+        state.last_polled = now
+        state.next_poll = now + state.interval
+
+    def save(self):
+        """Save the devices polling state"""
+        self.session.commit()
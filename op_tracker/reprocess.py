@@ -0,0 +1,403 @@
+"""
+Reprocess stored updates with the current parsing rules
+
+Derived columns (changelog cleanup, version, type and product) are recomputed from each row
+stored inputs, and only rows whose output has changed are written back. The updates table is
+streamed in id order chunks, which are processed in a worker processes pool and written
+in one transaction per chunk. The last written id is saved as a checkpoint after each chunk,
+so an interrupted run resumes where it has stopped.
+The raw API changelogs aren't stored, and the cleanup isn't idempotent (it unescapes entities,
+so the text of a raw "&lt;b&gt;" would be read as a tag on a second pass), so it's only applied
+again to stored changelogs that still contain markup, and running the command again changes nothing.
+Usage: python -m op_tracker reprocess [--chunk-size 2000] [--workers 4] [--restart] [--dry-run]
+"""
+import json
+import logging
+import os
+import re
+from argparse import ArgumentParser
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from logging import StreamHandler
+from pathlib import Path
+from sys import stderr
+from time import monotonic
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, func, select, text
+from sqlalchemy.dialects.sqlite import insert
+
+from op_tracker import FORMATTER, WORK_DIR
+from op_tracker.common.database import get_engine
+from op_tracker.common.database.database import get_reference_versions
+from op_tracker.common.database.models.changelog import Changelog, changelog_hash
+from op_tracker.common.database.models.update import Update
+from op_tracker.official.models.device import Device
+from op_tracker.utils.changelog import ChangelogParser
+from op_tracker.utils.metrics import METRICS
+from op_tracker.utils.processes import new_process_pool
+from op_tracker.utils.versions import VersionResolver
+
+logger = logging.getLogger(__name__)
+
+UPDATES = Update.__table__
+CHANGELOGS = Changelog.__table__
+# columns read for each row: the id, the inputs, then the derived columns in DERIVED order,
+# the changelog text is read from the changelogs table and written back by its hash
+INPUTS = ("device", "region", "branch", "filename")
+DERIVED = ("changelog", "version", "type", "product")
+Row = Tuple
+# (id, {column: new value}) of a changed row
+Change = Tuple[int, Dict[str, Optional[str]]]
+# markup of changelogs stored before they were cleaned: raw changelogs are made of paragraphs
+# and line breaks, clean ones can only have tag-like text that was escaped in the raw changelog
+RAW_MARKUP = re.compile(r"</[a-z][a-z0-9]*\s*>|<br\s*/?>", re.IGNORECASE)
+
+# state of the worker processes, set by `_init_worker`
+_resolver: Optional[VersionResolver] = None
+_parser: Optional[ChangelogParser] = None
+
+
+def _init_worker(references: List[Tuple[str, str, str]]):
+    """
+    Set a worker process up
+    :param references: (filename, branch, version) rows of the version resolver
+    """
+    global _resolver, _parser  # pylint: disable=global-statement
+    _resolver = VersionResolver(lambda: references)
+    _parser = ChangelogParser(max_size=4096)
+
+
+def clean_changelog(changelog: Optional[str]) -> Optional[str]:
+    """
+    Clean a stored changelog again if it still contains raw markup,
+    clean changelogs are kept as they are
+    :param changelog: stored changelog text
+    :return: clean changelog text
+    """
+    if changelog and RAW_MARKUP.search(changelog):
+        return _parser.parse(changelog)
+    return changelog
+
+
+def derive(row: Row) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Recompute the derived columns of a row
+    :param row: the row id, inputs and derived columns
+    :return: the derived columns that have changed, None if none of them has
+    """
+    _, device, region, branch, filename, *old = row
+    version = _resolver.resolve(filename, branch)
+    new = (
+        clean_changelog(old[0]),
+        # versions that can't be resolved from the file name come from the API, they're kept
+        version or old[1],
+        "Full" if "patch" not in filename else "Incremental",
+        Device.product_of(device, region),
+    )
+    changes = {
+        column: value
+        for column, value, previous in zip(DERIVED, new, old)
+        if value != previous
+    }
+    return changes or None
+
+
+def derive_chunk(rows: Sequence[Row]) -> List[Change]:
+    """
+    Recompute the derived columns of a chunk of rows, runs in the worker processes
+    :param rows: rows of the chunk
+    :return: the changes of the changed rows
+    """
+    changes = []
+    for row in rows:
+        changed = derive(row)
+        if changed:
+            changes.append((row[0], changed))
+    return changes
+
+
+@dataclass
+class ReprocessReport:
+    """
+    Reprocess run results
+    :param rows: int - number of processed rows
+    :param changed: int - number of changed rows
+    :param columns: Counter - number of changes of each derived column
+    :param elapsed: float - run time in seconds
+    :param resumed_from: int - id after which the run has started
+    """
+
+    rows: int = 0
+    changed: int = 0
+    columns: Counter = field(default_factory=Counter)
+    elapsed: float = 0
+    resumed_from: int = 0
+
+
+class Reprocessor:
+    """
+    Recomputes the derived columns of all stored updates
+
+    :attr: `chunk_size`: int - number of rows read, processed and written at once
+    :attr: `workers`: int - number of worker processes, rows are processed inline if it's 1
+    :attr: `dry_run`: bool - count the changes without writing them
+    :attr: `checkpoint`: Path - file that keeps the last written id of an interrupted run
+    :attr: `progress_interval`: float - seconds between progress reports
+    :meth: `run` Reprocess the rows that haven't been processed yet.
+    """
+
+    CHECKPOINT: str = ".reprocess_checkpoint.json"
+
+    def __init__(
+        self,
+        chunk_size: int = 2000,
+        workers: int = 0,
+        dry_run: bool = False,
+        checkpoint: Optional[Path] = None,
+        progress_interval: float = 5,
+    ):
+        """
+        Reprocessor class constructor
+        :param chunk_size: number of rows read, processed and written at once
+        :param workers: number of worker processes, defaults to the number of CPUs
+        :param dry_run: count the changes without writing them
+        :param checkpoint: checkpoint file, defaults to one in the work directory
+        :param progress_interval: seconds between progress reports
+        """
+        self.chunk_size: int = chunk_size
+        self.workers: int = workers or os.cpu_count() or 1
+        self.dry_run: bool = dry_run
+        self.checkpoint: Path = checkpoint or WORK_DIR / self.CHECKPOINT
+        self.progress_interval: float = progress_interval
+        self._engine = get_engine()
+
+    def _load_checkpoint(self) -> int:
+        try:
+            return json.loads(self.checkpoint.read_text())["last_id"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return 0
+
+    def _save_checkpoint(self, last_id: int):
+        tmp = self.checkpoint.with_name(f"{self.checkpoint.name}.tmp")
+        tmp.write_text(json.dumps({"last_id": last_id}))
+        os.replace(tmp, self.checkpoint)
+
+    def _chunks(self, after: int) -> Iterator[List[Row]]:
+        """
+        Stream the updates table in id order chunks, each chunk is read with a keyset query
+        :param after: id after which rows are read
+        """
+        columns = (
+            [UPDATES.c.id]
+            + [UPDATES.c[name] for name in INPUTS]
+            + [CHANGELOGS.c.text]
+            + [UPDATES.c[name] for name in DERIVED[1:]]
+        )
+        query = (
+            select(*columns)
+            .select_from(
+                UPDATES.outerjoin(
+                    CHANGELOGS, UPDATES.c.changelog_hash == CHANGELOGS.c.hash
+                )
+            )
+            .where(UPDATES.c.id > bindparam("after"))
+            .order_by(UPDATES.c.id)
+            .limit(self.chunk_size)
+        )
+        while True:
+            with self._engine.connect() as connection:
+                rows = [
+                    tuple(row) for row in connection.execute(query, {"after": after})
+                ]
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+    def _write(self, changes: List[Change]):
+        """
+        Write the changes of a chunk in one transaction. Rows are grouped by their changed
+        columns, so the latest updates triggers only run for type and product changes.
+        New changelogs are stored by their hash, and the rows point to it.
+        :param changes: the chunk changes
+        """
+        groups: Dict[Tuple[str, ...], List[dict]] = {}
+        changelogs: Dict[str, str] = {}
+        for update_id, values in changes:
+            values = dict(values)
+            if "changelog" in values:
+                changelog = values.pop("changelog")
+                values["changelog_hash"] = changelog_hash(changelog)
+                changelogs[values["changelog_hash"]] = changelog
+            groups.setdefault(tuple(sorted(values)), []).append(
+                {"update_id": update_id, **values}
+            )
+        with self._engine.begin() as connection:
+            if changelogs:
+                connection.execute(
+                    insert(CHANGELOGS).on_conflict_do_nothing(),
+                    [{"hash": key, "text": value} for key, value in changelogs.items()],
+                )
+            for columns, rows in groups.items():
+                statement = (
+                    UPDATES.update()
+                    .where(UPDATES.c.id == bindparam("update_id"))
+                    .values({column: bindparam(column) for column in columns})
+                )
+                connection.execute(statement, rows)
+
+    def _delete_unused_changelogs(self):
+        """Delete the changelogs that no update points to anymore"""
+        with self._engine.begin() as connection:
+            deleted = connection.execute(
+                text(
+                    "DELETE FROM changelogs WHERE hash NOT IN "
+                    "(SELECT changelog_hash FROM updates)"
+                )
+            ).rowcount
+        logger.info(f"Deleted {deleted} unused changelogs")
+
+    def _complete(
+        self, report: ReprocessReport, last_id: int, size: int, changes: List[Change]
+    ):
+        """Write a processed chunk and move the checkpoint past it"""
+        if changes and not self.dry_run:
+            with METRICS.span("reprocess_write"):
+                self._write(changes)
+        if not self.dry_run:
+            self._save_checkpoint(last_id)
+        report.rows += size
+        report.changed += len(changes)
+        for _, values in changes:
+            report.columns.update(values.keys())
+        METRICS.count("reprocessed_rows", size)
+        METRICS.count("reprocessed_changes", len(changes))
+
+    def _log_progress(self, report: ReprocessReport, total: int, start: float):
+        elapsed = monotonic() - start
+        rate = report.rows / elapsed if elapsed else 0
+        remaining = (total - report.rows) / rate if rate else 0
+        logger.info(
+            f"Reprocessed {report.rows}/{total} rows ({report.rows / max(total, 1):.0%}), "
+            f"{report.changed} changed, {rate:.0f} rows/s, {remaining:.0f} s remaining"
+        )
+
+    def _resume(self, restart: bool) -> Tuple[int, int]:
+        """
+        Get the id to start after, from the checkpoint of an interrupted run
+        :param restart: ignore the checkpoint and start over
+        :return: the id after which rows are processed, and the number of rows left
+        """
+        after = 0 if restart else self._load_checkpoint()
+        with self._engine.connect() as connection:
+            total = connection.execute(
+                select(func.count()).select_from(UPDATES).where(UPDATES.c.id > after)
+            ).scalar()
+        if after:
+            logger.info(f"Resuming after update {after}, {total} rows left")
+        return after, total
+
+    def _start_workers(self) -> Optional[ProcessPoolExecutor]:
+        """
+        Start the worker processes, or set this process up when rows are processed inline
+        :return: the workers pool, None if there's a single worker
+        """
+        references = [tuple(row) for row in get_reference_versions()]
+        if self.workers > 1:
+            return new_process_pool(
+                self.workers, initializer=_init_worker, initargs=(references,)
+            )
+        _init_worker(references)
+        return None
+
+    def _process(
+        self,
+        report: ReprocessReport,
+        pool: Optional[ProcessPoolExecutor],
+        total: int,
+        start: float,
+    ):
+        """
+        Process and write the chunks after the id the run has resumed from
+        :param report: the run report, updated as chunks are completed
+        :param pool: the workers pool, None to process rows inline
+        :param total: number of rows to process
+        :param start: run start time
+        """
+        last_report = monotonic()
+        # chunks are read ahead while the workers process the previous ones,
+        # and completed in order, so the checkpoint never skips an unwritten chunk
+        pending: Deque[Tuple[int, int, Future]] = deque()
+        for rows in self._chunks(report.resumed_from):
+            if pool is None:
+                self._complete(report, rows[-1][0], len(rows), derive_chunk(rows))
+            else:
+                pending.append(
+                    (rows[-1][0], len(rows), pool.submit(derive_chunk, rows))
+                )
+                if len(pending) >= self.workers * 2:
+                    last_id, size, future = pending.popleft()
+                    self._complete(report, last_id, size, future.result())
+            if monotonic() - last_report >= self.progress_interval:
+                self._log_progress(report, total, start)
+                last_report = monotonic()
+        while pending:
+            last_id, size, future = pending.popleft()
+            self._complete(report, last_id, size, future.result())
+
+    def _finish(self, report: ReprocessReport):
+        """Delete the changelogs that have been replaced, and the checkpoint of the finished run"""
+        if self.dry_run:
+            return
+        if report.columns["changelog"]:
+            self._delete_unused_changelogs()
+        self.checkpoint.unlink(missing_ok=True)
+
+    def run(self, restart: bool = False) -> ReprocessReport:
+        """
+        Reprocess the rows that haven't been processed yet
+        :param restart: ignore the checkpoint of an interrupted run and start over
+        :return: ReprocessReport object
+        """
+        start = monotonic()
+        after, total = self._resume(restart)
+        report = ReprocessReport(resumed_from=after)
+        pool = self._start_workers()
+        try:
+            self._process(report, pool, total, start)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        self._finish(report)
+        report.elapsed = monotonic() - start
+        self._log_progress(report, total, start)
+        return report
+
+
+def run(argv: Optional[Sequence[str]] = None) -> ReprocessReport:
+    """
+    Reprocess command entry point
+    :param argv: command line arguments
+    :return: ReprocessReport object
+    """
+    parser = ArgumentParser(prog="python -m op_tracker reprocess", description=__doc__)
+    parser.add_argument("--chunk-size", type=int, default=2000, help="rows per chunk")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="don't write the changes"
+    )
+    args = parser.parse_args(argv)
+    # progress is reported on the console as well as in the log file
+    handler = StreamHandler(stderr)
+    handler.setFormatter(FORMATTER)
+    logger.addHandler(handler)
+    report = Reprocessor(args.chunk_size, args.workers, args.dry_run).run(args.restart)
+    columns = ", ".join(f"{column} {count}" for column, count in report.columns.items())
+    logger.info(
+        f"Reprocessed {report.rows} rows in {report.elapsed:.1f} s, {report.changed} "
+        f"{'would change' if args.dry_run else 'changed'} ({columns or 'no changes'})"
+    )
+    return report
@@ -4,60 +4,292 @@ This module is the entry point for the tracker script and contains the controlle
 """
 import asyncio
 import logging
+from collections import Counter
 from dataclasses import asdict
+from typing import Awaitable, Collection, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import sessionmaker
 
 from op_tracker import CONFIG, WORK_DIR
+from op_tracker.common.api_client.transport import close_transport
+from op_tracker.common.database import get_engine
+from op_tracker.common.database.async_db import close_async_db, get_async_db
 from op_tracker.common.database.helpers import export_latest
+from op_tracker.common.database.models.update import Update
 from op_tracker.official.api_client.api_client import APIClient
 from op_tracker.official.models.device import Device
+from op_tracker.official.scheduler import PollPolicy, PollScheduler
+from op_tracker.utils.changelog import close_changelog_parser
 from op_tracker.utils.data_manager import DataManager
 from op_tracker.utils.git import git_commit_push
+from op_tracker.utils.metrics import METRICS
 from op_tracker.utils.telegram import TelegramBot
 
 logger = logging.getLogger(__name__)
 
 
-async def check_update(device: Device, region, api):
+async def check_update(
+    device: Device,
+    region,
+    api,
+    limit: asyncio.Semaphore,
+    region_limit: asyncio.Semaphore,
+):
     """Asynchronously checks device updates"""
-    updates: list = await api.get_updates(device, region)
+    async with region_limit, limit:
+        updates: list = await api.get_updates(device, region)
     logger.debug(updates)
     return [i for i in updates] if updates else None
 
 
-async def main():
-    """Main function"""
-    new_updates: list = []
+async def fetch_devices(api: APIClient, limit: asyncio.Semaphore) -> List[Device]:
+    """
+    Fetch a region's devices list
+    :param api: the region API client
+    :param limit: global requests semaphore shared by all regions
+    :return: a list of the region devices
+    """
+    logger.info(f"Fetching {api.region}")
+    async with limit:
+        with METRICS.span("fetch_devices", region=api.region):
+            devices: list = await api.get_devices() or []
+    METRICS.count("devices", len(devices), region=api.region)
+    logger.debug(f"{api.region} devices: {devices}")
+    return devices
+
+
+async def check_region(checks: List[Awaitable]) -> Tuple[list, List[Update]]:
+    """
+    Check a region's devices for updates, then write the region's new updates
+    :param checks: the region devices update checks
+    :return: a tuple of the update checks results and the updates that have been skipped
+    """
+    try:
+        results: list = await asyncio.gather(*checks)
+    finally:
+        skipped: List[Update] = await get_async_db().flush()
+    return results, skipped
+
+
+def log_outcomes(apis: List[APIClient]):
+    """
+    Log a summary of each region devices requests outcomes
+    :param apis: the regions API clients
+    """
+    for api in apis:
+        statuses = Counter(outcome.status for outcome in api.outcomes.values())
+        stats = api.caller.stats
+        logger.info(
+            f"{api.region}: {statuses['ok']} devices ok, {statuses['failed']} failed, "
+            f"{statuses['timeout']} timed out ({stats.retries} retries, {stats.hedges} hedged)"
+        )
+        for code, outcome in api.outcomes.items():
+            if outcome.status != "ok":
+                logger.debug(f"{api.region} {code}: {outcome}")
+
+
+def new_scheduler(policy: PollPolicy) -> PollScheduler:
+    """
+    Create a polling scheduler with its own session, it loads the devices polling state
+    :param policy: scheduler settings
+    :return: PollScheduler object
+    """
+    return PollScheduler(sessionmaker(bind=get_engine())(), policy)
+
+
+async def get_scheduler() -> Optional[PollScheduler]:
+    """Get a polling scheduler if adaptive polling is enabled in the config"""
+    config: dict = CONFIG.get("polling") or {}
+    if not config.get("enabled"):
+        return None
+    return await get_async_db().write(new_scheduler, PollPolicy.from_config(config))
+
+
+async def record_polls(
+    scheduler: PollScheduler, polled: List[Tuple[dict, APIClient, Device]]
+):
+    """
+    Record the outcome of the polled devices and save their polling state.
+    Devices whose request didn't start or was cut by the run deadline weren't polled,
+    they're left due for the next run.
+    :param scheduler: the polling scheduler
+    :param polled: (region, API client, device) tuples of the selected devices
+    """
+    for _, api, device in polled:
+        outcome = api.outcomes.get(device.code)
+        if outcome is None or outcome.status == "timeout":
+            continue
+        scheduler.record(api.region, device.code, api.fingerprints.get(device.code))
+    await get_async_db().write(scheduler.save)
+
+
+def set_deadline(apis: List[APIClient]):
+    """
+    Give the API clients the run deadline, if a run timeout is set in the config
+    :param apis: the regions API clients
+    """
+    run_timeout = CONFIG.get("run_timeout")
+    if not run_timeout:
+        return
+    # requests still pending when the run time is up are given up, the run finishes on time
+    deadline = asyncio.get_running_loop().time() + run_timeout
+    for api in apis:
+        api.deadline = deadline
+
+
+def select_devices(
+    scheduler: Optional[PollScheduler],
+    regions: List[dict],
+    apis: List[APIClient],
+    regions_devices: List[List[Device]],
+) -> List[Tuple[dict, APIClient, Device]]:
+    """
+    Get the devices to check for updates, all of them unless adaptive polling is enabled
+    :param scheduler: the polling scheduler, None if adaptive polling is disabled
+    :param regions: regions information from regions.yml
+    :param apis: the regions API clients
+    :param regions_devices: the devices of each region
+    :return: a list of (region, API client, device) tuples
+    """
+    candidates = [
+        (api.region, device.code, (region, api, device))
+        for region, api, devices in zip(regions, apis, regions_devices)
+        for device in devices
+    ]
+    if scheduler:
+        return scheduler.select(candidates)
+    return [candidate for _, _, candidate in candidates]
+
+
+async def check_updates(
+    polled: List[Tuple[dict, APIClient, Device]],
+    apis: List[APIClient],
+    limit: asyncio.Semaphore,
+) -> Tuple[list, List[Update]]:
+    """
+    Check devices for updates, each region's new updates are written once its devices are done
+    :param polled: (region, API client, device) tuples of the devices to check
+    :param apis: the regions API clients
+    :param limit: global requests semaphore shared by all regions
+    :return: a tuple of the update checks results and the updates that have been skipped
+    """
+    region_limits: Dict[str, asyncio.Semaphore] = {
+        api.region: asyncio.Semaphore(CONFIG.get("region_concurrency", 10))
+        for api in apis
+    }
+    regions_checks: Dict[str, list] = {api.region: [] for api in apis}
+    for region, api, device in polled:
+        regions_checks[api.region].append(
+            check_update(device, region, api, limit, region_limits[api.region])
+        )
+    with METRICS.span("check_updates"):
+        regions_results = await asyncio.gather(
+            *[check_region(checks) for checks in regions_checks.values()]
+        )
+    results: list = []
+    skipped: List[Update] = []
+    for region_results, region_skipped in regions_results:
+        results.extend(region_results)
+        skipped.extend(region_skipped)
+    return results, skipped
+
+
+def get_new_updates(results: list, skipped: Set[str]) -> List[Update]:
+    """
+    Get the latest new update of each device update check
+    :param results: the update checks results
+    :param skipped: md5 of the updates that clash with stored ones, they haven't been written
+    :return: a list of the new updates
+    """
+    new_updates: List[Update] = []
+    for result in results:
+        result = [update for update in result or [] if update.md5 not in skipped]
+        if result:
+            new_updates.append(result[0])
+    return new_updates
+
+
+async def notify(new_updates: List[Update]) -> Optional[asyncio.Future]:
+    """
+    Queue the new updates Telegram messages, and send them in the background
+    :param new_updates: a list of the new updates
+    :return: the sending task, None if Telegram notifications aren't configured
+    """
+    if not CONFIG.get("tg_bot_token"):
+        return None
+    bot: TelegramBot = TelegramBot(
+        CONFIG.get("tg_bot_token"),
+        CONFIG.get("tg_chat"),
+        "website",
+        api_url=CONFIG.get("tg_api_url", "https://api.telegram.org"),
+        rate_limit=CONFIG.get("tg_rate_limit", 20),
+        digest=CONFIG.get("tg_digest"),
+        max_retry_after=CONFIG.get("tg_max_retry_after", 60),
+    )
+    await bot.post_updates(new_updates)
+    return asyncio.ensure_future(bot.drain())
+
+
+async def main(region_codes: Optional[Collection[str]] = None):
+    """
+    Main function
+    :param region_codes: codes of the regions to check, all regions by default
+    """
+    changed_files: list = []
+    skipped: Set[str] = set()
     regions = DataManager.read_file(f"{WORK_DIR}/data/official/regions.yml")
-    for region in regions:
-        region_code = region.get("code")
-        logger.info(f"Fetching {region_code}")
-        api: APIClient = APIClient(region_code)
-        devices: list = await api.get_devices()
-        logger.debug(f"{region_code} devices: {devices}")
-        DataManager.write_file(
-            f"{WORK_DIR}/data/official/{region_code}/{region_code}.yml",
-            [asdict(i) for i in devices],
+    if region_codes is not None:
+        regions = [region for region in regions if region.get("code") in region_codes]
+    apis: List[APIClient] = [APIClient(region.get("code")) for region in regions]
+    set_deadline(apis)
+    # All regions share one requests pool, results are handled in regions.yml order
+    limit = asyncio.Semaphore(CONFIG.get("max_concurrency", 20))
+    try:
+        regions_devices: List[List[Device]] = await asyncio.gather(
+            *[fetch_devices(api, limit) for api in apis]
         )
-        tasks = [
-            asyncio.ensure_future(check_update(device, region, api))
-            for device in api.devices
-        ]
-        results = await asyncio.gather(*tasks)
-        for result in results:
-            if result:
-                new_updates.append(result[0])
-        await api.close()
+        # devices lists are saved before update checks fill their region and product
+        for api, devices in zip(apis, regions_devices):
+            region_file = f"{WORK_DIR}/data/official/{api.region}/{api.region}.yml"
+            if DataManager.write_file(region_file, [asdict(i) for i in devices]):
+                changed_files.append(region_file)
+        scheduler: Optional[PollScheduler] = await get_scheduler()
+        polled = select_devices(scheduler, regions, apis, regions_devices)
+        results, regions_skipped = await check_updates(polled, apis, limit)
+        skipped.update(update.md5 for update in regions_skipped)
+    finally:
+        for api in apis:
+            await api.close()
+        skipped.update(update.md5 for update in await get_async_db().flush())
+    log_outcomes(apis)
+    if scheduler:
+        await record_polls(scheduler, polled)
+    # updates that clash with stored ones haven't been written, they aren't new
+    new_updates = get_new_updates(results, skipped)
     if new_updates:
         logger.info(f"New updates: {new_updates}")
-        bot: TelegramBot = TelegramBot(
-            CONFIG.get("tg_bot_token"), CONFIG.get("tg_chat"), "website"
-        )
-        bot.post_updates(new_updates)
-    export_latest()
-    await git_commit_push()
+    # messages are sent in the background while data files are exported and pushed
+    notifications = await notify(new_updates)
+    try:
+        changed_files.extend(export_latest())
+        logger.info(f"Changed files: {changed_files}")
+        METRICS.count("changed_files", len(changed_files))
+        await git_commit_push(changed_files)
+    finally:
+        # the messages don't depend on the data files, they're sent even if pushing failed
+        if notifications:
+            logger.info(f"Sent {await notifications} Telegram messages")
 
 
 def run():
     """asyncio trigger function"""
+    METRICS.configure(CONFIG.get("metrics") or {})
     event_loop = asyncio.get_event_loop()
-    event_loop.run_until_complete(main())
+    try:
+        with METRICS.span("run"):
+            event_loop.run_until_complete(main())
+    finally:
+        event_loop.run_until_complete(close_transport())
+        close_changelog_parser()
+        close_async_db()
+        METRICS.write()
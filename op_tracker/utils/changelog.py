@@ -0,0 +1,257 @@
+"""
+Changelog parsing engine
+
+Converts OnePlus API changelog HTML into clean text using a streaming parser
+that produces the same text as `BeautifulSoup(html, "html.parser").get_text(separator="\\n")`,
+caches the results by content hash, and runs large documents in a worker processes pool.
+"""
+import asyncio
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from html import unescape
+from html.entities import html5
+from html.parser import HTMLParser
+from os import cpu_count
+from typing import Dict, List, Optional
+
+from op_tracker import CONFIG
+from op_tracker.utils.metrics import METRICS
+from op_tracker.utils.processes import new_process_pool
+
+# whitespace characters that BeautifulSoup collapses in whitespace-only strings
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+# tags whose text isn't part of the document text
+SKIPPED_TAGS = {"script", "style", "template"}
+# tags whose whitespace is preserved
+PRESERVED_TAGS = {"pre", "textarea"}
+
+MULTIPLE_SPACES = re.compile(r"\s\s+")
+SPACED_BULLET = re.compile(" •")
+TRAILING_SPACES = re.compile(r"\s+$")
+
+
+class TextExtractor(HTMLParser):
+    """
+    HTML parser that collects the document text strings
+    :attr: `strings`: list - text strings of the document, in order
+    """
+
+    def __init__(self):
+        """TextExtractor class constructor"""
+        super().__init__(convert_charrefs=False)
+        self.strings: List[str] = []
+        self._data: List[str] = []
+        self._skipped: int = 0
+        self._preserved: int = 0
+
+    def _end_data(self, keep: bool = True):
+        """Close the current string, whitespace-only strings become a single space or newline"""
+        if not self._data:
+            return
+        text = "".join(self._data)
+        self._data = []
+        if not self._preserved and all(char in ASCII_SPACES for char in text):
+            text = "\n" if "\n" in text else " "
+        if keep and not self._skipped:
+            self.strings.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        self._end_data()
+        if tag in SKIPPED_TAGS:
+            self._skipped += 1
+        elif tag in PRESERVED_TAGS:
+            self._preserved += 1
+
+    def handle_endtag(self, tag):
+        self._end_data()
+        if tag in SKIPPED_TAGS:
+            self._skipped = max(self._skipped - 1, 0)
+        elif tag in PRESERVED_TAGS:
+            self._preserved = max(self._preserved - 1, 0)
+
+    def handle_startendtag(self, tag, attrs):
+        self._end_data()
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_entityref(self, name):
+        self._data.append(html5.get(f"{name};", f"&{name}"))
+
+    def handle_charref(self, name):
+        self._data.append(unescape(f"&#{name};"))
+
+    def handle_comment(self, data):
+        self._end_data()
+
+    def handle_decl(self, decl):
+        self._end_data()
+
+    def handle_pi(self, data):
+        self._end_data()
+
+    def unknown_decl(self, data):
+        self._end_data()
+        if data.upper().startswith("CDATA["):
+            self._data.append(data[len("CDATA[") :])
+            self._end_data()
+
+    def close(self):
+        super().close()
+        self._end_data()
+
+
+def html_to_text(html: str, separator: str = "\n") -> str:
+    """
+    Get the text of an HTML document
+    :param html: HTML document
+    :param separator: string used to join the document text strings
+    :return: document text
+    """
+    parser = TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return separator.join(parser.strings)
+
+
+def clean_changelog(html: str) -> str:
+    """
+    Parse the changelog html and return clean string
+    :param html: OnePlus API response changelog
+    :return: A clean string of changelog html
+    """
+    changelog: str = html_to_text(html)
+    changelog = MULTIPLE_SPACES.sub(" ", changelog)
+    changelog = SPACED_BULLET.sub("\n•", changelog)
+    changelog = TRAILING_SPACES.sub("", changelog)
+    return changelog.replace("\xa0", "")
+
+
+class ChangelogParser:
+    """
+    Memoizing changelog parser
+
+    Results are cached by the changelog content hash with LRU eviction, changelogs larger
+    than `offload_size` are parsed in a worker processes pool when parsed asynchronously.
+    :attr: `max_size`: int - maximum number of cached changelogs
+    :attr: `offload_size`: int - minimum changelog length that is parsed in the workers pool
+    :attr: `hits`: int - number of changelogs served from the cache
+    :attr: `misses`: int - number of parsed changelogs
+    :meth: `parse` Parse a changelog in the current thread.
+    :meth: `parse_async` Parse a changelog without blocking the event loop.
+    :meth: `close` Shutdown the workers pool.
+    """
+
+    def __init__(
+        self, max_size: int = 1024, offload_size: int = 4096, workers: int = 0
+    ):
+        """
+        ChangelogParser class constructor
+        :param max_size: maximum number of cached changelogs
+        :param offload_size: minimum changelog length that is parsed in the workers pool
+        :param workers: number of worker processes, defaults to the number of CPUs (up to 4)
+        """
+        self.max_size: int = max_size
+        self.offload_size: int = offload_size
+        self.workers: int = workers or min(cpu_count() or 1, 4)
+        self.hits: int = 0
+        self.misses: int = 0
+        self._cache: OrderedDict = OrderedDict()
+        self._in_flight: Dict[bytes, asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @staticmethod
+    def _key(html: str) -> bytes:
+        return blake2b(html.encode("utf-8"), digest_size=16).digest()
+
+    def _get(self, key: bytes) -> Optional[str]:
+        """Get a cached changelog, marking it as recently used"""
+        changelog = self._cache.get(key)
+        if changelog is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            METRICS.count("changelog_cache_hits")
+        return changelog
+
+    def _put(self, key: bytes, changelog: str):
+        """Cache a changelog, evicting the least recently used one if the cache is full"""
+        self.misses += 1
+        METRICS.count("changelog_cache_misses")
+        self._cache[key] = changelog
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def parse(self, html: str) -> str:
+        """
+        Parse a changelog
+        :param html: OnePlus API response changelog
+        :return: A clean string of changelog html
+        """
+        key = self._key(html)
+        changelog = self._get(key)
+        if changelog is None:
+            changelog = clean_changelog(html)
+            self._put(key, changelog)
+        return changelog
+
+    async def parse_async(self, html: str) -> str:
+        """
+        Parse a changelog, large ones are parsed in the workers pool
+        :param html: OnePlus API response changelog
+        :return: A clean string of changelog html
+        """
+        key = self._key(html)
+        changelog = self._get(key)
+        if changelog is not None:
+            return changelog
+        if len(html) < self.offload_size:
+            changelog = clean_changelog(html)
+            self._put(key, changelog)
+            return changelog
+        # the same changelog may be requested by several devices at once
+        if key in self._in_flight:
+            self.hits += 1
+            METRICS.count("changelog_cache_hits")
+            return await asyncio.shield(self._in_flight[key])
+        if self._pool is None:
+            self._pool = new_process_pool(self.workers)
+        future = asyncio.get_running_loop().run_in_executor(
+            self._pool, clean_changelog, html
+        )
+        self._in_flight[key] = future
+        try:
+            changelog = await asyncio.shield(future)
+        finally:
+            del self._in_flight[key]
+        self._put(key, changelog)
+        return changelog
+
+    def close(self):
+        """Shutdown the workers pool"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+_parser: Optional[ChangelogParser] = None
+
+
+def get_changelog_parser() -> ChangelogParser:
+    """Get the shared changelog parser, created from the config on first use"""
+    global _parser  # pylint: disable=global-statement
+    if _parser is None:
+        _parser = ChangelogParser(
+            max_size=CONFIG.get("changelog_cache_size", 1024),
+            workers=CONFIG.get("changelog_workers", 0),
+        )
+    return _parser
+
+
+def close_changelog_parser():
+    """Shutdown the shared changelog parser workers"""
+    global _parser  # pylint: disable=global-statement
+    if _parser is not None:
+        _parser.close()
+        _parser = None
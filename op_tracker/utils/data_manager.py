@@ -1,13 +1,21 @@
 """
 OnePlus Updates Tracker Data Management class
 """
+import json
+import os
+from contextlib import contextmanager
 from glob import glob
+from hashlib import sha256
 from pathlib import Path
-from shutil import copyfile
-
-import yaml
+from tempfile import mkstemp
+from typing import Dict, List, Optional, Set, Tuple
 
 from op_tracker.utils.helpers import is_newer_datetime
+from op_tracker.utils.metrics import METRICS
+from op_tracker.utils.serializers import get_serializer
+
+# the snapshot store is built on the data manager, it's imported when it's needed
+# pylint: disable=import-outside-toplevel
 
 
 class DataManager:
@@ -16,17 +24,28 @@ class DataManager:
 
     :attr: `data`: a dictionary of the data
     :attr: `file`: the file containing the data path.
-    :attr: `backup_file`: the backup file path.
     :meth: `save` a wrapper function to call `write_file` method with `data` and `file` parameters.`
-    :meth: `write_file` A method that writes the data to YAML file.
-    :meth: `read_file` A method that reads the data from YAML file.
-    :meth: `backup` A method for backing up the `file` into `backup_file`.
-    :meth: `backup_all` A method for backing up all files in `file` parent directory.
+    :meth: `write_file` A method that writes the data to a file if its content has changed.
+    :meth: `read_file` A method that reads the data from a file.
+    :meth: `batch` A context manager that saves the written files manifests once at its end.
+    :meth: `backup` A method for taking a snapshot of `file` in the snapshot store.
+    :meth: `backup_all` A method for taking snapshots of all files matching a pattern.
     :meth: `is_new_version` A method for checking if data (of update)
-     is a newer than the backup (old) data.
-    :meth: `diff_dicts` A method for comparing two directories and return the new changes only.
+     is a newer than the last snapshot (old) data.
+    :meth: `diff_dicts` A method for comparing data with its last snapshot
+     and return the new changes only.
+    :meth: `content_hash` A method that gets the content hash of a file.
     """
 
+    # name of the sidecar file that stores the hashes of written files in each directory
+    MANIFEST: str = ".manifest.json"
+    # manifests cache, shared by all instances like the class methods that write files:
+    # resolved directory -> (manifest file mtime when it was read or saved, manifest),
+    # a manifest that has been saved by another process since then is read again
+    _manifests: Dict[Path, Tuple[Optional[int], dict]] = {}
+    # directories whose manifest is saved at the end of the current batch, None outside a batch
+    _deferred: Optional[Set[Path]] = None
+
     def __init__(self, data: dict, file):
         """
         DataManager constructor
@@ -35,55 +54,194 @@ class DataManager:
         """
         self.data: dict = data
         self.file: Path = Path(file)
-        self.backup_file: Path = Path(f"{self.file}.bak")
         if not self.file.exists():
             self.file.parent.mkdir(parents=True, exist_ok=True)
             self.file.touch()
 
-    def save(self):
+    def save(self) -> bool:
         """
         Saves the data into the file
-        :return:
+        :return: True if the file content has changed
         """
-        self.write_file(self.file, self.data)
+        return self.write_file(self.file, self.data)
 
-    @staticmethod
-    def write_file(file, data):
-        """Write data into the file"""
-        with open(f"{file}", "w", encoding="utf-8") as out:
-            yaml.dump(data, out, allow_unicode=True)
+    @classmethod
+    @METRICS.timed("write_file")
+    def write_file(cls, file, data, serializer: Optional[str] = None) -> bool:
+        """
+        Write data into the file, skipping the write if the file already has the same content.
+        The file is replaced atomically so readers never see a partially written file.
+        :param file: file path
+        :param data: data to be written
+        :param serializer: serializer name, chosen by the file extension by default
+        :return: True if the file content has changed
+        """
+        path = Path(file)
+        content: bytes = get_serializer(path, serializer).dumps(data)
+        digest: str = sha256(content).hexdigest()
+        if cls._stored_hash(path) == digest:
+            return False
+        fd, tmp = mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(content)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        stat = path.stat()
+        manifest = cls._load_manifest(path.parent)
+        manifest[path.name] = {
+            "sha256": digest,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        cls._save_manifest(path.parent, manifest)
+        METRICS.count("files_written")
+        METRICS.count("files_written_bytes", len(content))
+        return True
+
+    @classmethod
+    def content_hash(cls, file) -> Optional[str]:
+        """
+        Get the sha256 hash of a file content, cached for files written by :meth:`write_file`
+        :param file: file path
+        :return: sha256 hex digest or None if the file doesn't exist
+        """
+        return cls._stored_hash(Path(file))
+
+    @classmethod
+    def _stored_hash(cls, path: Path) -> Optional[str]:
+        """
+        Get the content hash of a file, from the directory manifest if the file is unchanged since
+        it was written, otherwise by hashing the file.
+        :param path: file path
+        :return: sha256 hex digest or None if the file doesn't exist
+        """
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        entry: dict = cls._load_manifest(path.parent).get(path.name, {})
+        if (
+            entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+        ):
+            return entry.get("sha256")
+        return sha256(path.read_bytes()).hexdigest()
+
+    @classmethod
+    def _manifest_mtime(cls, directory: Path) -> Optional[int]:
+        """Get the modification time of a directory manifest file, None if there's none"""
+        try:
+            return (directory / cls.MANIFEST).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def _load_manifest(cls, directory: Path) -> dict:
+        """Load a directory manifest, cached until its file is saved by another process"""
+        directory = directory.resolve()
+        cached = cls._manifests.get(directory)
+        if cached is not None and (
+            directory in (cls._deferred or ())
+            or cached[0] == cls._manifest_mtime(directory)
+        ):
+            return cached[1]
+        try:
+            manifest = json.loads((directory / cls.MANIFEST).read_text())
+        except (FileNotFoundError, ValueError):
+            manifest = {}
+        cls._manifests[directory] = (cls._manifest_mtime(directory), manifest)
+        return manifest
+
+    @classmethod
+    @contextmanager
+    def batch(cls):
+        """
+        Save the directory manifests once at the end of the block instead of after each
+        written file, for writing many files of the same directory
+        """
+        if cls._deferred is not None:
+            yield
+            return
+        cls._deferred = set()
+        try:
+            yield
+        finally:
+            directories, cls._deferred = cls._deferred, None
+            for directory in directories:
+                cls._save_manifest(directory, cls._manifests[directory][1])
+
+    @classmethod
+    def _save_manifest(cls, directory: Path, manifest: dict):
+        """Save a directory manifest"""
+        directory = directory.resolve()
+        if cls._deferred is not None:
+            cls._deferred.add(directory)
+            return
+        tmp = directory / f"{cls.MANIFEST}.tmp"
+        tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+        os.replace(tmp, directory / cls.MANIFEST)
+        cls._manifests[directory] = (cls._manifest_mtime(directory), manifest)
 
     @staticmethod
-    def read_file(file):
-        """Read data from the file"""
-        with open(file, "r") as yaml_file:
-            return yaml.load(yaml_file, yaml.FullLoader)
+    @METRICS.timed("read_file")
+    def read_file(file, serializer: Optional[str] = None):
+        """
+        Read data from the file
+        :param file: file path
+        :param serializer: serializer name, chosen by the file extension by default
+        """
+        return get_serializer(file, serializer).loads(Path(file).read_bytes())
 
-    def backup(self):
-        """Backup the file up (copy current to backup one)"""
-        copyfile(self.file, self.backup_file)
-        return self.backup_file
+    def backup(self) -> Optional[str]:
+        """
+        Take a snapshot of the file, unchanged content is stored only once
+        :return: the file content hash
+        """
+        from op_tracker.utils.snapshots import get_snapshot_store
+
+        return get_snapshot_store().snapshot(self.file)
 
     @staticmethod
-    def backup_all(directory):
-        """Iterate through all files in a directory and backup them"""
-        for item in glob(directory):
-            copyfile(f"{item}", f"{item}.bak")
-
-    def is_new_version(self):
-        """Check if the version of data is newer than the old data's one"""
-        if "version" in self.data.keys() and self.backup_file.exists():
-            old: dict = self.read_file(self.backup_file)
-            if not old:
-                return True
-            return bool(
-                self.data["version"] != old["version"]
-                and is_newer_datetime(old["updated"], self.data["updated"])
-            )
+    def backup_all(directory) -> List[str]:
+        """
+        Take snapshots of all files matching a pattern
+        :param directory: glob pattern of the files
+        :return: the files that have changed since their last snapshot
+        """
+        from op_tracker.utils.snapshots import get_snapshot_store
+
+        return get_snapshot_store().snapshot_all(
+            item for item in glob(directory) if not Path(item).name.startswith(".")
+        )
+
+    def is_new_version(self) -> bool:
+        """
+        Check if the version of data is newer than the last snapshot one
+        :return: False if the data has no version or the file has no snapshot
+        """
+        from op_tracker.utils.snapshots import get_snapshot_store
+
+        if "version" not in self.data.keys():
+            return False
+        old: Optional[dict] = get_snapshot_store().state(self.file)
+        if old is None:
+            return False
+        if "version" not in old:
+            return True
+        return bool(
+            self.data["version"] != old["version"]
+            and is_newer_datetime(old["updated"], self.data["updated"])
+        )
 
     def diff_dicts(self):
-        """Diff two dictionaries and return the new changes."""
-        old: dict = self.read_file(self.backup_file)
-        if not old:
+        """Diff the data with its last snapshot and return the new changes."""
+        from op_tracker.utils.snapshots import get_snapshot_store
+
+        if get_snapshot_store().state(self.file) is None:
             return {}
-        return {key: value for key, value in self.data.items() if key not in old.keys()}
+        new_keys = set(get_snapshot_store().new_keys(self.file, self.data))
+        return {key: value for key, value in self.data.items() if str(key) in new_keys}
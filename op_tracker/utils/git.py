@@ -2,30 +2,224 @@
 Git helper module
 """
 import logging
-from asyncio import create_subprocess_shell
-from asyncio.subprocess import PIPE, Process
+from asyncio import create_subprocess_exec
+from asyncio.subprocess import PIPE, STDOUT
+from dataclasses import dataclass, field
 from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Iterable, List, Tuple
 
 from op_tracker import CONFIG, WORK_DIR
+from op_tracker.utils.metrics import METRICS
 
+logger = logging.getLogger(__name__)
 
-async def git_commit_push():
-    """Git helper function that adds, commits, and pushes changes"""
-    command: str = (
-        f"git add {WORK_DIR}/data/official/*.yml {WORK_DIR}/data/official/*/*.yml "
-        f"{WORK_DIR}/data/*.yml -f && "
-        f'git -c "user.name=CI" -c "user.email=CI@example.com" '
-        f'commit -m "sync: {datetime.today().strftime("%d-%m-%Y %H:%M:%S")}" && '
-        f'git push -q https://{CONFIG.get("git_oauth_token")}@'
-        f"github.com/androidtrackers/"
-        f"oneplus-updates-tracker.git HEAD:master"
-    )
-    process: Process = await create_subprocess_shell(command, stdin=PIPE, stdout=PIPE)
-    await process.wait()
-    if process.returncode != 0 and process.returncode != 1:
-        stdout = await process.stdout.read()
-        logger = logging.getLogger(__name__)
-        logger.warning(
-            f"Cannot commit and push changes! Error code: {process.returncode}\n"
-            f"Output: {stdout.decode()}"
+
+@dataclass
+class PublishReport:
+    """
+    Git publishing outcome
+    :param staged: int - number of staged files
+    :param committed: bool - whether a commit was created
+    :param pushed: bool - whether commits were pushed
+    :param timings: dict - duration of each git phase in seconds
+    """
+
+    staged: int = 0
+    committed: bool = False
+    pushed: bool = False
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class GitPublisher:
+    """
+    Publishes changed data files: stages the given files and any other changed file
+    under the data directory (like ones left over by a failed run), commits them,
+    and pushes once enough commits are waiting (so several runs can be pushed together).
+
+    The last pushed commit is tracked with a local ref, so pending commits survive between runs,
+    they're pushed by the next run that has nothing to commit, or by the next successful push.
+    Until the publisher has pushed, the ref is fetched from the remote branch.
+    :attr: `repo_dir`: Path - repository working directory
+    :attr: `remote`: str - remote repository URL
+    :attr: `branch`: str - remote branch to push to
+    :attr: `push_every`: int - number of commits to batch before pushing
+    :meth: `changed_data_files` Get the changed files of the data directory.
+    :meth: `publish` Stage, commit and push changed files.
+    """
+
+    PUSHED_REF: str = "refs/op-tracker/pushed"
+
+    def __init__(
+        self, repo_dir, remote: str, branch: str = "master", push_every: int = 1
+    ):
+        """
+        GitPublisher class constructor
+        :param repo_dir: repository working directory
+        :param remote: remote repository URL
+        :param branch: remote branch to push to
+        :param push_every: number of commits to batch before pushing
+        """
+        self.repo_dir: Path = Path(repo_dir)
+        self.remote: str = remote
+        self.branch: str = branch
+        self.push_every: int = max(push_every, 1)
+
+    async def _git(self, *args: str) -> Tuple[int, str]:
+        """
+        Run a git command
+        :param args: git arguments
+        :return: the command return code and output
+        """
+        process = await create_subprocess_exec(
+            "git",
+            "-c",
+            "user.name=CI",
+            "-c",
+            "user.email=CI@example.com",
+            *args,
+            cwd=self.repo_dir,
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=STDOUT,
+        )
+        stdout, _ = await process.communicate()
+        return process.returncode, stdout.decode(errors="replace").replace(
+            self.remote, "<remote>"
         )
+
+    async def pending_commits(self) -> int:
+        """
+        Number of commits that haven't been pushed yet
+        :return: number of commits, 0 if they can't be counted
+        """
+        code, output = await self._git(
+            "rev-list", "--count", f"{self.PUSHED_REF}..HEAD"
+        )
+        if code != 0:
+            # nothing has been pushed by the publisher yet, count against the remote branch
+            code, output = await self._count_unfetched()
+        if code != 0:
+            logger.warning(
+                f"Cannot count pending commits! Error code: {code}\nOutput: {output}"
+            )
+            return 0
+        return int(output.strip())
+
+    async def _count_unfetched(self) -> Tuple[int, str]:
+        """
+        Fetch the remote branch head as the pushed commit, and count the commits after it
+        :return: the command return code and output (the number of commits)
+        """
+        remote_ref = f"refs/heads/{self.branch}"
+        code, output = await self._git(
+            "ls-remote", "--exit-code", self.remote, remote_ref
+        )
+        if code == 2:
+            # the remote branch doesn't exist yet, the whole history is pending
+            return await self._git("rev-list", "--count", "HEAD")
+        if code == 0:
+            code, output = await self._git(
+                "fetch", "-q", self.remote, f"+{remote_ref}:{self.PUSHED_REF}"
+            )
+        if code != 0:
+            return code, output
+        return await self._git("rev-list", "--count", f"{self.PUSHED_REF}..HEAD")
+
+    async def changed_data_files(self) -> List[str]:
+        """Modified, deleted and untracked (but not ignored) files of the data directory"""
+        code, output = await self._git(
+            "ls-files",
+            "-z",
+            "--modified",
+            "--others",
+            "--exclude-standard",
+            "--",
+            "data",
+        )
+        if code != 0:
+            logger.warning(
+                f"Cannot list changed files! Error code: {code}\nOutput: {output}"
+            )
+            return []
+        return [file for file in output.split("\0") if file]
+
+    @METRICS.timed("git_publish")
+    async def publish(self, files: Iterable[str]) -> PublishReport:
+        """
+        Stage, commit and (if enough commits are pending) push changed files
+        :param files: paths of the files that have changed during the run
+        :return: PublishReport object
+        """
+        report = PublishReport()
+        start = perf_counter()
+        files = sorted(
+            {str(file) for file in files}.union(await self.changed_data_files())
+        )
+        if files:
+            code, output = await self._git("add", "-f", "--", *files)
+            report.timings["add"] = perf_counter() - start
+            if code != 0:
+                logger.warning(
+                    f"Cannot stage changes! Error code: {code}\nOutput: {output}"
+                )
+                return report
+            report.staged = len(files)
+
+            start = perf_counter()
+            code, output = await self._git(
+                "commit",
+                "-m",
+                f'sync: {datetime.today().strftime("%d-%m-%Y %H:%M:%S")}',
+            )
+            report.timings["commit"] = perf_counter() - start
+            report.committed = code == 0
+            if code not in (0, 1):
+                logger.warning(
+                    f"Cannot commit changes! Error code: {code}\nOutput: {output}"
+                )
+                return report
+        else:
+            logger.info("No changed files, skipping git commit")
+
+        pending = await self.pending_commits()
+        # without a new commit the batch doesn't grow, waiting commits are pushed right away
+        if pending and (pending >= self.push_every or not report.committed):
+            start = perf_counter()
+            code, output = await self._git(
+                "push", "-q", self.remote, f"HEAD:{self.branch}"
+            )
+            report.timings["push"] = perf_counter() - start
+            if code == 0:
+                report.pushed = True
+                await self._git("update-ref", self.PUSHED_REF, "HEAD")
+            else:
+                logger.warning(
+                    f"Cannot push changes! Error code: {code}\nOutput: {output}"
+                )
+        elif pending:
+            logger.info(f"{pending} commits waiting, pushing every {self.push_every}")
+        for phase, seconds in report.timings.items():
+            METRICS.observe(f"git_{phase}", seconds)
+        timings = ", ".join(
+            f"{phase} {seconds:.2f}s" for phase, seconds in report.timings.items()
+        )
+        logger.info(
+            f"Git: staged {report.staged} files, committed: {report.committed}, "
+            f"pushed: {report.pushed}, timings: {timings}"
+        )
+        return report
+
+
+async def git_commit_push(files: Iterable[str]) -> PublishReport:
+    """Git helper function that adds, commits, and pushes changed files"""
+    publisher = GitPublisher(
+        WORK_DIR,
+        CONFIG.get("git_remote")
+        or f'https://{CONFIG.get("git_oauth_token")}@'
+        f"github.com/androidtrackers/oneplus-updates-tracker.git",
+        branch=CONFIG.get("git_branch", "master"),
+        push_every=CONFIG.get("git_push_every", 1),
+    )
+    return await publisher.publish(files)
@@ -2,9 +2,8 @@
 import re
 from datetime import datetime
 
-from bs4 import BeautifulSoup
-
-from op_tracker.common.database.database import get_version
+from op_tracker.utils.changelog import get_changelog_parser
+from op_tracker.utils.versions import get_version_resolver
 
 
 def is_newer_datetime(old_datetime: int, new_datetime: int) -> bool:
@@ -40,14 +39,7 @@ def parse_changelog_from_website(_changelog: str) -> str:
     :param _changelog: OnePlus API response changelog
     :return: A clean string of changelog html
     """
-
-    changelog: str = BeautifulSoup(_changelog, "html.parser").get_text(separator="\n")
-    # clean up the text
-    changelog: str = re.sub(r"\s\s+", r" ", changelog)
-    changelog: str = re.sub(" •", r"\n•", changelog)
-    changelog: str = re.sub(r"\s+$", "", changelog)
-    changelog: str = re.sub(r"\xa0", "", changelog)
-    return changelog
+    return get_changelog_parser().parse(_changelog)
 
 
 def get_version_letter(version: str, branch: str) -> str:
@@ -60,33 +52,23 @@ def get_version_letter(version: str, branch: str) -> str:
     letter = ""
     device = version.split("_")[0].replace("Hydrogen", "").replace("Oxygen", "")
     if (
-            device.startswith("OnePlus5") or device.startswith("OnePlus7")
+        device.startswith("OnePlus5") or device.startswith("OnePlus7")
     ) and branch == "Stable":
         letter = "J"
     if device.startswith("OnePlus5") and branch == "Beta":
         letter = "T"
     if (
-            device.startswith("OnePlus6") or device.startswith("OnePlus7")
+        device.startswith("OnePlus6") or device.startswith("OnePlus7")
     ) and branch == "Stable":
         letter = "J"
     return letter
 
 
 def get_version_from_file(filename: str, branch: str) -> str:
-    version: str = ""
-    pattern = re.search(r"_\d{2}\.\w\.\d{2}", filename)
-    pattern2 = re.search(r"_\d{2}_OTA_\d{3}_all", filename)
-    if pattern:
-        version = re.sub("_OTA", "", filename)
-        version = re.sub("_all", "", version)
-        version = re.sub(r"_[a-z0-9]{16}\.zip", "", version)
-    elif pattern2:
-        another_version = get_version(filename.split("_")[0], branch)
-        if another_version:
-            split_version = re.search(r"_OTA_(\d{3})_all", filename).group(1)
-            version = re.sub(
-                r"\.\d{2}", f".{split_version[1:]}", another_version.version
-            )
-            version = re.sub(r"_\d{3}_", f"_{split_version}_", version)
-            version = re.sub(r"_\d{10}_", filename.split("_")[-2], version)
-    return version
+    """
+    Get the software version of an update file
+    :param filename: update file name
+    :param branch: update branch
+    :return: version, or an empty string if it can't be resolved
+    """
+    return get_version_resolver().resolve(filename, branch)
@@ -0,0 +1,139 @@
+"""
+Pluggable JSON codec used for API responses and JSON exports
+
+orjson is used when it's installed, otherwise the standard library json module.
+Both parse straight from bytes, so responses don't need to be decoded to str first.
+"""
+import json
+import re
+from typing import Any, Dict, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# envelope fields that come before the data payload of OnePlus API responses
+ENVELOPE_FIELD = re.compile(rb'"(ret|errCode)"\s*:\s*(-?\d+)')
+DATA_KEY = re.compile(rb'"data"\s*:')
+# start of a nested object or array, its keys may have the same names as the envelope fields
+NESTED_VALUE = re.compile(rb"[{\[]")
+# length of the response head that is searched for the envelope fields
+HEAD_SIZE = 256
+
+
+class EnvelopeError(ValueError):
+    """The API response envelope reports an error"""
+
+
+class JSONCodec:
+    """
+    Base JSON codec class
+    :attr: `name`: str - codec name
+    :meth: `dumps` Serialize data to UTF-8 JSON bytes.
+    :meth: `loads` Deserialize JSON bytes or str.
+    """
+
+    name: str = ""
+
+    def dumps(self, data: Any, indent: bool = False) -> bytes:
+        """Serialize data to UTF-8 JSON bytes, optionally indented by 2 spaces"""
+        raise NotImplementedError
+
+    def loads(self, content: Union[bytes, str]) -> Any:
+        """Deserialize JSON bytes or str, raises a ValueError on invalid JSON"""
+        raise NotImplementedError
+
+
+class StdlibJSONCodec(JSONCodec):
+    """Standard library json codec"""
+
+    name = "json"
+
+    def dumps(self, data: Any, indent: bool = False) -> bytes:
+        return json.dumps(
+            data, ensure_ascii=False, indent=2 if indent else None
+        ).encode("utf-8")
+
+    def loads(self, content: Union[bytes, str]) -> Any:
+        return json.loads(content)
+
+
+class OrjsonCodec(JSONCodec):
+    """orjson codec, requires orjson package"""
+
+    name = "orjson"
+
+    def dumps(self, data: Any, indent: bool = False) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+
+    def loads(self, content: Union[bytes, str]) -> Any:
+        return orjson.loads(content)
+
+
+CODECS: Dict[str, JSONCodec] = {"json": StdlibJSONCodec()}
+if orjson is not None:
+    CODECS["orjson"] = OrjsonCodec()
+
+
+def get_json_codec(name: Optional[str] = None) -> JSONCodec:
+    """
+    Get a JSON codec by name
+    :param name: codec name, the fastest available codec by default
+    :return: JSONCodec object
+    """
+    if name is None:
+        return CODECS.get("orjson", CODECS["json"])
+    if name not in CODECS:
+        raise ValueError(f"JSON codec {name} is not available")
+    return CODECS[name]
+
+
+def _check_envelope(ret: Any, err_code: Any, content: bytes):
+    """Raise an EnvelopeError if the envelope fields report an error"""
+    if ret != 1 or err_code != 0:
+        preview = content[:200].decode("utf-8", errors="replace")
+        raise EnvelopeError(f"API error response: {preview}")
+
+
+def _scan_envelope(content: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Find the envelope fields in the response head, before the data payload.
+    They're only trusted as top-level keys: the response is an object,
+    and nothing before the payload is nested in it.
+    :param content: response body
+    :return: `ret` and `errCode` values, None if they can't be found in the head
+    """
+    data_key = DATA_KEY.search(content, 0, HEAD_SIZE)
+    if data_key is None or not content.lstrip().startswith(b"{"):
+        return None
+    start = content.index(b"{") + 1
+    if NESTED_VALUE.search(content, start, data_key.start()):
+        return None
+    fields = dict(ENVELOPE_FIELD.findall(content, start, data_key.start()))
+    if b"ret" not in fields or b"errCode" not in fields:
+        return None
+    return int(fields[b"ret"]), int(fields[b"errCode"])
+
+
+def decode_envelope(content: bytes, codec: Optional[JSONCodec] = None) -> Any:
+    """
+    Decode an OnePlus API response and get its data payload.
+    When the `ret` and `errCode` fields come before the payload as top-level keys, they're
+    checked in the response head, so error responses are rejected without parsing the payload.
+    :param content: response body
+    :param codec: JSON codec, the fastest available by default
+    :return: the response `data`
+    :raises ValueError: if the response isn't valid JSON,
+     or an EnvelopeError if it reports an error
+    """
+    codec = codec or get_json_codec()
+    envelope = _scan_envelope(content)
+    if envelope is not None:
+        _check_envelope(*envelope, content)
+    response = codec.loads(content)
+    if not isinstance(response, dict):
+        raise EnvelopeError(f"Unexpected API response: {content[:200]!r}")
+    if envelope is None:
+        _check_envelope(response.get("ret"), response.get("errCode"), content)
+    return response.get("data")
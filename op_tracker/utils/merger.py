@@ -1,8 +1,188 @@
-"""YAML files merge functions"""
-from glob import glob
+"""
+YAML files merge functions
+
+These are library functions for data trees laid out as `{region}/{folder}/{device}.yml`,
+the official tracker doesn't call them:
+its updates are stored in the database and exported by `export_latest`,
+and its data tree only has the region devices lists.
+"""
+import json
+import os
+from hashlib import sha256
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 from op_tracker import WORK_DIR
 from op_tracker.utils.data_manager import DataManager
+from op_tracker.utils.metrics import METRICS
+from op_tracker.utils.processes import new_process_pool
+from op_tracker.utils.serializers import get_serializer
+
+
+def _load(file: str):
+    """Read a data file, runs in the merger worker processes"""
+    path = Path(file)
+    return get_serializer(path).loads(path.read_bytes())
+
+
+class DataFile(NamedTuple):
+    """
+    An updates file of the data tree
+    :param key: str - path relative to the data directory
+    :param path: str - file path
+    """
+
+    key: str
+    path: str
+
+
+class Merger:
+    """
+    Merges the updates files of each device from all regions into `latest/{device}.yml`
+
+    The data tree is walked once to index each device files. A manifest keeps the size, mtime
+    and hash of the merged files, so devices whose files haven't changed since the last merge
+    are skipped, and only their outputs are rewritten.
+    :attr: `root`: Path - official data directory
+    :attr: `workers`: int - number of worker processes used to parse the files
+    :attr: `pool_threshold`: int - minimum number of files to parse in the workers pool
+    :meth: `index` Get the updates files of each device.
+    :meth: `merge_updates` Merge the updates files of changed devices.
+    """
+
+    MANIFEST: str = ".merge_manifest.json"
+    OUTPUT_DIR: str = "latest"
+
+    def __init__(self, root, workers: int = 0, pool_threshold: int = 64):
+        """
+        Merger class constructor
+        :param root: official data directory
+        :param workers: number of worker processes, defaults to the number of CPUs (up to 4)
+        :param pool_threshold: minimum number of files to parse in the workers pool
+        """
+        self.root: Path = Path(root)
+        self.workers: int = workers or min(os.cpu_count() or 1, 4)
+        self.pool_threshold: int = pool_threshold
+
+    def index(self) -> Dict[str, List[DataFile]]:
+        """
+        Walk the data tree once and get the updates files of each device
+        (`{region}/{folder}/{device}.yml`)
+        :return: a dictionary of device name and its sorted files
+        """
+        devices: Dict[str, List[DataFile]] = {}
+        for region in os.scandir(self.root):
+            if not region.is_dir() or region.name == self.OUTPUT_DIR:
+                continue
+            for folder in os.scandir(region.path):
+                if not folder.is_dir():
+                    continue
+                prefix = f"{region.name}/{folder.name}/"
+                for entry in os.scandir(folder.path):
+                    if entry.name.endswith(".yml") and entry.is_file():
+                        devices.setdefault(entry.name[:-4], []).append(
+                            DataFile(prefix + entry.name, entry.path)
+                        )
+        for files in devices.values():
+            files.sort()
+        return devices
+
+    def _load_manifest(self) -> dict:
+        try:
+            return json.loads((self.root / self.MANIFEST).read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest: dict):
+        tmp = self.root / f"{self.MANIFEST}.tmp"
+        tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+        os.replace(tmp, self.root / self.MANIFEST)
+
+    def _changed(self, files: List[DataFile], manifest: dict, entries: dict) -> bool:
+        """
+        Check whether any of a device files has changed since the last merge,
+        files are hashed only when their size or mtime has changed
+        :param files: the device files
+        :param manifest: the last merge manifest
+        :param entries: receives the current manifest entries of the files
+        :return: True if the device output needs to be rewritten
+        """
+        changed = False
+        for key, path in files:
+            stat = os.stat(path)
+            entry = manifest.get(key)
+            if (
+                entry
+                and entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns
+            ):
+                entries[key] = entry
+                continue
+            digest = sha256(Path(path).read_bytes()).hexdigest()
+            entries[key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest,
+            }
+            changed = changed or not entry or entry["sha256"] != digest
+        return changed
+
+    def _parse(self, files: List[DataFile]) -> list:
+        """
+        Parse files, in the workers pool if there are many of them
+        :param files: files to parse
+        :return: the files data, in the same order
+        """
+        paths = [file.path for file in files]
+        if len(paths) < self.pool_threshold or self.workers < 2:
+            return [_load(path) for path in paths]
+        with new_process_pool(self.workers) as pool:
+            chunk_size = max(len(paths) // (self.workers * 4), 1)
+            return list(pool.map(_load, paths, chunksize=chunk_size))
+
+    def merge_updates(self, devices: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Merge the updates files of each changed device into its `latest/{device}.yml`
+        :param devices: devices to merge, all indexed devices by default
+        :return: a list of the output files whose content has changed
+        """
+        index = self.index()
+        names = sorted(index) if devices is None else [name for name in devices]
+        manifest = self._load_manifest()
+        old_outputs = manifest.get("outputs", {})
+        files_manifest = manifest.get("files", {})
+        entries: Dict[str, dict] = {}
+        outputs: Dict[str, List[str]] = {}
+        affected: List[Tuple[str, List[DataFile]]] = []
+        for name in names:
+            files = index.get(name, [])
+            keys = [file.key for file in files]
+            outputs[name] = keys
+            output = self.root / self.OUTPUT_DIR / f"{name}.yml"
+            changed = self._changed(files, files_manifest, entries)
+            if changed or old_outputs.get(name) != keys or not output.exists():
+                affected.append((name, files))
+        data = iter(self._parse([file for _, files in affected for file in files]))
+        (self.root / self.OUTPUT_DIR).mkdir(exist_ok=True)
+        changed_files = []
+        with DataManager.batch():
+            for name, files in affected:
+                output = f"{self.root / self.OUTPUT_DIR / name}.yml"
+                if DataManager.write_file(output, [next(data) for _ in files]):
+                    changed_files.append(output)
+        # devices that weren't merged this time keep their previous manifest entries
+        indexed = {file.key for files in index.values() for file in files}
+        files_manifest = {
+            key: entry for key, entry in files_manifest.items() if key in indexed
+        }
+        new_manifest = {
+            "files": {**files_manifest, **entries},
+            "outputs": {**old_outputs, **outputs},
+        }
+        if new_manifest != manifest:
+            self._save_manifest(new_manifest)
+        METRICS.count("merged_devices", len(affected))
+        return changed_files
 
 
 def merge_devices(regions: dict) -> list:
@@ -13,28 +193,21 @@ def merge_devices(regions: dict) -> list:
     """
     devices = set()
     for region_code in regions.keys():
-        data: dict = DataManager.read_file(
+        data = DataManager.read_file(
             f"{WORK_DIR}/data/official/{region_code}/{region_code}.yml"
         )
-        for item in data.keys():
-            devices.add(item)
+        # region files are lists of devices, older ones are dictionaries keyed by device
+        for item in data or []:
+            devices.add(item.get("name") if isinstance(item, dict) else item)
     devices = sorted(list(devices))
     DataManager.write_file(f"{WORK_DIR}/data/official/devices.yml", devices)
     return devices
 
 
-def merge_updates(devices: list):
+def merge_updates(devices: Optional[list] = None) -> List[str]:
     """
-    Merge updates of a list of regions
-    :param devices: a list of devices
-    :return: None
+    Merge updates of a list of devices
+    :param devices: a list of devices, all devices by default
+    :return: a list of the changed merged files
     """
-    for device in devices:
-        all_updates = []
-        updates = glob(f"{WORK_DIR}/data/official/*/*/{device}.yml")
-        for update in updates:
-            data = DataManager.read_file(update)
-            all_updates.append(data)
-        DataManager.write_file(
-            f"{WORK_DIR}/data/official/latest/{device}.yml", all_updates
-        )
+    return Merger(f"{WORK_DIR}/data/official").merge_updates(devices)
@@ -0,0 +1,257 @@
+"""
+Run instrumentation: timing spans, counters and run reports
+
+Metrics are disabled unless the `metrics` config section enables them, disabled spans and
+counters return right away so instrumented code runs at full speed.
+"""
+import json
+import logging
+import os
+from asyncio import iscoroutinefunction
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import wraps
+from pathlib import Path
+from tempfile import mkstemp
+from time import perf_counter, time
+from typing import Dict, Optional, Tuple
+
+from op_tracker import CONF_DIR
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+_DISABLED = nullcontext()
+
+
+@dataclass
+class SpanStats:
+    """
+    Timing statistics of a span
+    :param count: int - number of times the span has run
+    :param total: float - total duration in seconds
+    :param max: float - longest duration in seconds
+    """
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, seconds: float):
+        """Add a span duration"""
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class Metrics:
+    """
+    Run metrics collector
+
+    :attr: `enabled`: bool - whether metrics are collected
+    :attr: `report`: Path - JSON run report file, None to skip the report
+    :attr: `prometheus`: Path - Prometheus textfile collector file, None to skip it
+    :meth: `span` Time a block of code.
+    :meth: `timed` Time each call of a function.
+    :meth: `count` Increment a counter.
+    :meth: `write` Write the run report files.
+    """
+
+    def __init__(self):
+        """Metrics class constructor, metrics are disabled until configured"""
+        self.enabled: bool = False
+        self.report: Optional[Path] = None
+        self.prometheus: Optional[Path] = None
+        self.spans: Dict[Tuple[str, Labels], SpanStats] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self._started: float = time()
+
+    def configure(self, config: dict):
+        """
+        Enable metrics according to the `metrics` config section and start a new run
+        :param config: metrics configuration
+        """
+        self.enabled = bool(config.get("enabled"))
+        self.report = self._path(config.get("report", "run_report.json"))
+        self.prometheus = self._path(config.get("prometheus"))
+        self.reset()
+
+    @staticmethod
+    def _path(file: Optional[str]) -> Optional[Path]:
+        """Resolve a report file path, relative paths are relative to the configuration directory"""
+        return CONF_DIR / file if file else None
+
+    def reset(self):
+        """Clear the collected metrics"""
+        self.spans.clear()
+        self.counters.clear()
+        self._started = time()
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        """
+        Add a measured duration to a span
+        :param name: span name
+        :param seconds: duration
+        :param labels: span labels, e.g. region
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        stats = self.spans.get(key)
+        if stats is None:
+            stats = self.spans[key] = SpanStats()
+        stats.add(seconds)
+
+    def span(self, name: str, **labels: str):
+        """
+        Time a block of code
+        :param name: span name
+        :param labels: span labels, e.g. region
+        :return: a context manager
+        """
+        if not self.enabled:
+            return _DISABLED
+        return self._span(name, labels)
+
+    @contextmanager
+    def _span(self, name: str, labels: dict):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def timed(self, name: str):
+        """
+        Decorator that times each call of a function or a coroutine function
+        :param name: span name
+        """
+
+        def decorator(function):
+            if iscoroutinefunction(function):
+
+                @wraps(function)
+                async def timed_coroutine(*args, **kwargs):
+                    if not self.enabled:
+                        return await function(*args, **kwargs)
+                    start = perf_counter()
+                    try:
+                        return await function(*args, **kwargs)
+                    finally:
+                        self.observe(name, perf_counter() - start)
+
+                return timed_coroutine
+
+            @wraps(function)
+            def timed_function(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, perf_counter() - start)
+
+            return timed_function
+
+        return decorator
+
+    def count(self, name: str, value: float = 1, **labels: str):
+        """
+        Increment a counter
+        :param name: counter name
+        :param value: increment
+        :param labels: counter labels, e.g. region
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        """Get the run report"""
+        return {
+            "started": datetime.fromtimestamp(self._started, timezone.utc).isoformat(),
+            "duration": time() - self._started,
+            "spans": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": stats.count,
+                    "total": stats.total,
+                    "max": stats.max,
+                }
+                for (name, labels), stats in sorted(
+                    self.spans.items(), key=lambda item: item[1].total, reverse=True
+                )
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ],
+        }
+
+    def to_prometheus(self) -> str:
+        """Get the run metrics in Prometheus text format"""
+
+        def labels_text(labels: Labels, **extra: str) -> str:
+            items = list(labels) + list(extra.items())
+            if not items:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+        lines = [
+            "# TYPE op_tracker_run_start_timestamp_seconds gauge",
+            f"op_tracker_run_start_timestamp_seconds {self._started:.3f}",
+            "# TYPE op_tracker_run_duration_seconds gauge",
+            f"op_tracker_run_duration_seconds {time() - self._started:.6f}",
+            "# TYPE op_tracker_span_seconds_total gauge",
+        ]
+        lines += [
+            f"op_tracker_span_seconds_total{labels_text(labels, span=name)} {stats.total:.6f}"
+            for (name, labels), stats in self.spans.items()
+        ]
+        lines.append("# TYPE op_tracker_span_count gauge")
+        lines += [
+            f"op_tracker_span_count{labels_text(labels, span=name)} {stats.count}"
+            for (name, labels), stats in self.spans.items()
+        ]
+        lines.append("# TYPE op_tracker_span_max_seconds gauge")
+        lines += [
+            f"op_tracker_span_max_seconds{labels_text(labels, span=name)} {stats.max:.6f}"
+            for (name, labels), stats in self.spans.items()
+        ]
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f"# TYPE op_tracker_{name} gauge")
+            lines += [
+                f"op_tracker_{name}{labels_text(labels)} {value:g}"
+                for (counter, labels), value in self.counters.items()
+                if counter == name
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """Write the JSON run report and the Prometheus textfile, if they're enabled"""
+        if not self.enabled:
+            return
+        if self.report:
+            self._write(self.report, json.dumps(self.to_dict(), indent=2))
+        if self.prometheus:
+            self._write(self.prometheus, self.to_prometheus())
+        logger.info(
+            f"Run metrics: {len(self.spans)} spans, {len(self.counters)} counters"
+        )
+
+    @staticmethod
+    def _write(path: Path, content: str):
+        """Write a report file atomically, so collectors never read a partial file"""
+        fd, tmp = mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        with os.fdopen(fd, "w") as out:
+            out.write(content)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+
+
+# process-wide metrics collector
+METRICS = Metrics()
@@ -0,0 +1,16 @@
+"""Worker processes pools"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+
+
+def new_process_pool(max_workers: int, **kwargs) -> ProcessPoolExecutor:
+    """
+    Create a worker processes pool. Workers aren't forked from the calling process:
+    it runs database and event loop threads, and forking copies their locks in whatever
+    state they are, so workers start from a fork server (or a new interpreter where there's none).
+    :param max_workers: number of worker processes
+    :param kwargs: other ProcessPoolExecutor arguments
+    :return: ProcessPoolExecutor object
+    """
+    method = "forkserver" if "forkserver" in get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers, mp_context=get_context(method), **kwargs)
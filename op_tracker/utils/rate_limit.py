@@ -0,0 +1,59 @@
+"""
+Asynchronous token bucket rate limiter
+"""
+import asyncio
+from time import monotonic
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter, `acquire` waits until a token is available
+
+    :attr: `rate`: float - tokens added per second
+    :attr: `capacity`: int - maximum number of tokens (burst size)
+    :meth: `acquire` Wait for a token and take it.
+    :meth: `pause` Stop handing out tokens for a while (e.g. when asked to retry later).
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        """
+        TokenBucket class constructor
+        :param rate: tokens added per second
+        :param capacity: maximum number of tokens
+        """
+        self.rate: float = rate
+        self.capacity: int = capacity
+        self._tokens: float = capacity
+        self._updated: float = monotonic()
+        self._paused_until: float = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Stop handing out tokens for some time, and drop the saved up ones
+        :param seconds: pause duration
+        """
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
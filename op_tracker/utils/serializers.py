@@ -0,0 +1,130 @@
+"""
+Data serialization backends used to read and write data files
+
+The serializer of a file is chosen by its extension, YAML uses libyaml C loader and dumper
+when PyYAML is built with it, and msgpack is available only when it's installed.
+"""
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import yaml
+
+from op_tracker.utils.json_codec import JSONCodec, get_json_codec
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Serializer:
+    """
+    Base serializer class
+    :attr: `name`: str - serializer name
+    :attr: `extensions`: tuple - file extensions handled by the serializer
+    :meth: `dumps` Serialize data to bytes.
+    :meth: `loads` Deserialize data from bytes.
+    """
+
+    name: str = ""
+    extensions: Tuple[str, ...] = ()
+
+    def dumps(self, data: Any) -> bytes:
+        """Serialize data to bytes"""
+        raise NotImplementedError
+
+    def loads(self, content: bytes) -> Any:
+        """Deserialize data from bytes"""
+        raise NotImplementedError
+
+
+class YAMLSerializer(Serializer):
+    """YAML serializer, uses libyaml C implementation if available"""
+
+    name = "yaml"
+    extensions = (".yml", ".yaml")
+
+    def __init__(
+        self,
+        loader=getattr(yaml, "CFullLoader", yaml.FullLoader),
+        dumper=getattr(yaml, "CDumper", yaml.Dumper),
+    ):
+        """
+        YAMLSerializer class constructor
+        :param loader: PyYAML loader class
+        :param dumper: PyYAML dumper class
+        """
+        self.loader = loader
+        self.dumper = dumper
+
+    def dumps(self, data: Any) -> bytes:
+        return yaml.dump(data, Dumper=self.dumper, allow_unicode=True).encode("utf-8")
+
+    def loads(self, content: bytes) -> Any:
+        return yaml.load(content, Loader=self.loader)
+
+
+class JSONSerializer(Serializer):
+    """JSON serializer, uses the fastest available JSON codec"""
+
+    name = "json"
+    extensions = (".json",)
+
+    def __init__(self, codec: Optional[JSONCodec] = None):
+        """
+        JSONSerializer class constructor
+        :param codec: JSON codec, the fastest available by default
+        """
+        self.codec: JSONCodec = codec or get_json_codec()
+
+    def dumps(self, data: Any) -> bytes:
+        return self.codec.dumps(data, indent=True)
+
+    def loads(self, content: bytes) -> Any:
+        return self.codec.loads(content)
+
+
+class MsgpackSerializer(Serializer):
+    """MessagePack serializer, requires msgpack package"""
+
+    name = "msgpack"
+    extensions = (".msgpack", ".mp")
+
+    def dumps(self, data: Any) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, content: bytes) -> Any:
+        return msgpack.unpackb(content, raw=False)
+
+
+SERIALIZERS: Dict[str, Serializer] = {}
+
+
+def register_serializer(serializer: Serializer):
+    """
+    Register a serializer by its name and extensions
+    :param serializer: Serializer object
+    """
+    SERIALIZERS[serializer.name] = serializer
+    for extension in serializer.extensions:
+        SERIALIZERS[extension] = serializer
+
+
+register_serializer(YAMLSerializer())
+register_serializer(JSONSerializer())
+if msgpack is not None:
+    register_serializer(MsgpackSerializer())
+
+
+def get_serializer(file=None, name: Optional[str] = None) -> Serializer:
+    """
+    Get a serializer by name or by file extension (YAML for unknown extensions)
+    :param file: file path
+    :param name: serializer name, takes precedence over the file extension
+    :return: Serializer object
+    """
+    if name is not None:
+        if name not in SERIALIZERS:
+            raise ValueError(f"Serializer {name} is not available")
+        return SERIALIZERS[name]
+    return SERIALIZERS.get(Path(f"{file}").suffix.lower(), SERIALIZERS["yaml"])
@@ -0,0 +1,264 @@
+"""
+Content-addressed snapshot store of data files
+
+Snapshots replace `.bak` copies: each file content is stored once by its hash (hard-linked
+from the data file when possible), and a compact state of the parsed content (its keys, value
+digests and version fields) is kept in the index, so changes since the last snapshot are
+found by comparing hashes and keys instead of copying and re-parsing files.
+Files are indexed by their path relative to the work directory, so the store can be moved
+along with it, and objects that the index doesn't reference anymore are removed.
+"""
+import os
+import shutil
+from hashlib import blake2b
+from pathlib import Path
+from tempfile import mkstemp
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from op_tracker import WORK_DIR
+from op_tracker.utils.data_manager import DataManager
+from op_tracker.utils.json_codec import get_json_codec
+from op_tracker.utils.serializers import get_serializer
+
+# fields of dictionary data files kept in the snapshot state to compare versions
+STATE_FIELDS = ("version", "updated")
+
+
+def _digest(value: Any) -> str:
+    """Short digest of a parsed value"""
+    return blake2b(get_json_codec().dumps(value), digest_size=8).hexdigest()
+
+
+def get_state(data: Any) -> dict:
+    """
+    Get the compact state of parsed data
+    :param data: parsed file content
+    :return: keys (dictionary keys or list items) with their value digests, and version fields
+    """
+    if isinstance(data, dict):
+        state = {"keys": {str(key): _digest(value) for key, value in data.items()}}
+        state.update({key: data[key] for key in STATE_FIELDS if key in data})
+        return state
+    if isinstance(data, list):
+        return {"keys": {_digest(item): "" for item in data}}
+    return {"keys": {}}
+
+
+class SnapshotStore:
+    """
+    Content-addressed store of data files snapshots
+
+    :attr: `root`: Path - store directory, objects are kept in `objects/`
+     and the index in `index.json`
+    :attr: `base`: Path - directory that the index paths are relative to
+    :meth: `snapshot` Take a snapshot of a file.
+    :meth: `snapshot_all` Take snapshots of many files.
+    :meth: `state` Get the state of a file at its last snapshot.
+    :meth: `changed` Check whether a file has changed since its last snapshot.
+    :meth: `new_keys` Get the keys of data that weren't in the last snapshot.
+    :meth: `load` Load the content of a file at its last snapshot.
+    :meth: `gc` Remove the objects that the index doesn't reference.
+    """
+
+    INDEX: str = "index.json"
+
+    def __init__(self, root, base=WORK_DIR):
+        """
+        SnapshotStore class constructor
+        :param root: store directory
+        :param base: directory that the index paths are relative to, the work directory by default
+        """
+        self.root: Path = Path(root)
+        self.base: Path = Path(base).resolve()
+        self._index: Optional[Dict[str, dict]] = None
+        # hashes of the objects that index entries stopped referencing since the last save
+        self._released: Set[str] = set()
+
+    @property
+    def index(self) -> Dict[str, dict]:
+        """Snapshot entry of each file, loaded on first use"""
+        if self._index is None:
+            try:
+                index = get_json_codec().loads((self.root / self.INDEX).read_bytes())
+            except (FileNotFoundError, ValueError):
+                index = {}
+            # indexes of older versions are keyed by absolute paths
+            self._index = {self._key(key): entry for key, entry in index.items()}
+        return self._index
+
+    def _key(self, file) -> str:
+        """Index key of a file: its path relative to the base directory (absolute outside of it)"""
+        path = Path(file)
+        if not path.is_absolute():
+            path = self.base / path
+        path = path.resolve()
+        try:
+            return path.relative_to(self.base).as_posix()
+        except ValueError:
+            return str(path)
+
+    def _object(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / digest[2:]
+
+    def _store(self, path: Path, digest: str):
+        """
+        Store a file content by its hash. Data files are always replaced (not modified in place),
+        so the object can be a hard link to the current file
+        """
+        target = self._object(digest)
+        if target.exists():
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.parent / f".{target.name}.tmp"
+        try:
+            os.link(path, tmp)
+        except OSError:
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+
+    def _save(self):
+        """Save the index atomically, then remove the objects it doesn't reference anymore"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = mkstemp(dir=self.root, prefix=f".{self.INDEX}.", suffix=".tmp")
+        with os.fdopen(fd, "wb") as out:
+            out.write(get_json_codec().dumps(self.index))
+        os.replace(tmp, self.root / self.INDEX)
+        if self._released:
+            self._remove(self._released - self._referenced())
+            self._released.clear()
+
+    def _referenced(self) -> Set[str]:
+        """Hashes of the objects referenced by the index"""
+        return {entry["sha256"] for entry in self.index.values()}
+
+    def _remove(self, digests: Iterable[str]) -> int:
+        """
+        Remove objects from the store
+        :param digests: the objects hashes
+        :return: number of removed objects
+        """
+        removed = 0
+        for digest in digests:
+            try:
+                self._object(digest).unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def gc(self) -> int:
+        """
+        Remove the objects that the index doesn't reference, like the ones left by
+        an interrupted snapshot or by older versions of the store
+        :return: number of removed objects
+        """
+        objects = self.root / "objects"
+        if not objects.is_dir():
+            return 0
+        stored = set()
+        for folder in os.scandir(objects):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.startswith("."):
+                    # temporary file of an interrupted store
+                    os.unlink(entry.path)
+                else:
+                    stored.add(folder.name + entry.name)
+        return self._remove(stored - self._referenced())
+
+    def _snapshot(self, file, data: Any = None) -> Optional[str]:
+        """Take a snapshot of a file without saving the index"""
+        path = Path(file)
+        digest = DataManager.content_hash(path)
+        if digest is None:
+            return None
+        key = self._key(path)
+        entry = self.index.get(key)
+        if entry and entry["sha256"] == digest:
+            return digest
+        if entry:
+            self._released.add(entry["sha256"])
+        self._store(path, digest)
+        if data is None:
+            data = get_serializer(path).loads(path.read_bytes())
+        self.index[key] = {"sha256": digest, **get_state(data)}
+        return digest
+
+    def snapshot(self, file, data: Any = None) -> Optional[str]:
+        """
+        Take a snapshot of a file, unchanged files only cost a hash lookup
+        :param file: file path
+        :param data: the file parsed content, parsed from the file if it's not given
+        :return: the file content hash, None if the file doesn't exist
+        """
+        digest = self._snapshot(file, data)
+        self._save()
+        return digest
+
+    def snapshot_all(self, files: Iterable) -> List[str]:
+        """
+        Take snapshots of many files
+        :param files: file paths
+        :return: the files whose content has changed since their last snapshot
+        """
+        changed = []
+        for file in files:
+            previous = self.index.get(self._key(file), {}).get("sha256")
+            if self._snapshot(file) != previous:
+                changed.append(str(file))
+        if changed:
+            self._save()
+        return changed
+
+    def state(self, file) -> Optional[dict]:
+        """
+        Get the state of a file at its last snapshot
+        :param file: file path
+        :return: the snapshot entry (hash, keys and version fields), None if there's no snapshot
+        """
+        return self.index.get(self._key(file))
+
+    def changed(self, file) -> bool:
+        """
+        Check whether a file has changed since its last snapshot
+        :param file: file path
+        :return: True if the file content hash is different or there's no snapshot
+        """
+        state = self.state(file)
+        return state is None or state["sha256"] != DataManager.content_hash(file)
+
+    def new_keys(self, file, data: Any) -> list:
+        """
+        Get the keys (or list items) of data that weren't in the last snapshot of a file
+        :param file: file path
+        :param data: current parsed content
+        :return: a list of the new keys
+        """
+        old = (self.state(file) or {}).get("keys", {})
+        current = get_state(data)["keys"]
+        return [key for key in current if key not in old]
+
+    def load(self, file) -> Any:
+        """
+        Load the content of a file at its last snapshot
+        :param file: file path
+        :return: parsed content, None if there's no snapshot
+        """
+        state = self.state(file)
+        if state is None:
+            return None
+        return get_serializer(Path(file)).loads(
+            self._object(state["sha256"]).read_bytes()
+        )
+
+
+_store: Optional[SnapshotStore] = None
+
+
+def get_snapshot_store() -> SnapshotStore:
+    """Get the shared snapshot store of the data directory"""
+    global _store  # pylint: disable=global-statement
+    if _store is None:
+        _store = SnapshotStore(WORK_DIR / ".snapshots")
+    return _store
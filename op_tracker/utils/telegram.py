@@ -1,56 +1,143 @@
 """Telegram Bot implementation"""
-from time import sleep
-from typing import List, Union
+import asyncio
+import json
+import logging
+import random
+from time import time
+from typing import Dict, List, Optional, Tuple, Union
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Updater
+from aiohttp import ClientError
 
-from op_tracker.common.database.database import get_incremental
+from op_tracker.common.api_client.transport import get_transport
+from op_tracker.common.database.async_db import AsyncDatabase, get_async_db
+from op_tracker.common.database.database import (
+    add_to_outbox,
+    get_incremental,
+    get_incrementals,
+    get_outbox,
+    save_outbox,
+)
+from op_tracker.common.database.models.outbox_message import OutboxMessage
 from op_tracker.common.database.models.update import Update
+from op_tracker.utils.metrics import METRICS
+from op_tracker.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram maximum message text length
+MAX_MESSAGE_LENGTH = 4096
 
 
 class TelegramBot:
     """
     This class implements telegram bot that is used for sending updates to a telegram chat
-    :attr:`bot` Telegram bot object
-    :attr:`updater` Telegram updater object
+
+    Messages are queued in a persistent outbox and sent asynchronously through the Bot API,
+    rate limited by a token bucket, so messages that can't be sent are retried on the next run.
+    Only messages that Telegram rejects with a client error are given up.
+    Outbox reads and writes go through the async database layer.
     :attr:`chat` Telegram chat username or id
+    :attr:`api_url` Telegram Bot API server URL
+    :attr:`limiter` messages rate limiter
+    :attr:`max_attempts` number of tries of a message in a run before leaving it for the next run
+    :attr:`max_retry_after` longest rate limit wait in seconds, messages are left for the next run
+     when Telegram asks to wait longer
+    :attr:`digest` updates grouping mode: "device" groups updates of the same device and branch,
+     "run" groups all updates of the run, None sends a message per update
+    :attr:`db` database access off the event loop
     """
 
-    def __init__(self, bot_token: str, chat: Union[int, str], source: str):
+    def __init__(
+        self,
+        bot_token: str,
+        chat: Union[int, str],
+        source: str,
+        api_url: str = "https://api.telegram.org",
+        rate_limit: float = 20,
+        max_attempts: int = 5,
+        digest: Optional[str] = None,
+        max_retry_after: float = 60,
+    ):
         """
         TelegramBot class constructor
         :param bot_token: Telegram Bot API access token
         :param chat: Telegram chat username or id that will be used to send updates to
+        :param source: updates source name
+        :param api_url: Telegram Bot API server URL
+        :param rate_limit: maximum number of messages per minute
+        :param max_attempts: number of tries of a message in a run
+        :param digest: updates grouping mode (device, run or None)
+        :param max_retry_after: longest rate limit wait in seconds
         """
-        self.updater = Updater(token=bot_token, use_context=True)
+        self.token = bot_token
         self.chat = chat if isinstance(chat, int) else f"@{chat}"
         self.source = source
+        self.api_url = api_url.rstrip("/")
+        self.limiter = TokenBucket(rate_limit / 60, capacity=1)
+        self.max_attempts = max_attempts
+        self.digest = digest
+        self.max_retry_after = max_retry_after
+        self.db: AsyncDatabase = get_async_db()
 
-    def post_updates(self, new_updates: List[Update]):
+    @METRICS.timed("telegram_enqueue")
+    async def post_updates(self, new_updates: List[Update]):
         """
-        Send updates to a Telegram chat
+        Queue updates messages to be sent to a Telegram chat
         :param new_updates: a list of updates
         :return: None
         """
-        for update in new_updates:
-            message, button = self.generate_message(update)
-            self.send_telegram_message(message, button)
+        incrementals = await self.db.read(
+            get_incrementals, [update.version for update in new_updates]
+        )
+        messages: List[Tuple[str, dict]] = []
+        for group in self.group_updates(new_updates):
+            if len(group) > 1:
+                message, buttons = self.generate_digest(group, incrementals)
+                if len(message) <= MAX_MESSAGE_LENGTH:
+                    messages.append((message, buttons))
+                    continue
+            messages.extend(
+                self.generate_message(update, incrementals) for update in group
+            )
+        for message, buttons in messages:
+            await self.db.write(
+                add_to_outbox, str(self.chat), message, json.dumps(buttons)
+            )
+
+    def group_updates(self, updates: List[Update]) -> List[List[Update]]:
+        """
+        Group updates according to the digest mode, keeping their order
+        :param updates: a list of updates
+        :return: a list of updates groups
+        """
+        if self.digest == "run":
+            return [updates] if updates else []
+        if self.digest == "device":
+            groups: Dict[Tuple[str, str], List[Update]] = {}
+            for update in updates:
+                groups.setdefault((update.device, update.branch), []).append(update)
+            return list(groups.values())
+        return [[update] for update in updates]
+
+    def _header(self, message: str) -> str:
+        """Add the updates source to a message title"""
+        if self.source == "website":
+            return f"{message} (on the official website)\n"
+        if self.source == "updater":
+            return f"{message} (via OTA)\n"
+        return f"{message}\n"
 
-    def generate_message(self, update: Update) -> (str, InlineKeyboardMarkup):
+    def generate_message(
+        self, update: Update, incrementals: Optional[Dict[str, Update]] = None
+    ) -> Tuple[str, dict]:
         """
         Generate an update message from and `Update` object
         :param update: an Update object that contains update's information from official website
+        :param incrementals: incremental updates by version, queried if not given
         :return: A string containing the update's message
          and inline keyboard that has download link'
         """
-        message: str = f"New update available!"
-        if self.source == "website":
-            message += " (on the official website)\n"
-        elif self.source == "updater":
-            message += " (via OTA)\n"
-        else:
-            message += "\n"
+        message: str = self._header("New update available!")
         message += (
             f"*Device*: {update.device}\n"
             f"*Region*: {update.region}\n"
@@ -61,27 +148,136 @@ class TelegramBot:
             f"*MD5*: `{update.md5}`\n"
             f"*Changelog*:\n```{update.changelog}```"
         )
-        button: InlineKeyboardButton = InlineKeyboardButton("Full ROM", update.link)
-        incremental = get_incremental(update.version)
+        button: dict = {"text": "Full ROM", "url": update.link}
+        incremental = (
+            incrementals.get(update.version)
+            if incrementals is not None
+            else get_incremental(update.version)
+        )
         if incremental:
-            incremental_button: InlineKeyboardButton = InlineKeyboardButton(
-                "Incremental", incremental.link
+            incremental_button: dict = {"text": "Incremental", "url": incremental.link}
+            return message, {"inline_keyboard": [[button], [incremental_button]]}
+        return message, {"inline_keyboard": [[button]]}
+
+    def generate_digest(
+        self, updates: List[Update], incrementals: Dict[str, Update]
+    ) -> Tuple[str, dict]:
+        """
+        Generate a single message for a group of updates
+        :param updates: a list of updates
+        :param incrementals: incremental updates by version
+        :return: A string containing the updates message
+         and inline keyboard that has a row of download links for each update
+        """
+        message: str = self._header(f"{len(updates)} new updates available!")
+        keyboard: List[List[dict]] = []
+        changelogs: List[str] = []
+        for update in updates:
+            message += (
+                f"\n*{update.device}* - {update.region} ({update.branch})\n"
+                f"*Version*: ```{update.version}```\n"
+                f"*Release Date*: {update.date}\n"
+                f"*Size*: {update.size}\n"
+                f"*MD5*: `{update.md5}`\n"
             )
-            return message, InlineKeyboardMarkup([[button], [incremental_button]])
-        return message, InlineKeyboardMarkup([[button]])
+            if update.changelog not in changelogs:
+                changelogs.append(update.changelog)
+            row = [{"text": f"{update.device} {update.region}", "url": update.link}]
+            incremental = incrementals.get(update.version)
+            if incremental:
+                row.append({"text": "Incremental", "url": incremental.link})
+            keyboard.append(row)
+        message += "\n*Changelog*:\n" + "\n".join(
+            f"```{changelog}```" for changelog in changelogs
+        )
+        return message, {"inline_keyboard": keyboard}
 
-    def send_telegram_message(self, message: str, reply_markup: InlineKeyboardMarkup):
+    @METRICS.timed("telegram_send")
+    async def drain(self) -> int:
+        """
+        Send all queued messages of the chat, including the ones left by previous runs.
+        A message that keeps failing, or that Telegram asks to hold back for longer than
+        `max_retry_after`, is left for the next run, along with the messages after it.
+        :return: number of sent messages
+        """
+        sent = 0
+        for message in await self.db.read(get_outbox, str(self.chat)):
+            failures = 0
+            while message.sent is None and message.failed is None:
+                await self.limiter.acquire()
+                outcome = await self.send_telegram_message(message)
+                METRICS.count("telegram_requests")
+                await self.db.write(save_outbox, message)
+                if outcome == "deferred":
+                    break
+                if outcome != "retry":
+                    continue
+                failures += 1
+                if failures >= self.max_attempts:
+                    break
+                await asyncio.sleep(min(2**failures, 60) * random.uniform(0.5, 1))
+            if message.failed is not None:
+                logger.warning(f"Giving up on message {message.id}: {message.error}")
+                METRICS.count("telegram_messages_failed")
+                continue
+            if message.sent is None:
+                reason = (
+                    f"is rate limited for more than {self.max_retry_after}s"
+                    if outcome == "deferred"
+                    else f"failed {failures} times"
+                )
+                logger.warning(
+                    f"Message {message.id} {reason} ({message.error}), "
+                    f"it's left for the next run with the following messages"
+                )
+                METRICS.count("telegram_messages_deferred")
+                break
+            sent += 1
+            METRICS.count("telegram_messages_sent")
+        return sent
+
+    async def send_telegram_message(self, message: OutboxMessage) -> str:
         """
         Send a message to Telegram chat
-        :param message: A string of the update message to be sent
-        :param reply_markup: A inline keyboard markup object that contains the update list
-        :return:
+        :param message: An outbox message that contains the update message and its inline keyboard
+        :return: the request outcome: "sent", "rate_limited" if it has to be sent again after
+         the rate limit wait, "deferred" if the wait is longer than `max_retry_after`,
+         "retry" after a transient error, or "failed" if Telegram rejected it
         """
-        self.updater.bot.send_message(
-            chat_id=self.chat,
-            text=message,
-            parse_mode="Markdown",
-            disable_web_page_preview="yes",
-            reply_markup=reply_markup,
-        )
-        sleep(5)
+        payload = {
+            "chat_id": self.chat,
+            "text": message.text,
+            "parse_mode": "Markdown",
+            "disable_web_page_preview": True,
+        }
+        if message.reply_markup:
+            payload["reply_markup"] = json.loads(message.reply_markup)
+        try:
+            async with get_transport().session.post(
+                f"{self.api_url}/bot{self.token}/sendMessage", json=payload
+            ) as response:
+                result: dict = await response.json(content_type=None)
+        except (ClientError, asyncio.TimeoutError, ValueError) as error:
+            message.attempts += 1
+            message.error = repr(error)
+            return "retry"
+        if result.get("ok"):
+            message.attempts += 1
+            message.sent = time()
+            message.error = None
+            return "sent"
+        message.error = result.get("description", f"HTTP {response.status}")
+        retry_after = (result.get("parameters") or {}).get("retry_after")
+        if retry_after is not None:
+            # too many requests, wait as long as Telegram asks before sending anything else,
+            # the message wasn't processed so it doesn't count as an attempt
+            if retry_after > self.max_retry_after:
+                return "deferred"
+            self.limiter.pause(retry_after)
+            return "rate_limited"
+        message.attempts += 1
+        if response.status >= 500 or response.status == 429:
+            return "retry"
+        # other client errors won't succeed on retry
+        message.failed = time()
+        return "failed"
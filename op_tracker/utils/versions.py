@@ -0,0 +1,155 @@
+"""
+Software version resolution and parsing
+
+Versions are extracted from update file names. Irregular `_OTA_xxx_all` file names don't contain
+the full version, so it's built from a reference version of the same device and branch.
+"""
+# the database module is imported when it's needed, it's slow to import
+# pylint: disable=import-outside-toplevel
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+REGULAR_FILE = re.compile(r"_\d{2}\.\w\.\d{2}")
+IRREGULAR_FILE = re.compile(r"_\d{2}_OTA_\d{3}_all")
+IRREGULAR_BUILD = re.compile(r"_OTA_(\d{3})_all")
+OTA_PART = re.compile("_OTA")
+ALL_PART = re.compile("_all")
+HASH_PART = re.compile(r"_[a-z0-9]{16}\.zip")
+MINOR_PART = re.compile(r"\.\d{2}")
+BUILD_PART = re.compile(r"_\d{3}_")
+TIMESTAMP_PART = re.compile(r"_\d{10}_")
+VERSION = re.compile(
+    r"^(?P<device>[^_]+)_(?P<major>\d+)\.(?P<letter>\w)\.(?P<minor>\d+)"
+    r"(?:_(?P<variant>[A-Z]+))?_(?P<build>\d+)_(?P<timestamp>\d+)$"
+)
+
+ReferenceRows = Iterable[Tuple[str, str, str]]
+
+
+def file_prefix(filename: str) -> str:
+    """
+    Get the device prefix of an update file name, references are matched on it
+    regardless of its case, like the `LIKE` lookup they replace
+    :param filename: update file name
+    :return: lowercase first part of the file name
+    """
+    return filename.split("_")[0].lower()
+
+
+@dataclass(frozen=True, order=True)
+class VersionKey:
+    """
+    A class representing a parsed software version, ordered by its numeric parts
+    :param major: int - major version number
+    :param minor: int - minor version number
+    :param build: int - build number
+    :param timestamp: int - build timestamp
+    :param device: str - device part of the version
+    :param letter: str - region letter
+    :param variant: str - version variant (e.g. GLO)
+    """
+
+    major: int
+    minor: int
+    build: int
+    timestamp: int
+    device: str = field(compare=False)
+    letter: str = field(compare=False)
+    variant: str = field(default="", compare=False)
+
+
+@lru_cache(maxsize=4096)
+def parse_version(version: str) -> Optional[VersionKey]:
+    """
+    Parse a version string into a comparable key
+    :param version: OnePlus software version, e.g. OnePlus7ProOxygen_21.P.45_0450_2206171138
+    :return: VersionKey object, or None if the version isn't in the known format
+    """
+    match = VERSION.match(version or "")
+    if not match:
+        return None
+    return VersionKey(
+        major=int(match.group("major")),
+        minor=int(match.group("minor")),
+        build=int(match.group("build")),
+        timestamp=int(match.group("timestamp")),
+        device=match.group("device"),
+        letter=match.group("letter"),
+        variant=match.group("variant") or "",
+    )
+
+
+class VersionResolver:
+    """
+    Version resolver that keeps a reference version for each (device prefix, branch),
+    device prefixes are matched case-insensitively
+
+    References are loaded once, on the first irregular file name, and kept current
+    as new updates are added.
+    :meth: `resolve` Get the version of an update file.
+    :meth: `remember` Record the version of a new update.
+    """
+
+    def __init__(self, loader: Callable[[], ReferenceRows]):
+        """
+        VersionResolver class constructor
+        :param loader: a function that returns (filename, branch, version) rows
+         of the first update of each device prefix and branch
+        """
+        self._loader = loader
+        self._references: Optional[Dict[Tuple[str, str], str]] = None
+
+    @property
+    def references(self) -> Dict[Tuple[str, str], str]:
+        """Reference versions by (device prefix, branch)"""
+        if self._references is None:
+            self._references = {}
+            for filename, branch, version in self._loader():
+                self._references.setdefault((file_prefix(filename), branch), version)
+        return self._references
+
+    def remember(self, filename: str, branch: str, version: str):
+        """
+        Record the version of a new update, it's used as a reference if it's the first one
+        :param filename: update file name
+        :param branch: update branch
+        :param version: update version
+        """
+        if self._references is not None and version:
+            self._references.setdefault((file_prefix(filename), branch), version)
+
+    def resolve(self, filename: str, branch: str) -> str:
+        """
+        Get the version of an update file
+        :param filename: update file name
+        :param branch: update branch
+        :return: version, or an empty string if it can't be resolved
+        """
+        version: str = ""
+        if REGULAR_FILE.search(filename):
+            version = OTA_PART.sub("", filename)
+            version = ALL_PART.sub("", version)
+            version = HASH_PART.sub("", version)
+        elif IRREGULAR_FILE.search(filename):
+            reference = self.references.get((file_prefix(filename), branch))
+            if reference:
+                split_version = IRREGULAR_BUILD.search(filename).group(1)
+                version = MINOR_PART.sub(f".{split_version[1:]}", reference)
+                version = BUILD_PART.sub(f"_{split_version}_", version)
+                version = TIMESTAMP_PART.sub(filename.split("_")[-2], version)
+        return version
+
+
+_resolver: Optional[VersionResolver] = None
+
+
+def get_version_resolver() -> VersionResolver:
+    """Get the shared version resolver, its references are loaded from the database"""
+    global _resolver  # pylint: disable=global-statement
+    if _resolver is None:
+        from op_tracker.common.database.database import get_reference_versions
+
+        _resolver = VersionResolver(get_reference_versions)
+    return _resolver
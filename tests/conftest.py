@@ -0,0 +1,45 @@
+"""
+Tests configuration
+
+The tracker reads its work directory and configuration file from the environment
+when it's imported, so they're pointed to a temporary directory before any test module
+imports it.
+"""
+import os
+from pathlib import Path
+from tempfile import mkdtemp
+
+import pytest
+
+WORK_DIR = Path(mkdtemp(prefix="op_tracker_tests_"))
+(WORK_DIR / "config.yml").write_text("db: tests\n")
+os.environ["OP_TRACKER_WORK_DIR"] = str(WORK_DIR)
+os.environ["OP_TRACKER_CONFIG"] = str(WORK_DIR / "config.yml")
+
+
+@pytest.fixture
+def make_update():
+    """Factory of Update objects of a device, with the given checksum and file name"""
+
+    # the tracker is imported once the environment is set
+    from op_tracker.common.database.models.update import Update
+
+    def factory(md5: str, filename: str) -> Update:
+        return Update(
+            device="OnePlus 9",
+            region="Global",
+            version="OnePlus9Oxygen_22.E.13_0130_2106111111",
+            branch="Stable",
+            type="Full",
+            size="3 GB",
+            md5=md5,
+            filename=filename,
+            link=f"https://oxygenos.oneplus.net/{filename}",
+            date="2021-06-11",
+            changelog="System\n• Improved system stability",
+            changelog_link=None,
+            insert_date="2021-06-11 00:00:00",
+            product="OnePlus9",
+        )
+
+    return factory
@@ -0,0 +1,31 @@
+"""Async database layer tests"""
+import asyncio
+
+from op_tracker.common.database.async_db import AsyncDatabase
+from op_tracker.common.database.database import get_md5_index
+from op_tracker.utils.versions import get_version_resolver
+
+
+def test_only_written_updates_are_indexed(make_update):
+    written = make_update("5" * 32, "AsyncWritten_22.E.13_OTA_0130_all.zip")
+    clash = make_update("6" * 32, "AsyncClash_22.E.13_OTA_0130_all.zip")
+    # the same link as a stored update
+    clash.link = written.link
+
+    async def run():
+        database = AsyncDatabase(readers=1)
+        try:
+            await database.prepare()
+            assert await database.add_updates([written]) == [written]
+            assert await database.flush() == []
+            assert await database.add_updates([clash]) == [clash]
+            return await database.flush()
+        finally:
+            database.close()
+
+    assert asyncio.run(run()) == [clash]
+    references = get_version_resolver().references
+    assert ("asyncwritten", "Stable") in references
+    assert ("asyncclash", "Stable") not in references
+    assert written.md5 in get_md5_index()
+    assert clash.md5 not in get_md5_index()
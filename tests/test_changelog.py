@@ -0,0 +1,58 @@
+"""Changelog parser tests, the output must match the BeautifulSoup based parser it replaced"""
+import re
+
+import pytest
+from bs4 import BeautifulSoup
+
+from op_tracker.utils.changelog import ChangelogParser, clean_changelog
+
+SAMPLES = [
+    "",
+    "Plain text changelog",
+    "<p><strong>System</strong></p><p>• Updated Android security patch to 2022.06</p>"
+    "<p>• Improved system stability</p>",
+    "<div>\n  <h3>Camera</h3>\n  <ul>\n    <li>Optimized  image quality</li>\n"
+    "    <li>Fixed known issues</li>\n  </ul>\n</div>",
+    "<p>System</p><p>&nbsp;</p><p>• Improved&nbsp;stability</p>",
+    # entities and character references
+    "<p>Fixed &lt;b&gt; tag display</p>",
+    "<p>a &amp;amp; b &amp; c</p>",
+    "<p>&#8226; bullet &#x2022; hex &bull; named</p>",
+    "<p>&copy 2021 &unknown; &amp</p>",
+    "<p>AT&T and R&D</p>",
+    # malformed markup
+    "<p>unclosed <b>bold<i>italic",
+    "</div>stray closing</p> text",
+    "<p class='x>broken attribute</p>after",
+    "a < b and c > d",
+    "<br/>line<br>break<br />end",
+    "<p>text<!-- a comment -->more</p>",
+    "<!DOCTYPE html><html><head><style>p {color: red}</style>"
+    "<script>var a = '<p>';</script></head><body><p>body</p></body></html>",
+    "<p><![CDATA[cdata text]]></p>",
+    "<pre>  preserved\n\n  whitespace </pre><p> after </p>",
+    "<p>•  spaced bullet</p> • inline bullet",
+    "   \n\t  ",
+    "<p>\xa0non breaking\xa0space</p>",
+]
+
+
+def reference(html: str) -> str:
+    """The previous changelog parser"""
+    changelog = BeautifulSoup(html, "html.parser").get_text(separator="\n")
+    changelog = re.sub(r"\s\s+", r" ", changelog)
+    changelog = re.sub(" •", r"\n•", changelog)
+    changelog = re.sub(r"\s+$", "", changelog)
+    return re.sub(r"\xa0", "", changelog)
+
+
+@pytest.mark.parametrize("html", SAMPLES)
+def test_same_output_as_beautifulsoup(html):
+    assert clean_changelog(html) == reference(html)
+
+
+def test_parser_cache():
+    parser = ChangelogParser(max_size=1)
+    assert parser.parse(SAMPLES[2]) == reference(SAMPLES[2])
+    assert parser.parse(SAMPLES[2]) == reference(SAMPLES[2])
+    assert (parser.hits, parser.misses) == (1, 1)
@@ -0,0 +1,75 @@
+"""Daemon mode scheduling tests"""
+import asyncio
+from typing import List
+
+from op_tracker import daemon
+from op_tracker.daemon import Daemon
+
+REGIONS = [{"code": "cn"}, {"code": "in"}, {"code": "eu"}]
+
+
+def test_intervals_from_config():
+    extra = object()
+    scheduler = Daemon.from_config(
+        {"interval": 600, "intervals": {"cn": 60}}, REGIONS, extra
+    )
+    assert scheduler.intervals == {"cn": 60, "in": 600, "eu": 600, "extra": 600}
+    # without an extra source there's no extra job
+    assert "extra" not in Daemon.from_config({}, REGIONS).intervals
+    assert Daemon.from_config({}, REGIONS).intervals["cn"] == 3600
+
+
+def test_due_jobs():
+    scheduler = Daemon({"cn": 60, "in": 600})
+    assert scheduler.due(0) == ["cn", "in"]
+    scheduler._next_run = {"cn": 60, "in": 600}  # pylint: disable=protected-access
+    assert scheduler.due(59) == []
+    assert scheduler.due(60) == ["cn"]
+
+
+def test_regions_run_on_their_own_intervals(monkeypatch):
+    runs: List[List[str]] = []
+    running: List[bool] = []
+
+    async def official(regions):
+        # runs never overlap
+        assert not running
+        running.append(True)
+        runs.append(sorted(regions))
+        await asyncio.sleep(0.01)
+        running.pop()
+        if len(runs) == 2:
+            raise RuntimeError("a failed run doesn't stop the daemon")
+
+    monkeypatch.setattr(daemon, "official", official)
+    scheduler = Daemon({"cn": 0.1, "in": 0.35})
+
+    async def run():
+        asyncio.get_running_loop().call_later(0.5, scheduler.stop)
+        await scheduler.run_forever()
+
+    asyncio.run(run())
+    # both regions run together first, then cn runs alone until in is due again
+    assert runs[:4] == [["cn", "in"], ["cn"], ["cn"], ["cn"]]
+    assert runs[4] in (["cn", "in"], ["in"])
+    assert runs.count(["cn"]) > sum(1 for regions in runs if "in" in regions)
+
+
+def test_extra_source_runs_as_its_own_job(monkeypatch):
+    calls: List[str] = []
+
+    async def official(regions):
+        calls.extend(regions)
+
+    async def extra():
+        calls.append("extra")
+
+    monkeypatch.setattr(daemon, "official", official)
+    scheduler = Daemon({"cn": 10, "extra": 10}, extra)
+
+    async def run():
+        asyncio.get_running_loop().call_later(0.05, scheduler.stop)
+        await scheduler.run_forever()
+
+    asyncio.run(run())
+    assert calls == ["cn", "extra"]
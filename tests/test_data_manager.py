@@ -0,0 +1,57 @@
+"""Data files manager tests"""
+import json
+import os
+
+from op_tracker.utils.data_manager import DataManager
+
+
+def test_unchanged_files_are_not_rewritten(tmp_path):
+    file = tmp_path / "cn.yml"
+    assert DataManager.write_file(file, [{"name": "OnePlus 9"}])
+    mtime = file.stat().st_mtime_ns
+    assert not DataManager.write_file(file, [{"name": "OnePlus 9"}])
+    assert file.stat().st_mtime_ns == mtime
+    assert DataManager.write_file(file, [{"name": "OnePlus 10"}])
+    assert DataManager.read_file(file) == [{"name": "OnePlus 10"}]
+    # a file changed outside of the data manager is written again
+    file.write_text("[]\n")
+    assert DataManager.write_file(file, [{"name": "OnePlus 10"}])
+
+
+def test_manifest_is_shared_by_paths_of_the_same_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert DataManager.write_file("latest.yml", ["OnePlus 9"])
+    assert not DataManager.write_file(tmp_path / "latest.yml", ["OnePlus 9"])
+    assert list(json.loads((tmp_path / DataManager.MANIFEST).read_text())) == [
+        "latest.yml"
+    ]
+
+
+def test_manifest_saved_by_another_process_is_read_again(tmp_path):
+    first, second = tmp_path / "first.yml", tmp_path / "second.yml"
+    DataManager.write_file(first, ["OnePlus 9"])
+    DataManager.write_file(second, ["OnePlus 9"])
+    manifest_file = tmp_path / DataManager.MANIFEST
+    # another process has rewritten the first file and its manifest entry
+    first.write_text("- OnePlus 10\n")
+    manifest = json.loads(manifest_file.read_text())
+    stat = first.stat()
+    manifest["first.yml"] = {
+        "sha256": "other",
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    manifest_file.write_text(json.dumps(manifest))
+    os.utime(manifest_file, ns=(stat.st_mtime_ns + 1, stat.st_mtime_ns + 1))
+    assert DataManager.content_hash(first) == "other"
+
+
+def test_batch_saves_the_manifest_once(tmp_path):
+    with DataManager.batch():
+        for name in ("first", "second"):
+            assert DataManager.write_file(tmp_path / f"{name}.yml", [name])
+        assert not (tmp_path / DataManager.MANIFEST).exists()
+    assert sorted(json.loads((tmp_path / DataManager.MANIFEST).read_text())) == [
+        "first.yml",
+        "second.yml",
+    ]
@@ -0,0 +1,78 @@
+"""Latest updates table tests"""
+from sqlalchemy.orm import sessionmaker
+
+from op_tracker.common.database import get_engine
+from op_tracker.common.database.database import rebuild_latest
+from op_tracker.common.database.models.latest_update import LatestUpdate
+from op_tracker.common.database.models.update import Update
+from op_tracker.common.database.writer import UpdatesWriter
+
+
+def make_product_update(make_update, product: str, date: str, number: int):
+    update = make_update(f"{product}{number}".ljust(32, "0"), f"{product}_{number}.zip")
+    update.product = product
+    update.date = date
+    return update
+
+
+def latest(session, product: str):
+    """Checksum and date of the product's latest update"""
+    return (
+        session.query(Update.md5, LatestUpdate.date)
+        .join(LatestUpdate, LatestUpdate.update_id == Update.id)
+        .filter(LatestUpdate.product == product)
+        .one_or_none()
+    )
+
+
+def test_inserted_update_replaces_an_older_latest(make_update):
+    session = sessionmaker(bind=get_engine())()
+    writer = UpdatesWriter(session)
+    first = make_product_update(make_update, "TriggerInsert", "2021-06-11", 1)
+    writer.add(first)
+    writer.flush()
+    assert latest(session, "TriggerInsert") == (first.md5, "2021-06-11")
+    newer = make_product_update(make_update, "TriggerInsert", "2021-07-01", 2)
+    writer.add(newer)
+    writer.flush()
+    assert latest(session, "TriggerInsert") == (newer.md5, "2021-07-01")
+
+
+def test_inserted_older_update_keeps_the_latest(make_update):
+    session = sessionmaker(bind=get_engine())()
+    writer = UpdatesWriter(session)
+    newer = make_product_update(make_update, "TriggerOlder", "2021-07-01", 1)
+    writer.add(newer)
+    writer.flush()
+    older = make_product_update(make_update, "TriggerOlder", "2021-06-11", 2)
+    incremental = make_product_update(make_update, "TriggerOlder", "2021-08-01", 3)
+    incremental.type = "Incremental"
+    writer.add_all([older, incremental])
+    writer.flush()
+    assert latest(session, "TriggerOlder") == (newer.md5, "2021-07-01")
+
+
+def test_deleted_latest_falls_back_to_the_previous_update(make_update):
+    session = sessionmaker(bind=get_engine())()
+    writer = UpdatesWriter(session)
+    older = make_product_update(make_update, "TriggerDelete", "2021-06-11", 1)
+    newer = make_product_update(make_update, "TriggerDelete", "2021-07-01", 2)
+    writer.add_all([older, newer])
+    writer.flush()
+    session.query(Update).filter(Update.md5 == newer.md5).delete()
+    session.commit()
+    assert latest(session, "TriggerDelete") == (older.md5, "2021-06-11")
+
+
+def test_rebuilt_latest_matches_the_triggers(make_update):
+    session = sessionmaker(bind=get_engine())()
+    writer = UpdatesWriter(session)
+    updates = [
+        make_product_update(make_update, "TriggerRebuild", date, number)
+        for number, date in enumerate(("2021-06-11", "2021-08-01", "2021-07-01"))
+    ]
+    writer.add_all(updates)
+    writer.flush()
+    assert latest(session, "TriggerRebuild") == (updates[1].md5, "2021-08-01")
+    rebuild_latest()
+    assert latest(session, "TriggerRebuild") == (updates[1].md5, "2021-08-01")
@@ -0,0 +1,86 @@
+"""Fake store API tests, through the tracker API client"""
+# pylint: disable=protected-access
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from benchmarks.fake_store import FakeStore, FakeStoreOptions
+from op_tracker import CONFIG
+from op_tracker.common.api_client.resilience import RetryPolicy, TransientError
+from op_tracker.common.api_client.transport import close_transport
+from op_tracker.official.api_client.api_client import APIClient
+
+
+async def with_store(options: FakeStoreOptions, monkeypatch, check):
+    """Run a check against a fake store, with an API client of the `test` region"""
+    runner = web.AppRunner(FakeStore(options).app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    monkeypatch.setitem(CONFIG.data, "store_api_url", f"http://127.0.0.1:{port}")
+    api = APIClient("test")
+    api.caller.policy = RetryPolicy(attempts=1)
+    try:
+        return await check(api)
+    finally:
+        await close_transport()
+        await runner.cleanup()
+
+
+def systems(code: str) -> str:
+    return f'{{"storeCode": "test", "phoneCode": "{code}"}}'
+
+
+def test_devices_and_updates_have_the_api_shape(monkeypatch):
+    options = FakeStoreOptions(devices=3, updates=2, latency=0, churn=0)
+
+    async def check(api):
+        devices = await api.get_devices()
+        return devices, await api._request(systems(devices[0].code))
+
+    devices, updates = asyncio.run(with_store(options, monkeypatch, check))
+    assert [device.code for device in devices] == [
+        "PMtest0000",
+        "PMtest0001",
+        "PMtest0002",
+    ]
+    assert len(updates) == 2
+    assert (
+        updates[0]["versionLink"]
+        .split("/")[-1]
+        .startswith("OnePlus0TESTOxygen_11.J.00_OTA")
+    )
+    assert {
+        "versionSign",
+        "versionType",
+        "versionLog",
+        "versionReleaseTime",
+    } <= updates[0].keys()
+
+
+def test_responses_depend_on_the_seed_and_churn(monkeypatch):
+    async def check(api):
+        return [await api._request(systems("PMtest0000")) for _ in range(2)]
+
+    first = asyncio.run(
+        with_store(FakeStoreOptions(latency=0, churn=1), monkeypatch, check)
+    )
+    again = asyncio.run(
+        with_store(FakeStoreOptions(latency=0, churn=1), monkeypatch, check)
+    )
+    assert first == again
+    # every request gets a new update, the oldest one goes away
+    assert first[0][1:] == first[1][:-1]
+    assert first[0][0] not in first[1]
+
+
+def test_errors_are_transient(monkeypatch):
+    async def check(api):
+        return await api._request(systems("PMtest0000"))
+
+    with pytest.raises(TransientError):
+        asyncio.run(
+            with_store(FakeStoreOptions(latency=0, error_rate=1), monkeypatch, check)
+        )
@@ -0,0 +1,89 @@
+"""Git publisher tests, against a local bare remote"""
+import asyncio
+import subprocess
+from pathlib import Path
+
+from op_tracker.utils.git import GitPublisher
+
+
+def git(repo: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=repo, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def make_repo(tmp_path: Path) -> Path:
+    remote = tmp_path / "remote.git"
+    git(tmp_path, "init", "-q", "--bare", str(remote))
+    repo = tmp_path / "repo"
+    (repo / "data").mkdir(parents=True)
+    (repo / "data" / "latest.yml").write_text("[]\n")
+    git(repo, "init", "-q")
+    git(repo, "add", ".")
+    git(
+        repo,
+        "-c",
+        "user.name=test",
+        "-c",
+        "user.email=test@example.com",
+        "commit",
+        "-q",
+        "-m",
+        "init",
+    )
+    return repo
+
+
+def remote_head(tmp_path: Path) -> str:
+    return git(tmp_path / "remote.git", "rev-parse", "master")
+
+
+def test_changed_data_files_are_committed(tmp_path):
+    repo = make_repo(tmp_path)
+    publisher = GitPublisher(repo, str(tmp_path / "remote.git"))
+    (repo / "data" / "latest.yml").write_text("- update\n")
+    (repo / "data" / "cn.yml").write_text("- device\n")
+    # only one file is reported, the other one was left by an earlier run
+    report = asyncio.run(publisher.publish([repo / "data" / "cn.yml"]))
+    assert report.committed and report.pushed
+    assert git(repo, "status", "--porcelain") == ""
+    assert remote_head(tmp_path) == git(repo, "rev-parse", "HEAD")
+
+
+def test_pending_commits_are_pushed_without_changes(tmp_path):
+    repo = make_repo(tmp_path)
+    publisher = GitPublisher(repo, str(tmp_path / "missing.git"))
+    (repo / "data" / "latest.yml").write_text("- update\n")
+    report = asyncio.run(publisher.publish([]))
+    assert report.committed and not report.pushed
+    # the remote is back, the next run has nothing to commit but pushes the waiting commit
+    publisher.remote = str(tmp_path / "remote.git")
+    report = asyncio.run(publisher.publish([]))
+    assert not report.committed and report.pushed
+    assert remote_head(tmp_path) == git(repo, "rev-parse", "HEAD")
+    assert asyncio.run(publisher.pending_commits()) == 0
+
+
+def test_commits_are_batched(tmp_path):
+    repo = make_repo(tmp_path)
+    publisher = GitPublisher(repo, str(tmp_path / "remote.git"), push_every=2)
+    (repo / "data" / "latest.yml").write_text("- first\n")
+    assert asyncio.run(publisher.publish([])).pushed
+    (repo / "data" / "latest.yml").write_text("- second\n")
+    report = asyncio.run(publisher.publish([]))
+    assert report.committed and not report.pushed
+    (repo / "data" / "latest.yml").write_text("- third\n")
+    report = asyncio.run(publisher.publish([]))
+    assert report.committed and report.pushed
+
+
+def test_pending_commits_are_counted_against_the_remote_branch(tmp_path):
+    repo = make_repo(tmp_path)
+    git(repo, "push", "-q", str(tmp_path / "remote.git"), "HEAD:master")
+    publisher = GitPublisher(repo, str(tmp_path / "remote.git"), push_every=2)
+    # the publisher hasn't pushed yet, but HEAD is already on the remote
+    assert asyncio.run(publisher.pending_commits()) == 0
+    (repo / "data" / "latest.yml").write_text("- update\n")
+    report = asyncio.run(publisher.publish([]))
+    assert report.committed and not report.pushed
+    assert asyncio.run(publisher.pending_commits()) == 1
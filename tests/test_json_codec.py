@@ -0,0 +1,55 @@
+"""API responses decoding tests"""
+import json
+
+import pytest
+
+from op_tracker.utils.json_codec import CODECS, EnvelopeError, decode_envelope
+
+UPDATE = {
+    "versionNo": "OnePlus9Oxygen_22.E.13",
+    "versionLog": '<p>"data": {"ret": 0}</p>',
+}
+
+
+def envelope(**fields) -> bytes:
+    return json.dumps(fields).encode()
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+def test_data_is_decoded(codec):
+    content = envelope(ret=1, errCode=0, errMsg="", data=[UPDATE])
+    assert decode_envelope(content, codec) == [UPDATE]
+    # the payload can come first, the envelope fields are checked after parsing
+    content = envelope(data=[UPDATE], ret=1, errCode=0)
+    assert decode_envelope(content, codec) == [UPDATE]
+
+
+def test_error_envelope_is_rejected():
+    with pytest.raises(EnvelopeError):
+        decode_envelope(envelope(ret=0, errCode=100, errMsg="error", data=None))
+    with pytest.raises(EnvelopeError):
+        decode_envelope(envelope(data=[UPDATE], ret=0, errCode=100))
+    with pytest.raises(EnvelopeError):
+        decode_envelope(b"[]")
+    with pytest.raises(ValueError):
+        decode_envelope(b"<html>")
+
+
+def test_nested_fields_are_not_taken_for_the_envelope():
+    # nested fields that look like the envelope, before the payload
+    content = envelope(ret=0, errCode=5, info={"ret": 1, "errCode": 0}, data=[UPDATE])
+    with pytest.raises(EnvelopeError):
+        decode_envelope(content)
+    content = envelope(ret=1, errCode=0, info={"ret": 0, "errCode": 5}, data=[UPDATE])
+    assert decode_envelope(content) == [UPDATE]
+    # a nested data key isn't taken for the payload
+    content = envelope(info={"data": 1}, ret=1, errCode=0, data=[UPDATE])
+    assert decode_envelope(content) == [UPDATE]
+
+
+def test_field_names_in_values_are_not_taken_for_the_envelope():
+    content = envelope(errMsg='"ret": 0, "data": ', ret=1, errCode=0, data=[UPDATE])
+    assert decode_envelope(content) == [UPDATE]
+    content = envelope(errMsg="data", ret=0, errCode=3, data=[UPDATE])
+    with pytest.raises(EnvelopeError):
+        decode_envelope(content)
@@ -0,0 +1,31 @@
+"""In-memory md5 index tests"""
+from op_tracker.common.database.md5_index import Md5Index
+
+STORED = "0123456789abcdef0123456789abcdef"
+NEW = "fedcba9876543210fedcba9876543210"
+
+
+def test_lookup_ignores_case():
+    index = Md5Index([STORED])
+    assert STORED in index
+    assert STORED.upper() in index
+    assert NEW not in index
+    # checksums that aren't hex are kept as they are
+    index.add("not-a-checksum")
+    assert "NOT-A-CHECKSUM" in index
+    assert len(index) == 2
+
+
+def test_filter_new_keeps_order_without_duplicates():
+    index = Md5Index([STORED])
+    other = "1" * 32
+    assert index.filter_new([NEW, STORED, other, NEW.upper()]) == [NEW, other]
+
+
+def test_add_and_discard():
+    index = Md5Index()
+    index.add(NEW)
+    assert index.filter_new([NEW]) == []
+    index.discard(NEW)
+    index.discard(NEW)
+    assert NEW not in index
@@ -0,0 +1,26 @@
+"""Schema migrations tests"""
+from sqlalchemy import create_engine, inspect, text
+
+from op_tracker.common.database import migrations
+from op_tracker.common.database.migrations import MIGRATIONS, Migration, migrate
+
+
+def test_failed_migration_is_rolled_back(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    version = migrate(engine)
+    failing = Migration(
+        version + 1,
+        "DDL then an error",
+        ("CREATE TABLE partial (id INTEGER)", "CREATE INDEX broken ON missing (id)"),
+    )
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS + [failing])
+    try:
+        migrate(engine)
+    except Exception:  # pylint: disable=broad-except
+        pass
+    else:
+        raise AssertionError("the migration should have failed")
+    # the table created before the error isn't left behind, and the version isn't bumped
+    assert "partial" not in inspect(engine).get_table_names()
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA user_version")).scalar() == version
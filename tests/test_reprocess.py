@@ -0,0 +1,44 @@
+"""Reprocess command tests"""
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from op_tracker.common.database import get_engine
+from op_tracker.common.database.models.changelog import Changelog
+from op_tracker.common.database.models.update import Update
+from op_tracker.common.database.writer import UpdatesWriter
+from op_tracker.reprocess import Reprocessor
+
+CHANGELOGS = {
+    # raw changelogs, stored before they were cleaned
+    "1" * 32: ("<p>Fixed &lt;b&gt; tag display</p>", "Fixed <b> tag display"),
+    "2" * 32: ("<p>a &amp;amp; b</p><br>", "a &amp; b"),
+    # clean changelogs whose text looks like markup
+    "3" * 32: ("Fixed <b> tag display", "Fixed <b> tag display"),
+    "4" * 32: ("a &amp; b", "a &amp; b"),
+}
+
+
+def changelogs() -> dict:
+    with get_engine().connect() as connection:
+        return dict(
+            connection.execute(
+                select(Update.md5, Changelog.text)
+                .join(Changelog, Changelog.hash == Update.changelog_hash)
+                .where(Update.md5.in_(list(CHANGELOGS)))
+            ).all()
+        )
+
+
+def test_reprocessing_again_changes_nothing(tmp_path, make_update):
+    writer = UpdatesWriter(sessionmaker(bind=get_engine())())
+    for md5, (changelog, _) in CHANGELOGS.items():
+        update = make_update(md5, f"reprocess_test_{md5[0]}.zip")
+        update.changelog = changelog
+        writer.add(update)
+    writer.flush()
+    checkpoint = tmp_path / "checkpoint.json"
+    Reprocessor(workers=1, checkpoint=checkpoint).run()
+    assert changelogs() == {md5: clean for md5, (_, clean) in CHANGELOGS.items()}
+    report = Reprocessor(workers=1, checkpoint=checkpoint).run()
+    assert report.changed == 0
+    assert changelogs() == {md5: clean for md5, (_, clean) in CHANGELOGS.items()}
@@ -0,0 +1,126 @@
+"""API requests resilience tests, against a fake transport"""
+# pylint: disable=protected-access
+import asyncio
+from typing import List, Optional, Union
+
+import pytest
+
+from op_tracker.common.api_client.resilience import (
+    DeadlineExceeded,
+    RequestError,
+    ResilientCaller,
+    RetryPolicy,
+    TransientError,
+)
+from op_tracker.common.api_client.transport import close_transport
+from op_tracker.official.api_client.api_client import APIClient
+
+Response = Union[str, Exception]
+
+
+class FakeTransport:
+    """Gives the queued responses after their delay, each request attempt takes the next one"""
+
+    def __init__(self, responses: List[Response], delays: Optional[List[float]] = None):
+        self.responses = list(responses)
+        self.delays = list(delays or [0] * len(responses))
+        self.requests = 0
+        self.cancelled = 0
+
+    async def request(self) -> str:
+        self.requests += 1
+        response, delay = self.responses.pop(0), self.delays.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def call(
+    caller: ResilientCaller, transport: FakeTransport, deadline: Optional[float] = None
+):
+    async def run():
+        loop_deadline = (
+            None if deadline is None else asyncio.get_running_loop().time() + deadline
+        )
+        return await caller.call(transport.request, key="test", deadline=loop_deadline)
+
+    return asyncio.run(run())
+
+
+def test_transient_errors_are_retried():
+    caller = ResilientCaller(RetryPolicy(attempts=3, backoff=0))
+    transport = FakeTransport([TransientError("502"), asyncio.TimeoutError(), "ok"])
+    assert call(caller, transport) == "ok"
+    stats = caller.stats
+    assert (stats.calls, stats.retries, stats.failures) == (1, 2, 0)
+
+
+def test_last_error_is_raised_when_attempts_are_exhausted():
+    caller = ResilientCaller(RetryPolicy(attempts=2, backoff=0))
+    transport = FakeTransport([TransientError("502"), TransientError("503")])
+    with pytest.raises(TransientError, match="503"):
+        call(caller, transport)
+    assert (caller.stats.retries, caller.stats.failures) == (1, 1)
+
+
+def test_request_errors_are_not_retried():
+    caller = ResilientCaller(RetryPolicy(attempts=3, backoff=0))
+    transport = FakeTransport([RequestError("400"), "ok"])
+    with pytest.raises(RequestError, match="400"):
+        call(caller, transport)
+    assert transport.requests == 1
+
+
+def test_slow_attempts_time_out():
+    caller = ResilientCaller(RetryPolicy(timeout=0.05, attempts=2, backoff=0))
+    transport = FakeTransport(["slow", "ok"], delays=[1, 0])
+    assert call(caller, transport) == "ok"
+    assert transport.cancelled == 1
+
+
+def test_requests_are_given_up_at_the_deadline():
+    caller = ResilientCaller(RetryPolicy(timeout=1, attempts=3, backoff=0))
+    transport = FakeTransport(["slow", "slow", "slow"], delays=[1, 1, 1])
+    with pytest.raises(DeadlineExceeded):
+        call(caller, transport, deadline=0.05)
+    assert transport.requests == 1
+    assert caller.stats.failures == 1
+
+
+def test_slow_requests_are_hedged():
+    policy = RetryPolicy(
+        timeout=1, hedge=True, hedge_percentile=0.5, hedge_min_samples=3
+    )
+    caller = ResilientCaller(policy)
+    # no hedging until enough latencies are known
+    for _ in range(3):
+        assert call(caller, FakeTransport(["fast"], delays=[0.01])) == "fast"
+    assert caller.stats.hedges == 0
+    transport = FakeTransport(["slow", "hedged"], delays=[1, 0])
+
+    async def run():
+        result = await caller.call(transport.request, key="test")
+        # the losing attempt has been cancelled and awaited by the time the call returns
+        return result, transport.cancelled
+
+    assert asyncio.run(run()) == ("hedged", 1)
+    assert caller.stats.hedges == 1
+
+
+def test_error_envelope_has_no_data():
+    async def run():
+        api = APIClient("test")
+        try:
+            assert api._get_data(b'{"ret": 0, "errCode": 100, "data": null}') == []
+            assert api._get_data(b'{"ret": 1, "errCode": 0, "data": [1]}') == [1]
+            with pytest.raises(RequestError):
+                api._get_data(b"<html>")
+        finally:
+            await close_transport()
+
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+"""Adaptive polling scheduler tests"""
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy.orm import sessionmaker
+
+from op_tracker import CONFIG
+from op_tracker.common.api_client.resilience import DeviceOutcome
+from op_tracker.common.database import get_engine
+from op_tracker.common.database.async_db import close_async_db
+from op_tracker.official.scheduler import PollPolicy, PollScheduler
+from op_tracker.tracker_official import get_scheduler, record_polls
+
+POLICY = PollPolicy(min_interval=100, max_interval=1000, backoff=2)
+
+
+def new_scheduler() -> PollScheduler:
+    return PollScheduler(sessionmaker(bind=get_engine())(), POLICY)
+
+
+def test_intervals_follow_the_device_history():
+    scheduler = new_scheduler()
+    scheduler.record("history", "changed", "a", now=0)
+    assert scheduler.states[("history", "changed")].next_poll == 100
+    # unchanged devices back off, up to the maximum interval
+    for now, interval in ((100, 200), (300, 400), (700, 800), (1500, 1000)):
+        scheduler.record("history", "changed", "a", now=now)
+        assert scheduler.states[("history", "changed")].interval == interval
+    scheduler.record("history", "changed", "b", now=2500)
+    assert scheduler.states[("history", "changed")].interval == 100
+    scheduler.record("history", "failing", None, now=0)
+    scheduler.record("history", "failing", None, now=200)
+    assert scheduler.states[("history", "failing")].error_streak == 2
+    assert scheduler.states[("history", "failing")].interval == 400
+
+
+def test_new_and_overdue_devices_are_selected_first():
+    scheduler = new_scheduler()
+    scheduler.record("select", "recent", "a", now=0)
+    scheduler.record("select", "overdue", "a", now=-1000)
+    scheduler.policy = PollPolicy(budget=2)
+    candidates = [
+        ("select", code, code) for code in ("recent", "overdue", "new", "later")
+    ]
+    scheduler.record("select", "later", "a", now=1000)
+    assert scheduler.select(candidates, now=150) == ["overdue", "new"]
+
+
+def test_devices_cut_by_the_deadline_are_not_recorded(monkeypatch):
+    monkeypatch.setitem(CONFIG.data, "polling", {"enabled": True, "min_interval": 100})
+    api = SimpleNamespace(
+        region="deadline",
+        outcomes={
+            "ok": DeviceOutcome("ok", 1),
+            "failed": DeviceOutcome("failed", 1, "ServerDisconnectedError()"),
+            "timeout": DeviceOutcome("timeout", 1, "DeadlineExceeded()"),
+        },
+        fingerprints={"ok": "a", "failed": None, "timeout": None},
+    )
+    polled = [
+        (None, api, SimpleNamespace(code=code))
+        for code in ("ok", "failed", "timeout", "idle")
+    ]
+
+    async def run():
+        try:
+            await record_polls(await get_scheduler(), polled)
+            return (await get_scheduler()).states
+        finally:
+            close_async_db()
+
+    states = asyncio.run(run())
+    assert states[("deadline", "ok")].error_streak == 0
+    assert states[("deadline", "failed")].error_streak == 1
+    # devices that weren't polled are still due
+    assert ("deadline", "timeout") not in states
+    assert ("deadline", "idle") not in states
@@ -0,0 +1,56 @@
+"""Snapshot store tests"""
+import json
+
+from op_tracker.utils.snapshots import SnapshotStore
+
+
+def objects(store: SnapshotStore) -> list:
+    return sorted(path.name for path in (store.root / "objects").glob("*/*"))
+
+
+def test_index_paths_are_relative(tmp_path):
+    store = SnapshotStore(tmp_path / ".snapshots", base=tmp_path)
+    (tmp_path / "data").mkdir()
+    file = tmp_path / "data" / "cn.yml"
+    file.write_text("- OnePlus 9\n")
+    digest = store.snapshot(file)
+    assert list(store.index) == ["data/cn.yml"]
+    assert store.state("data/cn.yml")["sha256"] == digest
+    # an index keyed by absolute paths is read with relative ones
+    (store.root / SnapshotStore.INDEX).write_text(
+        json.dumps({str(file): store.index["data/cn.yml"]})
+    )
+    store = SnapshotStore(tmp_path / ".snapshots", base=tmp_path)
+    assert list(store.index) == ["data/cn.yml"]
+    assert not store.changed(file)
+
+
+def test_replaced_objects_are_removed(tmp_path):
+    store = SnapshotStore(tmp_path / ".snapshots", base=tmp_path)
+    first, second = tmp_path / "first.yml", tmp_path / "second.yml"
+    first.write_text("- OnePlus 9\n")
+    second.write_text("- OnePlus 9\n")
+    store.snapshot_all([first, second])
+    assert len(objects(store)) == 1
+    # the object is still referenced by the second file
+    first.write_text("- OnePlus 10\n")
+    store.snapshot(first)
+    assert len(objects(store)) == 2
+    second.write_text("- OnePlus 10\n")
+    store.snapshot(second)
+    assert objects(store) == [store.index["first.yml"]["sha256"][2:]]
+    assert store.load(first) == ["OnePlus 10"]
+
+
+def test_gc(tmp_path):
+    store = SnapshotStore(tmp_path / ".snapshots", base=tmp_path)
+    file = tmp_path / "latest.yml"
+    file.write_text("- OnePlus 9\n")
+    store.snapshot(file)
+    stray = store.root / "objects" / "ab" / "cdef"
+    stray.parent.mkdir(parents=True, exist_ok=True)
+    stray.write_text("stray")
+    (stray.parent / ".cdef.tmp").write_text("interrupted")
+    assert store.gc() == 1
+    assert objects(store) == [store.index["latest.yml"]["sha256"][2:]]
+    assert list(stray.parent.iterdir()) == []
@@ -0,0 +1,133 @@
+"""Telegram outbox sending tests, against a local fake Bot API server"""
+import asyncio
+from typing import List, Tuple
+
+import pytest
+from aiohttp import web
+
+from op_tracker.common.api_client.transport import close_transport
+from op_tracker.common.database import get_session
+from op_tracker.common.database.async_db import close_async_db
+from op_tracker.common.database.database import add_to_outbox, get_outbox
+from op_tracker.common.database.models.outbox_message import OutboxMessage
+from op_tracker.utils import telegram
+from op_tracker.utils.telegram import TelegramBot
+
+OK = (200, {"ok": True, "result": {}})
+RATE_LIMITED = (
+    429,
+    {
+        "ok": False,
+        "error_code": 429,
+        "description": "Too Many Requests",
+        "parameters": {"retry_after": 0},
+    },
+)
+RATE_LIMITED_LONG = (
+    429,
+    {
+        "ok": False,
+        "error_code": 429,
+        "description": "Too Many Requests: retry after 3600",
+        "parameters": {"retry_after": 3600},
+    },
+)
+UNAVAILABLE = (502, {"ok": False, "error_code": 502, "description": "Bad Gateway"})
+BAD_REQUEST = (400, {"ok": False, "error_code": 400, "description": "Bad Request"})
+
+
+class FakeBotAPI:
+    """A Bot API server that gives the queued responses, then successful ones"""
+
+    def __init__(self, responses: List[Tuple[int, dict]]):
+        self.responses = list(responses)
+        self.received: List[str] = []
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        self.received.append((await request.json())["text"])
+        status, body = self.responses.pop(0) if self.responses else OK
+        return web.json_response(body, status=status)
+
+    async def drain(self, chat: str, max_attempts: int = 3) -> int:
+        app = web.Application()
+        app.router.add_post("/botTOKEN/sendMessage", self.send_message)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        bot = TelegramBot(
+            "TOKEN",
+            chat,
+            "website",
+            api_url=f"http://127.0.0.1:{port}",
+            rate_limit=60000,
+            max_attempts=max_attempts,
+            max_retry_after=10,
+        )
+        try:
+            return await bot.drain()
+        finally:
+            close_async_db()
+            await close_transport()
+            await runner.cleanup()
+
+
+def stored(message: OutboxMessage) -> OutboxMessage:
+    """The message as saved by the bot, which sends its own copy of it"""
+    get_session().refresh(message)
+    return message
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(telegram.random, "uniform", lambda a, b: 0)
+
+
+def test_rate_limited_message_is_sent_after_waiting():
+    message = add_to_outbox("@rate_limited", "first", None)
+    api = FakeBotAPI([RATE_LIMITED, RATE_LIMITED, RATE_LIMITED, RATE_LIMITED])
+    assert asyncio.run(api.drain("rate_limited", max_attempts=2)) == 1
+    assert api.received == ["first"] * 5
+    # waiting for the rate limit doesn't use the message attempts
+    assert stored(message).sent is not None
+    assert message.attempts == 1
+
+
+def test_long_rate_limit_leaves_messages_for_the_next_run():
+    first = add_to_outbox("@rate_limited_long", "first", None)
+    second = add_to_outbox("@rate_limited_long", "second", None)
+    api = FakeBotAPI([RATE_LIMITED_LONG])
+    assert asyncio.run(api.drain("rate_limited_long")) == 0
+    assert api.received == ["first"]
+    assert (stored(first).sent, first.attempts) == (None, 0)
+    assert get_outbox("@rate_limited_long") == [first, second]
+
+
+def test_unavailable_api_messages_are_left_for_the_next_run():
+    first = add_to_outbox("@unavailable", "first", None)
+    second = add_to_outbox("@unavailable", "second", None)
+    api = FakeBotAPI([UNAVAILABLE] * 3)
+    assert asyncio.run(api.drain("unavailable", max_attempts=3)) == 0
+    # the following messages aren't tried while the API is unavailable
+    assert api.received == ["first"] * 3
+    assert (stored(first).sent, first.failed, first.attempts) == (None, None, 3)
+    assert get_outbox("@unavailable") == [first, second]
+    # the next run has its own attempts
+    api = FakeBotAPI([UNAVAILABLE])
+    assert asyncio.run(api.drain("unavailable", max_attempts=3)) == 2
+    assert api.received == ["first", "first", "second"]
+    assert stored(first).attempts == 5
+    assert get_outbox("@unavailable") == []
+
+
+def test_rejected_message_is_given_up():
+    rejected = add_to_outbox("@rejected", "rejected", None)
+    following = add_to_outbox("@rejected", "following", None)
+    api = FakeBotAPI([BAD_REQUEST])
+    assert asyncio.run(api.drain("rejected")) == 1
+    assert api.received == ["rejected", "following"]
+    assert stored(rejected).failed is not None
+    assert rejected.error == "Bad Request"
+    assert stored(following).sent is not None
+    assert get_outbox("@rejected") == []
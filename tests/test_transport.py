@@ -0,0 +1,46 @@
+"""Shared HTTP transport tests, against a local server"""
+import asyncio
+
+from aiohttp import web
+
+from op_tracker.common.api_client.transport import Transport
+
+
+async def ok(_request: web.Request) -> web.Response:
+    return web.json_response({"ret": 1})
+
+
+def test_connections_are_reused():
+    async def run():
+        app = web.Application()
+        app.router.add_get("/", ok)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        transport = Transport(limit_per_host=2)
+        try:
+            session = transport.session
+            for _ in range(3):
+                async with transport.session.get(
+                    f"http://127.0.0.1:{port}/"
+                ) as response:
+                    assert await response.json() == {"ret": 1}
+            # all clients share the same session
+            assert transport.session is session
+        finally:
+            await transport.close()
+            await runner.cleanup()
+        return transport
+
+    transport = asyncio.run(run())
+    assert transport.stats.requests == 3
+    assert transport.stats.connections_created == 1
+    assert transport.stats.connections_reused == 2
+
+
+def test_transport_from_config():
+    transport = Transport.from_config({"limit": 10, "timeout": None})
+    assert transport.limit == 10
+    assert transport.timeout.total == 60
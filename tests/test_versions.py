@@ -0,0 +1,115 @@
+"""Version resolution and ordering tests"""
+from op_tracker.utils.versions import VersionResolver, parse_version
+
+REFERENCES = [
+    (
+        "OnePlus5TOxygen_43_OTA_054_all_2002242025_0c5a9d4f2e7b8a13.zip",
+        "Stable",
+        "OnePlus5TOxygen_43.J.54_GLO_054_2002242025",
+    ),
+    (
+        "OnePlus5TOxygen_43_OTA_067_all_2005130057_4e1b7c9a0d2f6e85.zip",
+        "Stable",
+        "OnePlus5TOxygen_43.J.67_GLO_067_2005130057",
+    ),
+    (
+        "OnePlus5Hydrogen_23_OTA_065_all_2012030353_e8c692aa5e0c45ca.zip",
+        "Stable",
+        "OnePlus5Hydrogen_23.H.65_065_2012030353",
+    ),
+]
+IRREGULAR = "OnePlus5TOxygen_43_OTA_069_all_2010292144_76910d123e3940e5.zip"
+
+
+def make_resolver() -> VersionResolver:
+    return VersionResolver(lambda: REFERENCES)
+
+
+def test_regular_file_name_version():
+    resolver = make_resolver()
+    assert (
+        resolver.resolve(
+            "OnePlus7ProOxygen_21.P.45_OTA_0450_all_2206171138_1f3a5c7e9b2d4f6a.zip",
+            "Stable",
+        )
+        == "OnePlus7ProOxygen_21.P.45_0450_2206171138"
+    )
+    # regular names don't need the references
+    assert resolver._references is None  # pylint: disable=protected-access
+
+
+def test_irregular_file_name_prefix_is_case_insensitive():
+    resolver = make_resolver()
+    # the reference is the first update of the device and branch
+    assert (
+        resolver.resolve(IRREGULAR, "Stable")
+        == "OnePlus5TOxygen_43.J.69_GLO_069_2002242025"
+    )
+    for prefix in ("ONEPLUS5TOXYGEN", "oneplus5toxygen"):
+        filename = IRREGULAR.replace("OnePlus5TOxygen", prefix)
+        assert resolver.resolve(filename, "Stable") == resolver.resolve(
+            IRREGULAR, "Stable"
+        )
+
+
+def test_irregular_file_name_references_are_per_branch():
+    resolver = make_resolver()
+    assert resolver.resolve(IRREGULAR, "Beta") == ""
+    resolver.remember(
+        "ONEPLUS5TOXYGEN_43_OTA_060_all_2001010000_9a8b7c6d5e4f3a2b.zip",
+        "Beta",
+        "OnePlus5TOxygen_43.T.60_GLO_060_2001010000",
+    )
+    assert (
+        resolver.resolve(IRREGULAR, "Beta")
+        == "OnePlus5TOxygen_43.T.69_GLO_069_2001010000"
+    )
+    # remembered versions don't replace a loaded reference
+    resolver.remember(
+        "oneplus5toxygen_43_OTA_061_all_2001020000_1b2c3d4e5f6a7b8c.zip",
+        "Stable",
+        "OnePlus5TOxygen_43.T.61_GLO_061_2001020000",
+    )
+    assert (
+        resolver.resolve(IRREGULAR, "Stable")
+        == "OnePlus5TOxygen_43.J.69_GLO_069_2002242025"
+    )
+
+
+def test_unknown_file_names_have_no_version():
+    resolver = make_resolver()
+    assert (
+        resolver.resolve(
+            "OnePlus6Oxygen_22_OTA_013_all_2106111111_0a1b2c3d4e5f6a7b.zip", "Stable"
+        )
+        == ""
+    )
+    assert resolver.resolve("update.zip", "Stable") == ""
+
+
+def test_versions_are_ordered_by_their_numbers():
+    versions = [
+        "OnePlus7ProOxygen_21.O.45_0450_2206171138",
+        "OnePlus7ProOxygen_21.E.40_0400_2205101010",
+        "OnePlus7ProOxygen_21.P.100_1000_2301010000",
+        "OnePlus7ProOxygen_21.P.45_0450_2206180000",
+        "OnePlus7ProHydrogen_21.H.30_0300_2204010101",
+        "OnePlus7ProOxygen_21.P.09_0090_2203010000",
+    ]
+    ordered = sorted(versions, key=parse_version)
+    assert ordered == [
+        "OnePlus7ProOxygen_21.P.09_0090_2203010000",
+        "OnePlus7ProHydrogen_21.H.30_0300_2204010101",
+        "OnePlus7ProOxygen_21.E.40_0400_2205101010",
+        "OnePlus7ProOxygen_21.O.45_0450_2206171138",
+        "OnePlus7ProOxygen_21.P.45_0450_2206180000",
+        "OnePlus7ProOxygen_21.P.100_1000_2301010000",
+    ]
+
+
+def test_version_parts_are_parsed():
+    key = parse_version("OnePlus8TOxygen_11.C.33_GLO_0330_2206090000")
+    assert (key.major, key.minor, key.build, key.timestamp) == (11, 33, 330, 2206090000)
+    assert (key.device, key.letter, key.variant) == ("OnePlus8TOxygen", "C", "GLO")
+    assert parse_version("OnePlus8TOxygen_11.C.33") is None
+    assert parse_version("") is None
@@ -0,0 +1,54 @@
+"""Batched updates writer tests"""
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from op_tracker.common.database import get_engine
+from op_tracker.common.database.models.changelog import Changelog
+from op_tracker.common.database.writer import UpdatesWriter
+
+
+def test_clashing_updates_are_skipped(make_update):
+    writer = UpdatesWriter(sessionmaker(bind=get_engine())())
+    first = make_update("a" * 32, "writer_test_1.zip")
+    writer.add(first)
+    assert writer.flush() == 1
+    assert writer.pop_skipped() == []
+    # a different checksum with an already stored file name isn't written
+    clash = make_update("b" * 32, "writer_test_1.zip")
+    new = make_update("c" * 32, "writer_test_2.zip")
+    writer.add_all([clash, new])
+    assert writer.flush() == 1
+    assert writer.pop_skipped() == [clash]
+    assert writer.pop_skipped() == []
+
+
+def test_skipped_updates_changelogs_are_not_written(make_update):
+    session = sessionmaker(bind=get_engine())()
+    writer = UpdatesWriter(session)
+    writer.add(make_update("e" * 32, "writer_test_3.zip"))
+    writer.flush()
+    clash = make_update("f" * 32, "writer_test_3.zip")
+    clash.changelog = "A changelog of a skipped update"
+    writer.add(clash)
+    assert writer.flush() == 0
+    assert session.get(Changelog, clash.changelog_entry.hash) is None
+
+
+def test_failed_write_is_rolled_back(make_update, monkeypatch):
+    writer = UpdatesWriter(sessionmaker(bind=get_engine())())
+    update = make_update("9" * 32, "writer_test_4.zip")
+    writer.add(update)
+
+    def fail(md5s):
+        raise OperationalError("SELECT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(writer, "_stored", fail)
+    with pytest.raises(OperationalError):
+        writer.flush()
+    monkeypatch.undo()
+    # the transaction is rolled back and the update is still pending
+    assert not writer.session.in_transaction()
+    assert len(writer) == 1
+    assert writer.flush() == 1
+    assert writer.pop_written() == [update]